@@ -0,0 +1,377 @@
+import threading
+import numpy as np
+
+class AnalyticsEngine:
+    """In-memory columnar (NumPy) copy of the sales tables with vectorized filter and group-by primitives"""
+
+    # Numeric columns kept in memory when the table has them (everything else stays in SQLite)
+    NUMERIC_COLUMNS = ["hora", "total_liquido", "total_bruto", "total_desconto", "total_custo", "total_requisicao",
+                       "tiket_medio", "entregas_req"]
+
+    # Query patterns computed here instead of in SQLite (see QueryExecutor.execute_pattern)
+    ROUTES = {
+        "vendas_por_mes": "_route_total_por_loja",
+        "vendas_por_dia": "_route_vendas_por_dia",
+        "vendas_por_hora_do_dia": "_route_vendas_por_hora_do_dia",
+        "vendas_por_dia_semana": "_route_vendas_por_dia_semana",
+        "vendas_fim_de_semana": "_route_vendas_fim_de_semana",
+        "correlacao_desconto_vendas": "_route_correlacao_desconto_vendas"
+    }
+
+    # Largest number of key combinations aggregated with bincount; above it groups are found by sorting
+    MAX_DENSE_GROUPS = 10_000_000
+
+    def __init__(self, db_connector, tables=("dados_diarios", "dados_mensais"), columns=None, chunksize=100_000):
+        """Initialize with a DatabaseConnector, the tables to load and optionally the numeric columns to keep"""
+        self.db_connector = db_connector
+        self.table_names = list(tables)
+        self.columns = columns or self.NUMERIC_COLUMNS
+        self.chunksize = chunksize
+        self.tables = {}
+        self.stores = []
+        self._store_codes = {}
+        self._data_version = None
+        self.lock = threading.Lock()
+
+    # ----- loading -----
+
+    @staticmethod
+    def _parse_dates(values):
+        """Parse ISO date texts to int64 days since 1970-01-01 (NULL or invalid -> NaT)"""
+        try:
+            dates = np.array(values, dtype="datetime64[s]")
+        except ValueError:
+            dates = np.array([AnalyticsEngine._parse_date(value) for value in values], dtype="datetime64[s]")
+        return dates.astype("datetime64[D]").astype(np.int64)
+
+    @staticmethod
+    def _parse_date(value):
+        """Parse one date text, or return NaT"""
+        try:
+            return np.datetime64(str(value)[:10], "s")
+        except ValueError:
+            return np.datetime64("NaT")
+
+    def _encode_stores(self, values):
+        """Dictionary-encode store names, extending the shared dictionary with new names"""
+        for value in set(values) - self._store_codes.keys():
+            self._store_codes[value] = len(self.stores)
+            self.stores.append(value)
+        return np.array([self._store_codes[value] for value in values], dtype=np.int32)
+
+    def _derive(self, days):
+        """Calendar columns of int64 days (-1 where the date is missing)"""
+        valid = days != np.iinfo(np.int64).min
+        dates = np.where(valid, days, 0).astype("datetime64[D]")
+        months = dates.astype("datetime64[M]")
+        derived = {
+            "ano": months.astype("datetime64[Y]").astype(np.int64) + 1970,
+            "mes": months.astype(np.int64) % 12 + 1,
+            "dia": (dates - months.astype("datetime64[D]")).astype(np.int64) + 1,
+            # 1970-01-01 was a Thursday; 0 = Sunday as in strftime('%w')
+            "dia_semana": (np.where(valid, days, 0) + 4) % 7
+        }
+        return {name: np.where(valid, values, -1).astype(np.int16) for name, values in derived.items()}
+
+    def _load_rows(self, cursor, table, watermark):
+        """Read the rows of a table with index > watermark into column arrays"""
+        available = {col["name"] for col in self.db_connector.get_table_schema(table)}
+        numeric = [col for col in self.columns if col in available]
+        select = ", ".join(f'"{col}"' for col in ["index", "data", "loja_nome"] + numeric)
+        cursor.execute(f'SELECT {select} FROM "{table}" WHERE "index" > ? ORDER BY "index"', (watermark,))
+
+        chunks = []
+        while True:
+            rows = cursor.fetchmany(self.chunksize)
+            if not rows:
+                break
+            values = list(zip(*rows))
+            chunk = {
+                "index": np.array(values[0], dtype=np.int64),
+                "dias": self._parse_dates(values[1]),
+                "loja_nome": self._encode_stores(values[2])
+            }
+            for i, col in enumerate(numeric, start=3):
+                # None becomes NaN
+                chunk[col] = np.array(values[i], dtype=np.float64)
+            chunk.update(self._derive(chunk["dias"]))
+            chunks.append(chunk)
+
+        if not chunks:
+            return None
+        return {name: np.concatenate([chunk[name] for chunk in chunks]) for name in chunks[0]}
+
+    def refresh(self, full=False):
+        """
+        Bring the in-memory columns up to date with SQLite
+
+        Nothing is read while the database file is unchanged. Otherwise only
+        rows whose "index" is above the loaded maximum are appended; when the
+        maximum drops or the row count does not add up (rows were deleted or
+        the table was rewritten) the table is reloaded. In-place updates are
+        not detected; use refresh(full=True) after them. Returns a dict with
+        the number of rows read per table.
+        """
+        with self.lock:
+            data_version = self.db_connector.get_data_version()
+            if not full and data_version is not None and data_version == self._data_version:
+                return {}
+
+            conn = self.db_connector.get_connection(read_only=True)
+            cursor = conn.cursor()
+            refreshed = {}
+            try:
+                for table in self.table_names:
+                    current, count = cursor.execute(f'SELECT MAX("index"), COUNT(*) FROM "{table}"').fetchone()
+                    loaded = self.tables.get(table)
+                    if loaded and not full and current is not None:
+                        watermark = int(loaded["index"][-1])
+                        if current == watermark and count == len(loaded["index"]):
+                            continue
+                        new_rows = cursor.execute(f'SELECT COUNT(*) FROM "{table}" WHERE "index" > ?', (watermark,)).fetchone()[0]
+                        if current > watermark and count == len(loaded["index"]) + new_rows:
+                            rows = self._load_rows(cursor, table, watermark)
+                            # Readers keep using the old dict until the new one is complete
+                            self.tables[table] = {name: np.concatenate([loaded[name], rows[name]]) for name in loaded}
+                            refreshed[table] = len(rows["index"])
+                            continue
+
+                    rows = self._load_rows(cursor, table, -2 ** 63)
+                    self.tables[table] = rows if rows is not None else {}
+                    refreshed[table] = 0 if rows is None else len(rows["index"])
+            finally:
+                cursor.close()
+            self._data_version = data_version
+            return refreshed
+
+    def on_ingest(self, table, inserted, updated):
+        """DatabaseConnector ingest hook: check for new rows on next use, reload a table whose rows changed"""
+        with self.lock:
+            if updated:
+                self.tables.pop(table, None)
+            self._data_version = None
+
+    def _table(self, table):
+        """Return the column arrays of a table, loading them on first use"""
+        if table not in self.tables:
+            self.refresh()
+        columns = self.tables.get(table)
+        if columns is None:
+            raise ValueError(f"Tabela não carregada no motor analítico: {table}")
+        return columns
+
+    # ----- primitives -----
+
+    @staticmethod
+    def _day(date_text):
+        """Days since 1970-01-01 of an ISO date text"""
+        return int(np.datetime64(str(date_text)[:10], "D").astype(np.int64))
+
+    def filter(self, table, start=None, end=None, loja=None, hora=None):
+        """
+        Boolean row mask for a half-open [start, end) date range, a store and/or
+        hour filter ("not_null" keeps rows with an hour); None means no filter
+        """
+        columns = self._table(table)
+        mask = np.ones(len(columns.get("index", ())), dtype=bool)
+        if start is not None:
+            mask &= columns["dias"] >= self._day(start)
+        if end is not None:
+            mask &= columns["dias"] < self._day(end)
+        if start is not None or end is not None:
+            mask &= columns["dias"] != np.iinfo(np.int64).min
+        if loja is not None:
+            code = self._store_codes.get(loja)
+            if code is None:
+                return np.zeros_like(mask)
+            mask &= columns["loja_nome"] == code
+        if hora == "not_null":
+            mask &= ~np.isnan(columns["hora"])
+        elif hora is not None:
+            mask &= columns["hora"] == hora
+        return mask
+
+    def _key(self, columns, name):
+        """Return the values of a group key column"""
+        if name == "data":
+            return columns["dias"]
+        if name == "fim_de_semana":
+            return np.isin(columns["dia_semana"], (0, 6)).astype(np.int8)
+        if name not in columns:
+            raise ValueError(f"Coluna desconhecida no motor analítico: {name}")
+        return columns[name]
+
+    def _label(self, name, values):
+        """Decode key values for the result frame"""
+        if name == "loja_nome":
+            return [self.stores[code] for code in values]
+        if name == "data":
+            return [None if day == np.iinfo(np.int64).min else f"{np.datetime64(int(day), 'D')}T00:00:00" for day in values]
+        # Integer keys come out as int64, like SQLite results
+        return values.astype(np.int64) if values.dtype.kind in "iu" else values
+
+    @staticmethod
+    def _codes(values):
+        """Return (codes 0..k-1, distinct values) of a key; NaN becomes the last value"""
+        if values.dtype.kind == "f":
+            missing = np.isnan(values)
+            finite = values[~missing]
+            if len(finite) and np.all(finite == np.round(finite)) and finite.max() - finite.min() < 1_000_000:
+                low = int(finite.min())
+                size = int(finite.max()) - low + 1
+                codes = np.where(missing, size, np.nan_to_num(values, nan=low) - low).astype(np.int64)
+                distinct = np.append(np.arange(low, low + size, dtype=np.float64), np.nan)
+                return codes, distinct
+        elif values.dtype.kind in "iu" and len(values) and int(values.max()) - int(values.min()) < 1_000_000:
+            low = int(values.min())
+            return values.astype(np.int64) - low, np.arange(low, int(values.max()) + 1, dtype=values.dtype)
+
+        distinct, codes = np.unique(values, return_inverse=True)
+        return codes.astype(np.int64), distinct
+
+    def _groups(self, columns, keys, mask):
+        """Return (group id per selected row, number of groups, key values per group)"""
+        codes, distincts = [], []
+        for name in keys:
+            code, distinct = self._codes(self._key(columns, name)[mask])
+            codes.append(code)
+            distincts.append(distinct)
+
+        sizes = [len(distinct) for distinct in distincts]
+        combined = np.zeros(int(mask.sum()), dtype=np.int64)
+        for code, size in zip(codes, sizes):
+            combined = combined * size + code
+
+        if np.prod(sizes, dtype=np.float64) <= self.MAX_DENSE_GROUPS:
+            present = np.flatnonzero(np.bincount(combined, minlength=int(np.prod(sizes))))
+            lookup = np.zeros(int(np.prod(sizes)), dtype=np.int64)
+            lookup[present] = np.arange(len(present))
+            group_ids = lookup[combined]
+        else:
+            present, group_ids = np.unique(combined, return_inverse=True)
+
+        positions = np.unravel_index(present, sizes) if keys else []
+        key_values = {name: distinct[position] for name, distinct, position in zip(keys, distincts, positions)}
+        return group_ids, len(present), key_values
+
+    def _aggregate(self, function, values, group_ids, n_groups):
+        """Apply one aggregate per group, skipping NULLs like SQL"""
+        if function == "count" and values is None:
+            return np.bincount(group_ids, minlength=n_groups)
+        valid = ~np.isnan(values) if values.dtype.kind == "f" else np.ones(len(values), dtype=bool)
+        counts = np.bincount(group_ids[valid], minlength=n_groups)
+        if function == "count":
+            return counts
+        if function == "nunique":
+            code, distinct = self._codes(values[valid])
+            pairs = np.unique(group_ids[valid] * len(distinct) + code)
+            return np.bincount(pairs // len(distinct), minlength=n_groups)
+        if function in ("sum", "mean"):
+            sums = np.bincount(group_ids[valid], weights=values[valid], minlength=n_groups)
+            with np.errstate(invalid="ignore", divide="ignore"):
+                result = sums if function == "sum" else sums / counts
+            return np.where(counts > 0, result, np.nan)
+        if function in ("min", "max"):
+            result = np.full(n_groups, np.nan)
+            (np.fmin if function == "min" else np.fmax).at(result, group_ids[valid], values[valid].astype(np.float64))
+            return result
+        raise ValueError(f"Agregação desconhecida: {function}")
+
+    def group_by(self, table, keys, aggregations, mask=None, order_by=None):
+        """
+        Group the (masked) rows of a table and aggregate them
+
+        keys are column names, including the derived ano/mes/dia/dia_semana,
+        data and fim_de_semana (1 on Saturday and Sunday). aggregations maps
+        result column -> (function, column) with function one of sum, mean,
+        count, nunique, min and max (column None counts rows). Returns a
+        pandas DataFrame sorted by the keys, or by order_by when given.
+        """
+        import pandas as pd
+
+        columns = self._table(table)
+        if mask is None:
+            mask = np.ones(len(columns.get("index", ())), dtype=bool)
+        group_ids, n_groups, key_values = self._groups(columns, list(keys), mask)
+
+        data = {name: self._label(name, values) for name, values in key_values.items()}
+        for result_name, (function, column) in aggregations.items():
+            values = None if column is None else self._key(columns, column)[mask]
+            data[result_name] = self._aggregate(function, values, group_ids, n_groups)
+
+        df = pd.DataFrame(data, columns=list(keys) + list(aggregations))
+        if order_by:
+            df = df.sort_values(order_by, kind="stable").reset_index(drop=True)
+        return df
+
+    @staticmethod
+    def correlation(x, y, group_ids, n_groups):
+        """Pearson correlation of x and y per group (rows where both are known), and the rows used"""
+        valid = ~(np.isnan(x) | np.isnan(y))
+        x, y, group_ids = x[valid], y[valid], group_ids[valid]
+        count = np.bincount(group_ids, minlength=n_groups).astype(np.float64)
+        sums = {name: np.bincount(group_ids, weights=values, minlength=n_groups)
+                for name, values in (("x", x), ("y", y), ("xx", x * x), ("yy", y * y), ("xy", x * y))}
+        with np.errstate(invalid="ignore", divide="ignore"):
+            covariance = count * sums["xy"] - sums["x"] * sums["y"]
+            spread = (count * sums["xx"] - sums["x"] ** 2) * (count * sums["yy"] - sums["y"] ** 2)
+            result = covariance / np.sqrt(spread)
+        return np.where(spread > 0, result, np.nan), count.astype(np.int64)
+
+    # ----- query patterns -----
+
+    def has_route(self, pattern_name):
+        """Check whether a query pattern can be computed by the engine"""
+        return pattern_name in self.ROUTES
+
+    def run_pattern(self, pattern_name, loja=None, **kwargs):
+        """Compute a query pattern (same columns and order as its SQL) from the in-memory columns"""
+        self.refresh()
+        df = getattr(self, self.ROUTES[pattern_name])(**kwargs)
+        if loja:
+            df = df[df["loja_nome"] == loja].reset_index(drop=True)
+        return df
+
+    def _route_total_por_loja(self, start, end, **kwargs):
+        """vendas_por_mes"""
+        mask = self.filter("dados_mensais", start=start, end=end)
+        return self.group_by("dados_mensais", ["loja_nome"], {"total": ("sum", "total_liquido")}, mask, order_by="loja_nome")
+
+    def _route_vendas_por_dia(self, start, end, **kwargs):
+        """vendas_por_dia (dados_mensais only has first-of-month rows)"""
+        mask = self.filter("dados_diarios", start=start, end=end)
+        return self.group_by("dados_diarios", ["loja_nome"], {"total": ("sum", "total_liquido")}, mask, order_by="loja_nome")
+
+    def _route_vendas_por_hora_do_dia(self, **kwargs):
+        """vendas_por_hora_do_dia"""
+        mask = self.filter("dados_diarios", hora="not_null")
+        return self.group_by("dados_diarios", ["loja_nome", "hora"], {"total": ("sum", "total_liquido")}, mask,
+                             order_by=["loja_nome", "hora"])
+
+    def _route_vendas_por_dia_semana(self, **kwargs):
+        """vendas_por_dia_semana"""
+        return self.group_by("dados_diarios", ["loja_nome", "dia_semana"], {"total": ("sum", "total_liquido")},
+                             order_by=["loja_nome", "dia_semana"])
+
+    def _route_vendas_fim_de_semana(self, **kwargs):
+        """vendas_fim_de_semana"""
+        df = self.group_by("dados_diarios", ["loja_nome", "fim_de_semana"], {
+            "total": ("sum", "total_liquido"),
+            "dias": ("nunique", "data")
+        })
+        df.insert(1, "periodo", np.where(df.pop("fim_de_semana") == 1, "fim de semana", "dia útil"))
+        df["total_liquido_medio"] = df["total"] / df["dias"]
+        return df.sort_values(["loja_nome", "periodo"], kind="stable").reset_index(drop=True)
+
+    def _route_correlacao_desconto_vendas(self, **kwargs):
+        """correlacao_desconto_vendas: daily discount (one value per day) against daily net sales"""
+        daily = self.group_by("dados_diarios", ["loja_nome", "data"], {
+            "desconto": ("max", "total_desconto"),
+            "vendas": ("sum", "total_liquido")
+        })
+        stores, group_ids = np.unique(daily["loja_nome"].to_numpy(dtype=object), return_inverse=True)
+        correlation, days = self.correlation(daily["desconto"].to_numpy(dtype=np.float64), daily["vendas"].to_numpy(dtype=np.float64),
+                                             group_ids, len(stores))
+
+        import pandas as pd
+        return pd.DataFrame({"loja_nome": stores, "correlacao": correlation, "dias": days})
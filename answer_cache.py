@@ -0,0 +1,132 @@
+import sqlite3
+import hashlib
+import json
+import re
+import threading
+import time
+import unicodedata
+
+class AnswerCache:
+    """Persistent SQLite cache for generated SQL and result explanations"""
+
+    def __init__(self, cache_path="cache_respostas.db", max_entries=1000, ttl=24 * 60 * 60):
+        """Initialize the cache with a size limit (per table) and a TTL in seconds"""
+        self.cache_path = cache_path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.stats = {
+            "sql_hits": 0,
+            "sql_misses": 0,
+            "explanation_hits": 0,
+            "explanation_misses": 0
+        }
+
+        self.conn = sqlite3.connect(self.cache_path, check_same_thread=False)
+        with self.lock:
+            for table in ("sql_cache", "explanation_cache"):
+                self.conn.execute(f"""
+                    CREATE TABLE IF NOT EXISTS {table} (
+                        key TEXT PRIMARY KEY,
+                        value TEXT NOT NULL,
+                        created_at REAL NOT NULL,
+                        accessed_at REAL NOT NULL
+                    )
+                """)
+                self.conn.execute(f"CREATE INDEX IF NOT EXISTS ix_{table}_accessed_at ON {table} (accessed_at)")
+            self.conn.commit()
+
+    @staticmethod
+    def normalize_question(question):
+        """Normalize a question so trivial rewordings share the same key"""
+        text = unicodedata.normalize("NFKD", question.lower())
+        text = "".join(c for c in text if not unicodedata.combining(c))
+        text = re.sub(r"[^\w\s]", " ", text)
+        return " ".join(text.split())
+
+    @staticmethod
+    def schema_fingerprint(db_info):
+        """Return a stable hash of the database schema information"""
+        payload = json.dumps(db_info, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _make_key(*parts):
+        """Build a cache key from its parts"""
+        return hashlib.sha256("\x1f".join(str(p) for p in parts).encode("utf-8")).hexdigest()
+
+    def _get(self, table, key):
+        """Return a cached value or None, honoring the TTL"""
+        now = time.time()
+        with self.lock:
+            row = self.conn.execute(f"SELECT value, created_at FROM {table} WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            value, created_at = row
+            if self.ttl is not None and now - created_at > self.ttl:
+                self.conn.execute(f"DELETE FROM {table} WHERE key = ?", (key,))
+                self.conn.commit()
+                return None
+            self.conn.execute(f"UPDATE {table} SET accessed_at = ? WHERE key = ?", (now, key))
+            self.conn.commit()
+            return value
+
+    def _set(self, table, key, value):
+        """Store a value and evict the least recently used entries over the limit"""
+        now = time.time()
+        with self.lock:
+            self.conn.execute(
+                f"INSERT OR REPLACE INTO {table} (key, value, created_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, value, now, now)
+            )
+            self.conn.execute(f"""
+                DELETE FROM {table} WHERE key IN (
+                    SELECT key FROM {table} ORDER BY accessed_at DESC LIMIT -1 OFFSET ?
+                )
+            """, (self.max_entries,))
+            self.conn.commit()
+
+    def get_sql(self, question, schema_fingerprint):
+        """Get the cached SQL for a question"""
+        value = self._get("sql_cache", self._make_key(self.normalize_question(question), schema_fingerprint))
+        with self.lock:
+            self.stats["sql_hits" if value is not None else "sql_misses"] += 1
+        return value
+
+    def set_sql(self, question, schema_fingerprint, sql_query):
+        """Cache the SQL generated for a question"""
+        self._set("sql_cache", self._make_key(self.normalize_question(question), schema_fingerprint), sql_query)
+
+    def get_explanation(self, question, sql_query, data_version, output_format="direct"):
+        """Get the cached explanation for a query result"""
+        key = self._make_key(self.normalize_question(question), " ".join(sql_query.split()), data_version, output_format)
+        value = self._get("explanation_cache", key)
+        with self.lock:
+            self.stats["explanation_hits" if value is not None else "explanation_misses"] += 1
+        return value
+
+    def set_explanation(self, question, sql_query, data_version, output_format, explanation):
+        """Cache the explanation generated for a query result"""
+        key = self._make_key(self.normalize_question(question), " ".join(sql_query.split()), data_version, output_format)
+        self._set("explanation_cache", key, explanation)
+
+    def get_stats(self):
+        """Return hit/miss counters and current cache sizes"""
+        with self.lock:
+            sizes = {
+                table: self.conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+                for table in ("sql_cache", "explanation_cache")
+            }
+            return {**self.stats, **sizes}
+
+    def clear(self):
+        """Remove every cached entry"""
+        with self.lock:
+            self.conn.execute("DELETE FROM sql_cache")
+            self.conn.execute("DELETE FROM explanation_cache")
+            self.conn.commit()
+
+    def close(self):
+        """Close the underlying cache database"""
+        with self.lock:
+            self.conn.close()
@@ -0,0 +1,353 @@
+import argparse
+import json
+import os
+import re
+import shutil
+import sqlite3
+import time
+import tracemalloc
+from analytics_engine import AnalyticsEngine
+from answer_cache import AnswerCache
+from claude_stub_server import ClaudeStubServer
+from claude_transport import ClaudeTransport
+from db_connector import DatabaseConnector
+from query_executor import QueryExecutor
+from question_generator import QuestionGenerator
+from rag_app import RAGSystem
+from rollups import RollupManager
+from sql_dataset import load_sql_dataset
+
+# Columns copied unchanged into the synthetic rows (dates, hours, ids)
+KEEP_COLUMNS = {"data", "hora", "hr_inicio", "hr_final", "empresa"}
+
+def generate_synthetic_db(source_path, target_path, scale):
+    """
+    Build a copy of the database with scale times the rows of every table
+
+    Copy 0 is the original data. Every further copy k gets a new "index",
+    new store names (_Alpha_ -> _Alpha3_) and its amounts multiplied by a
+    deterministic factor in [0.9, 1.1], so the date range stays the same
+    while the number of stores grows with the scale.
+    """
+    if os.path.exists(target_path):
+        os.remove(target_path)
+
+    conn = sqlite3.connect(target_path)
+    conn.execute("PRAGMA journal_mode = OFF")
+    conn.execute("PRAGMA synchronous = OFF")
+    conn.execute("ATTACH DATABASE ? AS src", (source_path,))
+
+    tables = conn.execute(
+        "SELECT name, sql FROM src.sqlite_master WHERE type = 'table' "
+        "AND name NOT LIKE 'sqlite_%' AND name NOT LIKE 'rollup_%' AND name != 'ingest_watermark'"
+    ).fetchall()
+    for table, create_sql in tables:
+        conn.execute(create_sql)
+        columns = [(row[1], (row[2] or "").upper()) for row in conn.execute(f'PRAGMA src.table_xinfo("{table}")') if row[6] == 0]
+        offset = (conn.execute(f'SELECT MAX("index") FROM src."{table}"').fetchone()[0] or 0) + 1
+        names = ", ".join(f'"{name}"' for name, _ in columns)
+
+        for k in range(scale):
+            factor = f'(1 + ((("index" * 7919 + {k} * 104729) % 2001) - 1000) / 10000.0)'
+            select = []
+            for name, col_type in columns:
+                if k == 0 or name in KEEP_COLUMNS:
+                    select.append(f'"{name}"')
+                elif name == "index":
+                    select.append(f'"index" + {k * offset}')
+                elif name == "loja_nome":
+                    select.append(f"CASE WHEN loja_nome IS NULL THEN NULL ELSE '_' || trim(loja_nome, '_') || '{k}_' END")
+                elif col_type == "REAL":
+                    select.append(f'"{name}" * {factor}')
+                elif col_type == "INTEGER":
+                    select.append(f'CAST(ROUND("{name}" * {factor}) AS INTEGER)')
+                else:
+                    select.append(f'"{name}"')
+            conn.execute(f'INSERT INTO main."{table}" ({names}) SELECT {", ".join(select)} FROM src."{table}"')
+        conn.commit()
+
+    # Indexes are created after loading, which is much faster than maintaining them per insert
+    copied = {table for table, _ in tables}
+    for (index_sql,) in conn.execute(
+        "SELECT sql FROM src.sqlite_master WHERE type = 'index' AND sql IS NOT NULL AND tbl_name IN ({})".format(
+            ", ".join("?" for _ in copied)), tuple(copied)
+    ).fetchall():
+        conn.execute(index_sql)
+    if conn.execute("SELECT 1 FROM src.sqlite_master WHERE name = 'sqlite_stat1'").fetchone():
+        conn.execute("ANALYZE")
+    conn.commit()
+    conn.execute("DETACH DATABASE src")
+    conn.close()
+
+
+class FakeClaude:
+    """Deterministic stand-in for Claude answers, used as the ClaudeStubServer responder"""
+
+    DEFAULT_SQL = "SELECT loja_nome, SUM(total_liquido) AS total FROM dados_mensais GROUP BY loja_nome"
+
+    def __init__(self, dataset):
+        """Initialize with the curated question/SQL pairs (their SQL answers the matching questions)"""
+        self.sql_by_question = {AnswerCache.normalize_question(entry["question"]): entry["sql"][0] for entry in dataset}
+
+    @staticmethod
+    def _text(content):
+        """Flatten a message or system field that may be a list of content blocks"""
+        if isinstance(content, list):
+            return "\n".join(block.get("text", "") for block in content if isinstance(block, dict))
+        return content or ""
+
+    def sql_for(self, question):
+        """SQL answer for a question"""
+        return self.sql_by_question.get(AnswerCache.normalize_question(question), self.DEFAULT_SQL)
+
+    def __call__(self, body):
+        system = self._text(body.get("system"))
+        prompt = "\n".join(self._text(message.get("content")) for message in body.get("messages", []))
+
+        if "assistente SQL" in system:
+            if "array JSON" in system:
+                questions = re.findall(r"^\s*\d+\.\s+(.+)$", prompt, re.MULTILINE)
+                return json.dumps([self.sql_for(question) for question in questions], ensure_ascii=False)
+            match = re.search(r'esta pergunta: "(.+?)"\s*$', prompt, re.MULTILINE)
+            return self.sql_for(match.group(1) if match else "")
+
+        count = len(re.findall(r'^\s*Pergunta \d+:', prompt, re.MULTILINE))
+        if count:
+            return json.dumps([f"Resposta simulada {i + 1}." for i in range(count)], ensure_ascii=False)
+        return "Resposta simulada para o benchmark."
+
+
+class Benchmark:
+    """Replay the curated SQL, the query patterns and the default questions against synthetic databases"""
+
+    def __init__(self, source_path="dados (2).db", workdir="benchmark_data", latency=0.05, repeat=3,
+                 memory=True, rollups=False, output_format="direct", timeout=30.0,
+                 requests_per_minute=None, analytics=False, migrate=False):
+        """
+        Initialize with the source database, where synthetic copies go and the fake Claude latency (seconds)
+
+        With migrate the SQL workloads are measured on the synthetic database
+        as generated and again on a copy migrated with optimize_storage()
+        (derived date columns and composite indexes); the rollup, analytics
+        and question workloads then use the migrated copy.
+        """
+        self.source_path = source_path
+        self.workdir = workdir
+        self.latency = latency
+        self.repeat = repeat
+        self.memory = memory
+        self.rollups = rollups
+        self.output_format = output_format
+        self.timeout = timeout
+        self.requests_per_minute = requests_per_minute
+        self.analytics = analytics
+        self.migrate = migrate
+        self.dataset = load_sql_dataset()
+        self.questions = QuestionGenerator({"tables": []}).get_default_questions() + [entry["question"] for entry in self.dataset]
+
+    def prepare(self, scale):
+        """Return the path of the synthetic database for a scale, generating it when missing"""
+        os.makedirs(self.workdir, exist_ok=True)
+        path = os.path.join(self.workdir, f"dados_{scale}x.db")
+        if not os.path.exists(path):
+            print(f"Gerando banco sintético {scale}x em {path}...")
+            start = time.perf_counter()
+            generate_synthetic_db(self.source_path, path, scale)
+            print(f"  pronto em {time.perf_counter() - start:.1f}s")
+        return path
+
+    def prepare_migrated(self, scale):
+        """Return (path, seconds spent migrating or None when reused) of the migrated copy for a scale"""
+        path = os.path.join(self.workdir, f"dados_{scale}x_migrado.db")
+        if os.path.exists(path):
+            return path, None
+        shutil.copyfile(self.prepare(scale), path)
+        start = time.perf_counter()
+        with DatabaseConnector(path) as db_connector:
+            db_connector.optimize_storage()
+        return path, round(time.perf_counter() - start, 3)
+
+    @staticmethod
+    def _summary(latencies, errors, wall):
+        """Throughput and latency percentiles of a workload"""
+        ordered = sorted(latencies)
+        pick = lambda q: ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))] * 1000 if ordered else None
+        return {
+            "count": len(latencies),
+            "errors": errors,
+            "wall_s": round(wall, 3),
+            "throughput_per_s": round(len(latencies) / wall, 2) if wall else None,
+            "p50_ms": pick(0.5),
+            "p95_ms": pick(0.95),
+            "p99_ms": pick(0.99),
+            "max_ms": pick(1.0)
+        }
+
+    def _measure(self, fn, items):
+        """Time fn over items repeat times; fn returns False (or raises) on error"""
+        latencies = []
+        errors = 0
+        start = time.perf_counter()
+        for _ in range(self.repeat):
+            for item in items:
+                item_start = time.perf_counter()
+                try:
+                    if fn(item) is False:
+                        errors += 1
+                except Exception:
+                    errors += 1
+                latencies.append(time.perf_counter() - item_start)
+        result = self._summary(latencies, errors, time.perf_counter() - start)
+
+        # Separate pass: tracemalloc slows everything down and would skew the timings
+        if self.memory:
+            tracemalloc.start()
+            try:
+                for item in items:
+                    try:
+                        fn(item)
+                    except Exception:
+                        pass
+                result["peak_memory_kb"] = round(tracemalloc.get_traced_memory()[1] / 1024, 1)
+            finally:
+                tracemalloc.stop()
+        return result
+
+    def run_sql_dataset(self, db_connector):
+        """Run every curated SQL statement directly (statements over the timeout count as errors)"""
+        statements = [sql for entry in self.dataset for sql in entry["sql"]]
+        return self._measure(lambda sql: db_connector.execute_query(sql, read_only=True, timeout=self.timeout) is not None, statements)
+
+    def run_query_patterns(self, query_executor):
+        """Run every query pattern (December 2024 where a date is needed)"""
+        params = {"year": 2024, "month": 12, "limit": 100}
+        def run(pattern):
+            if query_executor.uses_analytics(pattern):
+                return query_executor.execute_pattern(pattern, **params) is not None
+            query = query_executor.build_pattern_query(pattern, **params)
+            return query_executor.execute_sql(query, read_only=True, timeout=self.timeout) is not None
+        return self._measure(run, list(query_executor.query_patterns))
+
+    def run_questions(self, db_path, stub):
+        """Answer the default and curated questions end to end, with Claude replaced by the stub"""
+        rag = RAGSystem(api_key="benchmark", db_path=db_path, cache_path=None, schema_cache_path=None, examples_path=None)
+        rag.claude_client.api_url = stub.url
+        # The fake backend has no rate limit; keep the limiter out of the measured latencies unless asked for
+        rag.claude_client.transport = ClaudeTransport(requests_per_minute=self.requests_per_minute)
+
+        memory, self.memory = self.memory, False
+        try:
+            result = self._measure(lambda question: "error" not in rag.process_query(question, self.output_format), self.questions)
+        finally:
+            self.memory = memory
+        stats = rag.get_metrics_stats()
+        result["stages"] = {name.split(":", 1)[1]: values for name, values in stats["latencies"].items()
+                            if name.startswith("stage_duration_seconds:")}
+        result["counters"] = stats["counters"]
+        result["llm_requests"] = len(stub.requests)
+
+        if self.memory:
+            tracemalloc.start()
+            # Single-threaded pass, so the per-stage peaks (process-global counter) are meaningful
+            rag.metrics.track_memory = True
+            try:
+                rag.metrics.stage_memory.clear()
+                rag.metrics.memory_peak = 0
+                for question in self.questions:
+                    rag.process_query(question, self.output_format)
+                peak = max(rag.metrics.memory_peak, tracemalloc.get_traced_memory()[1])
+                result["peak_memory_kb"] = round(peak / 1024, 1)
+                for name, peak in rag.metrics.stage_memory.items():
+                    result["stages"].setdefault(name, {})["peak_memory_kb"] = round(peak / 1024, 1)
+            finally:
+                rag.metrics.track_memory = False
+                tracemalloc.stop()
+        rag.db_connector.disconnect()
+        return result
+
+    def run_scale(self, scale, stub):
+        """Run every workload against the synthetic database of one scale"""
+        db_path = self.prepare(scale)
+        db_connector = DatabaseConnector(db_path)
+        rows = db_connector.get_connection().execute("SELECT COUNT(*) FROM dados_diarios").fetchone()[0]
+        report = {"scale": scale, "dados_diarios_rows": rows, "workloads": {}}
+
+        report["workloads"]["sql_dataset"] = self.run_sql_dataset(db_connector)
+        query_executor = QueryExecutor(db_connector)
+        report["workloads"]["query_patterns"] = self.run_query_patterns(query_executor)
+        if self.migrate:
+            db_connector.disconnect()
+            db_path, report["migration_s"] = self.prepare_migrated(scale)
+            db_connector = DatabaseConnector(db_path)
+            report["workloads"]["sql_dataset_migrated"] = self.run_sql_dataset(db_connector)
+            report["workloads"]["query_patterns_migrated"] = self.run_query_patterns(QueryExecutor(db_connector))
+        if self.rollups:
+            start = time.perf_counter()
+            rollup_manager = RollupManager(db_connector)
+            rollup_manager.refresh()
+            report["rollup_build_s"] = round(time.perf_counter() - start, 3)
+            report["workloads"]["query_patterns_rollups"] = self.run_query_patterns(QueryExecutor(db_connector, rollup_manager))
+        if self.analytics:
+            start = time.perf_counter()
+            analytics_engine = AnalyticsEngine(db_connector)
+            analytics_engine.refresh()
+            report["analytics_load_s"] = round(time.perf_counter() - start, 3)
+            report["workloads"]["query_patterns_analytics"] = self.run_query_patterns(
+                QueryExecutor(db_connector, analytics_engine=analytics_engine))
+        db_connector.disconnect()
+
+        report["workloads"]["questions"] = self.run_questions(db_path, stub)
+        return report
+
+    def run(self, scales):
+        """Run the benchmark for each scale and return the reports"""
+        reports = []
+        with ClaudeStubServer(latency=self.latency, responder=FakeClaude(self.dataset)) as stub:
+            for scale in scales:
+                stub.requests.clear()
+                report = self.run_scale(scale, stub)
+                self.print_report(report)
+                reports.append(report)
+        return reports
+
+    @staticmethod
+    def print_report(report):
+        """Print a scale report as a table"""
+        fmt = lambda value: "-" if value is None else f"{value:.1f}"
+        print(f"\nEscala {report['scale']}x ({report['dados_diarios_rows']} linhas em dados_diarios)")
+        print(f"  {'carga':<24}{'n':>6}{'erros':>7}{'ops/s':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'pico KB':>11}")
+        for name, result in report["workloads"].items():
+            print(f"  {name:<24}{result['count']:>6}{result['errors']:>7}{fmt(result['throughput_per_s']):>9}"
+                  f"{fmt(result['p50_ms']):>10}{fmt(result['p95_ms']):>10}{fmt(result['p99_ms']):>10}"
+                  f"{fmt(result.get('peak_memory_kb')):>11}")
+        stages = report["workloads"].get("questions", {}).get("stages", {})
+        if stages:
+            print("  etapas de process_query:")
+            for name, values in stages.items():
+                print(f"    {name:<22}{values.get('count', 0):>6}{'':>16}{fmt(values.get('p50_ms')):>10}"
+                      f"{fmt(values.get('p95_ms')):>10}{fmt(values.get('p99_ms')):>10}{fmt(values.get('peak_memory_kb')):>11}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark do sistema RAG com dados sintéticos e Claude simulado")
+    parser.add_argument("--source", default="dados (2).db", help="banco de origem")
+    parser.add_argument("--scales", type=int, nargs="+", default=[1, 10, 100], help="multiplicadores do volume de dados (ex.: 10 100 1000)")
+    parser.add_argument("--workdir", default="benchmark_data", help="diretório dos bancos sintéticos")
+    parser.add_argument("--latency", type=float, default=0.05, help="latência simulada do Claude em segundos")
+    parser.add_argument("--repeat", type=int, default=3, help="repetições de cada carga")
+    parser.add_argument("--format", default="direct", help="formato de resposta usado nas perguntas")
+    parser.add_argument("--timeout", type=float, default=30.0, help="tempo limite de cada consulta SQL em segundos")
+    parser.add_argument("--rpm", type=int, default=None, help="limite de requisições por minuto ao Claude simulado (padrão: sem limite)")
+    parser.add_argument("--rollups", action="store_true", help="também mede os padrões usando as tabelas de rollup")
+    parser.add_argument("--analytics", action="store_true", help="também mede os padrões usando o motor analítico em memória")
+    parser.add_argument("--migrate", action="store_true", help="também mede o SQL no banco migrado (optimize_storage); rollups, motor analítico e perguntas usam o banco migrado")
+    parser.add_argument("--no-memory", action="store_true", help="não mede o pico de memória")
+    parser.add_argument("--output", default="resultados_benchmark.json", help="arquivo JSON com os resultados")
+    args = parser.parse_args()
+
+    benchmark = Benchmark(args.source, args.workdir, args.latency, args.repeat, not args.no_memory, args.rollups, args.format,
+                          args.timeout, args.rpm, args.analytics, args.migrate)
+    reports = benchmark.run(args.scales)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(reports, f, indent=2, ensure_ascii=False)
+    print(f"\nResultados salvos em {args.output}")
@@ -1,25 +1,86 @@
 import os
 import requests
 import json
+import threading
 import time
+from claude_transport import ClaudeTransport
+from result_summarizer import ResultSummarizer
 
 class ClaudeClient:
-    def __init__(self, api_key=None):
-        """Initialize Claude API client"""
+    # Shortest prefix the API caches (Sonnet/Opus; Haiku needs 2048); shorter prefixes are sent unmarked
+    MIN_CACHE_TOKENS = 1024
+    # Rough characters per token for the Portuguese prompts, used to estimate a prefix's size
+    CHARS_PER_TOKEN = 4
+    
+    def __init__(self, api_key=None, api_url=None, transport=None, usage_callback=None, prompt_caching=True):
+        """Initialize Claude API client (prompt_caching marks the static system/schema prefix with cache_control)"""
         self.api_key = api_key or os.environ.get("CLAUDE_API_KEY")
         if not self.api_key:
             raise ValueError("A chave da API Claude é necessária. Configure-a como variável de ambiente CLAUDE_API_KEY ou passe-a como parâmetro api_key.")
         
-        self.api_url = "https://api.anthropic.com/v1/messages"
+        self.api_url = api_url or os.environ.get("CLAUDE_API_URL", "https://api.anthropic.com/v1/messages")
         
-    def generate_response(self, prompt, system_prompt=None, model="claude-3-5-sonnet-20240620", max_tokens=1000, temperature=0.7):
-        """Generate a response from Claude"""
-        headers = {
+        # Shared pooled transport (keep-alive, timeouts, retries, rate limiting)
+        self.transport = transport or ClaudeTransport()
+        
+        # Called with the "usage" dict of every response (token accounting)
+        self.usage_callback = usage_callback
+        
+        # Token totals, including prompt cache reads and writes
+        self.prompt_caching = prompt_caching
+        self.usage_lock = threading.Lock()
+        self.usage_totals = {"input_tokens": 0, "output_tokens": 0, "cache_creation_input_tokens": 0, "cache_read_input_tokens": 0}
+    
+    def _report_usage(self, usage):
+        """Add a response's token usage to the totals and pass it to the usage callback"""
+        if usage:
+            with self.usage_lock:
+                for key in self.usage_totals:
+                    if isinstance(usage.get(key), int):
+                        self.usage_totals[key] += usage[key]
+        if self.usage_callback and usage:
+            try:
+                self.usage_callback(usage)
+            except Exception as e:
+                print(f"Erro ao registrar uso de tokens: {e}")
+        
+    def _headers(self):
+        """Request headers for the Messages API"""
+        return {
             "x-api-key": self.api_key,
             "anthropic-version": "2023-06-01",
             "content-type": "application/json"
         }
+    
+    def get_usage_stats(self):
+        """Return token totals and the share of prompt input read from the provider cache"""
+        with self.usage_lock:
+            totals = dict(self.usage_totals)
+        prompt_tokens = totals["input_tokens"] + totals["cache_creation_input_tokens"] + totals["cache_read_input_tokens"]
+        totals["cache_read_ratio"] = totals["cache_read_input_tokens"] / prompt_tokens if prompt_tokens else 0.0
+        return totals
+    
+    def _system(self, *parts):
+        """
+        System prompt from static parts (instructions, schema)
         
+        With prompt caching the parts become text blocks and the last one is
+        marked with cache_control, so the whole prefix up to it is cached by the
+        API and only the variable user message is processed on later calls.
+        A prefix estimated below MIN_CACHE_TOKENS (e.g. the explanation
+        instructions without a schema) would not be cached, so it is sent as
+        plain text.
+        """
+        parts = [part for part in parts if part]
+        estimated_tokens = sum(len(part) for part in parts) / self.CHARS_PER_TOKEN
+        if not self.prompt_caching or estimated_tokens < self.MIN_CACHE_TOKENS:
+            return "\n\n".join(parts)
+        blocks = [{"type": "text", "text": part} for part in parts]
+        blocks[-1]["cache_control"] = {"type": "ephemeral"}
+        return blocks
+    
+    def _build_request(self, prompt, system_prompt, model, max_tokens, temperature):
+        """Build the Messages API request body"""
         data = {
             "model": model,
             "max_tokens": max_tokens,
@@ -31,15 +92,21 @@ class ClaudeClient:
         
         if system_prompt:
             data["system"] = system_prompt
+        return data
+    
+    def generate_response(self, prompt, system_prompt=None, model="claude-3-5-sonnet-20240620", max_tokens=1000, temperature=0.7):
+        """Generate a response from Claude"""
+        headers = self._headers()
+        data = self._build_request(prompt, system_prompt, model, max_tokens, temperature)
         
         try:
-            response = requests.post(self.api_url, headers=headers, json=data)
-            response.raise_for_status()
+            response = self.transport.post(self.api_url, headers=headers, json=data)
             result = response.json()
+            self._report_usage(result.get("usage"))
             return result["content"][0]["text"]
         except requests.exceptions.RequestException as e:
             print(f"Erro ao fazer requisição para a API Claude: {e}")
-            if hasattr(e, 'response') and e.response:
+            if getattr(e, 'response', None) is not None:
                 print(f"Código de status da resposta: {e.response.status_code}")
                 print(f"Corpo da resposta: {e.response.text}")
             return None
@@ -47,33 +114,262 @@ class ClaudeClient:
             print(f"Erro ao analisar resposta da API Claude: {e}")
             return None
             
-    def generate_sql(self, question, db_info):
-        """Generate SQL query for a given question"""
-        system_prompt = """
+    def stream_response(self, prompt, system_prompt=None, model="claude-3-5-sonnet-20240620", max_tokens=1000, temperature=0.7):
+        """
+        Generate a response from Claude using server-sent events, yielding text as it arrives
+        
+        Raises requests exceptions on transport failures and RuntimeError on an
+        error event in the stream.
+        """
+        data = self._build_request(prompt, system_prompt, model, max_tokens, temperature)
+        data["stream"] = True
+        
+        response = self.transport.post(self.api_url, headers=self._headers(), json=data, stream=True)
+        try:
+            event_type = None
+            for line in response.iter_lines(decode_unicode=True):
+                if not line:
+                    event_type = None
+                    continue
+                if line.startswith("event:"):
+                    event_type = line[len("event:"):].strip()
+                    continue
+                if not line.startswith("data:"):
+                    continue
+                
+                event = json.loads(line[len("data:"):].strip())
+                event_type = event.get("type", event_type)
+                if event_type == "message_start":
+                    self._report_usage(event.get("message", {}).get("usage"))
+                elif event_type == "message_delta":
+                    self._report_usage(event.get("usage"))
+                elif event_type == "content_block_delta":
+                    delta = event.get("delta", {})
+                    if delta.get("type") == "text_delta":
+                        yield delta.get("text", "")
+                elif event_type == "error":
+                    raise RuntimeError(f"Erro no streaming da API Claude: {event.get('error')}")
+                elif event_type == "message_stop":
+                    break
+        finally:
+            response.close()
+    
+    def generate_sql(self, question, db_info, examples=None):
+        """Generate SQL query for a given question (examples: similar solved questions, [{"question", "sql"}])"""
+        system_prompt, prompt = self._sql_prompt(question, db_info, examples)
+        return self.generate_response(prompt, system_prompt=system_prompt, temperature=0.1)
+    
+    def repair_sql(self, question, db_info, sql, error):
+        """Ask for a corrected query, showing the failed one and the exact error it raised"""
+        system_prompt, prompt = self._sql_prompt(question, db_info)
+        failed = " ".join(sql.split())
+        prompt += f"""
+        A consulta abaixo foi gerada para esta pergunta e falhou:
+        {failed}
+        
+        Erro retornado pelo SQLite: {error}
+        
+        Corrija a consulta usando apenas as tabelas e colunas do esquema. Retorne APENAS a consulta SQL corrigida.
+        """
+        return self.generate_response(prompt, system_prompt=system_prompt, temperature=0.1)
+    
+    def generate_sql_many(self, questions, db_info, use_batches_api=False, chunk_size=10, poll_interval=30, examples=None):
+        """
+        Generate SQL for several questions, returning one query (or None) per question
+        
+        examples, when given, holds one list of similar solved questions per
+        question; a grouped prompt shows the examples of all its questions.
+        
+        Questions are sent chunk_size at a time in a single prompt; a chunk whose
+        answer cannot be parsed falls back to one request per question. With
+        use_batches_api the per-question requests go through the Message Batches
+        API instead (cheaper, but answered asynchronously; meant for offline jobs).
+        """
+        if use_batches_api:
+            batch_requests = []
+            for i, question in enumerate(questions):
+                system_prompt, prompt = self._sql_prompt(question, db_info, examples[i] if examples else None)
+                batch_requests.append(self.batch_request(f"sql-{i}", prompt, system_prompt=system_prompt, temperature=0.1))
+            texts = self.run_message_batch(batch_requests, poll_interval=poll_interval)
+            return [texts.get(f"sql-{i}") for i in range(len(questions))]
+        
+        results = []
+        for start in range(0, len(questions), chunk_size):
+            chunk = questions[start:start + chunk_size]
+            chunk_examples = examples[start:start + chunk_size] if examples else [None] * len(chunk)
+            answers = [None] * len(chunk)
+            if len(chunk) > 1:
+                merged = {}
+                for question_examples in chunk_examples:
+                    for example in question_examples or []:
+                        merged.setdefault(example["question"], example)
+                system_prompt, prompt = self._sql_group_prompt(chunk, db_info, list(merged.values()))
+                response = self.generate_response(prompt, system_prompt=system_prompt, max_tokens=min(8000, 400 * len(chunk)), temperature=0.1)
+                answers = self._parse_json_list(response, len(chunk))
+            for question, answer, question_examples in zip(chunk, answers, chunk_examples):
+                results.append(answer if answer else self.generate_sql(question, db_info, question_examples))
+        return results
+    
+    def _schema_text(self, db_info):
+        """Schema description for prompts (accepts a prebuilt schema context)"""
+        if isinstance(db_info, str):
+            return db_info
+        return json.dumps(db_info, indent=2)
+    
+    def _schema_block(self, db_info):
+        """Schema part of the SQL system prompt"""
+        return f"Com base nas seguintes informações do banco de dados:\n\n{self._schema_text(db_info)}"
+    
+    @staticmethod
+    def _examples_text(examples):
+        """Few-shot block with solved questions and their SQL (empty without examples)"""
+        if not examples:
+            return ""
+        lines = ["Exemplos de perguntas e consultas SQL corretas para este banco de dados:"]
+        for example in examples:
+            lines.append(f"Pergunta: {example['question']}")
+            lines.append(f"SQL: {' '.join(example['sql'].split())}")
+        return "\n        ".join(lines)
+    
+    def _sql_prompt(self, question, db_info, examples=None):
+        """Build the system prompt and prompt used to generate SQL for a question"""
+        system_prompt = self._system("""
         Você é um assistente SQL prestativo. Sua tarefa é gerar uma consulta SQL válida para a pergunta fornecida,
         com base no esquema de banco de dados fornecido.
         
         A resposta deve conter APENAS a consulta SQL, sem explicações ou texto adicional.
+        """, self._schema_block(db_info))
+        
+        # Only the variable part (examples, question) goes in the message, after the cached prefix
+        prompt = f"""
+        {self._examples_text(examples)}
+        
+        Gere uma consulta SQL para responder a esta pergunta: "{question}"
+        
+        Retorne APENAS a consulta SQL, sem explicações ou texto adicional.
         """
         
-        # Prepare database schema info as a prompt
-        db_schema_str = json.dumps(db_info, indent=2)
+        return system_prompt, prompt
+    
+    def _sql_group_prompt(self, questions, db_info, examples=None):
+        """Build the prompts asking for one SQL query per question in a single response"""
+        system_prompt = self._system("""
+        Você é um assistente SQL prestativo. Sua tarefa é gerar uma consulta SQL válida para cada pergunta fornecida,
+        com base no esquema de banco de dados fornecido.
+        
+        A resposta deve conter APENAS um array JSON de strings, com uma consulta SQL por pergunta, na mesma ordem das perguntas.
+        """, self._schema_block(db_info))
         
+        numbered = "\n".join(f"{i + 1}. {question}" for i, question in enumerate(questions))
         prompt = f"""
-        Com base nas seguintes informações do banco de dados:
+        {self._examples_text(examples)}
         
-        {db_schema_str}
+        Gere uma consulta SQL para responder a cada uma destas {len(questions)} perguntas:
         
-        Gere uma consulta SQL para responder a esta pergunta: "{question}"
+        {numbered}
         
-        Retorne APENAS a consulta SQL, sem explicações ou texto adicional.
+        Retorne APENAS um array JSON com {len(questions)} strings, sem explicações ou texto adicional.
         """
         
-        return self.generate_response(prompt, system_prompt=system_prompt, temperature=0.1)
+        return system_prompt, prompt
+    
+    @staticmethod
+    def _parse_json_list(response, expected):
+        """Parse a JSON array of strings from a response; returns [None] * expected when it does not fit"""
+        if not response:
+            return [None] * expected
+        text = response.strip()
+        if "```json" in text:
+            text = text.split("```json")[1].split("```")[0].strip()
+        elif "```" in text:
+            text = text.split("```")[1].split("```")[0].strip()
+        try:
+            items = json.loads(text)
+        except ValueError:
+            return [None] * expected
+        if not isinstance(items, list) or len(items) != expected:
+            return [None] * expected
+        return [item if isinstance(item, str) and item.strip() else None for item in items]
     
     def explain_results(self, question, query_results, query, output_format="direct"):
         """Generate an explanation of the query results"""
-        system_prompt = """
+        system_prompt, prompt = self._explain_prompt(question, query_results, output_format)
+        return self.generate_response(prompt, system_prompt=system_prompt)
+    
+    def explain_results_many(self, items, output_format="direct", use_batches_api=False, chunk_size=10, poll_interval=30):
+        """
+        Explain several (question, query_results, query) items, returning one text (or None) per item
+        
+        Grouped like generate_sql_many: chunk_size items per prompt, falling back
+        to one request per item, or the Message Batches API with use_batches_api.
+        """
+        if use_batches_api:
+            batch_requests = []
+            for i, (question, query_results, query) in enumerate(items):
+                system_prompt, prompt = self._explain_prompt(question, query_results, output_format)
+                batch_requests.append(self.batch_request(f"explain-{i}", prompt, system_prompt=system_prompt))
+            texts = self.run_message_batch(batch_requests, poll_interval=poll_interval)
+            return [texts.get(f"explain-{i}") for i in range(len(items))]
+        
+        results = []
+        for start in range(0, len(items), chunk_size):
+            chunk = items[start:start + chunk_size]
+            answers = [None] * len(chunk)
+            if len(chunk) > 1:
+                system_prompt, prompt = self._explain_group_prompt(chunk, output_format)
+                response = self.generate_response(prompt, system_prompt=system_prompt, max_tokens=min(8000, 1000 * len(chunk)))
+                answers = self._parse_json_list(response, len(chunk))
+            for (question, query_results, query), answer in zip(chunk, answers):
+                results.append(answer if answer else self.explain_results(question, query_results, query, output_format))
+        return results
+    
+    def explain_results_stream(self, question, query_results, query, output_format="direct"):
+        """Stream an explanation of the query results, yielding text as it arrives"""
+        system_prompt, prompt = self._explain_prompt(question, query_results, output_format)
+        return self.stream_response(prompt, system_prompt=system_prompt)
+    
+    def _explain_prompt(self, question, query_results, output_format):
+        """Build the system prompt and prompt used to explain query results"""
+        prompt = f"""
+        Pergunta original: "{question}"
+        
+        Resultados da consulta:
+        ```
+        {self._results_text(query_results)}
+        ```
+        
+        {self._format_instruction(output_format)}
+        """
+        
+        return self._explain_system_prompt(), prompt
+    
+    def _explain_group_prompt(self, items, output_format):
+        """Build the prompts asking for the answer to several questions in a single response"""
+        sections = []
+        for i, (question, query_results, query) in enumerate(items):
+            sections.append(f"""
+        Pergunta {i + 1}: "{question}"
+        
+        Resultados da consulta {i + 1}:
+        ```
+        {self._results_text(query_results)}
+        ```
+        """)
+        
+        prompt = f"""
+        {"".join(sections)}
+        
+        {self._format_instruction(output_format)}
+        
+        Responda a cada uma das {len(items)} perguntas usando apenas os resultados correspondentes.
+        Retorne APENAS um array JSON com {len(items)} strings (uma resposta por pergunta, na mesma ordem).
+        """
+        
+        return self._explain_system_prompt(), prompt
+    
+    def _explain_system_prompt(self):
+        """System prompt used to explain query results"""
+        return self._system("""
         Você é um assistente analista de dados prestativo. Sua tarefa é fornecer APENAS as informações solicitadas
         com base nos resultados da consulta SQL, sem mostrar a consulta SQL ou dar explicações sobre como as informações
         foram obtidas.
@@ -83,18 +379,19 @@ class ClaudeClient:
         NÃO inclua introduções ou conclusões como "Aqui está o resultado" ou "Espero ter ajudado".
         
         A resposta deve ser direta, objetiva e conter APENAS as informações solicitadas pelo usuário.
-        """
-        
-        # Convert query results to string representation
+        """)
+    
+    def _results_text(self, query_results):
+        """Convert query results to a bounded string representation"""
         if isinstance(query_results, str):
-            results_str = query_results
-        else:
-            try:
-                results_str = query_results.to_string()
-            except:
-                results_str = str(query_results)
-        
-        # Adjust prompt based on output format
+            return query_results
+        try:
+            return ResultSummarizer.summarize(query_results)
+        except Exception:
+            return str(query_results)[:4000]
+    
+    def _format_instruction(self, output_format):
+        """Answer format instructions for an output format"""
         format_instruction = """
         IMPORTANTE: Sua resposta deve conter APENAS as informações solicitadas.
         Não inclua a consulta SQL ou explicações sobre como os dados foram obtidos.
@@ -110,16 +407,45 @@ class ClaudeClient:
             format_instruction += """
             Apresente os resultados em forma de marcadores (bullet points) curtos e diretos.
             """
-        
-        prompt = f"""
-        Pergunta original: "{question}"
-        
-        Resultados da consulta:
-        ```
-        {results_str}
-        ```
-        
-        {format_instruction}
+        return format_instruction
+    
+    def batch_request(self, custom_id, prompt, system_prompt=None, model="claude-3-5-sonnet-20240620", max_tokens=1000, temperature=0.7):
+        """Build one entry of a Message Batches request"""
+        return {"custom_id": custom_id, "params": self._build_request(prompt, system_prompt, model, max_tokens, temperature)}
+    
+    def run_message_batch(self, batch_requests, poll_interval=30, timeout=24 * 3600):
         """
+        Submit requests (see batch_request) to the Message Batches API and wait for them
         
-        return self.generate_response(prompt, system_prompt=system_prompt) 
\ No newline at end of file
+        Returns {custom_id: text}; requests that failed, expired or were not
+        answered are left out. Returns {} when the batch cannot be created or
+        does not finish within timeout seconds.
+        """
+        batches_url = self.api_url.rstrip("/") + "/batches"
+        try:
+            batch = self.transport.post(batches_url, headers=self._headers(), json={"requests": batch_requests}).json()
+            deadline = time.time() + timeout
+            while batch.get("processing_status") != "ended":
+                if time.time() >= deadline:
+                    print(f"Lote {batch.get('id')} não terminou dentro do tempo limite.")
+                    return {}
+                time.sleep(poll_interval)
+                batch = self.transport.get(f"{batches_url}/{batch['id']}", headers=self._headers()).json()
+            
+            response = self.transport.get(batch["results_url"], headers=self._headers())
+            texts = {}
+            for line in response.text.splitlines():
+                if not line.strip():
+                    continue
+                entry = json.loads(line)
+                result = entry.get("result", {})
+                if result.get("type") == "succeeded":
+                    self._report_usage(result["message"].get("usage"))
+                    texts[entry["custom_id"]] = result["message"]["content"][0]["text"]
+            return texts
+        except requests.exceptions.RequestException as e:
+            print(f"Erro ao usar a API de lotes do Claude: {e}")
+            return {}
+        except (KeyError, IndexError, ValueError) as e:
+            print(f"Erro ao analisar resposta da API de lotes do Claude: {e}")
+            return {}
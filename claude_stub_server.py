@@ -0,0 +1,218 @@
+import hashlib
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+class ClaudeStubServer:
+    """Local stand-in for the Claude Messages API, for tests and benchmarks"""
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0, fail_first=0, fail_status=429,
+                 retry_after=None, responder=None, stream_delay=0.0, cache_min_tokens=1024):
+        """
+        Initialize the stub; responder(request_json) returns the reply text
+
+        Prompt caching is simulated: the request prefix up to the last block
+        marked with cache_control (at least cache_min_tokens long, as in the API)
+        is reported as cache creation the first time and as a cache read after.
+        """
+        self.latency = latency
+        self.stream_delay = stream_delay
+        self.fail_first = fail_first
+        self.fail_status = fail_status
+        self.retry_after = retry_after
+        self.responder = responder or (lambda request: "SELECT 1")
+        self.cache_min_tokens = cache_min_tokens
+        self.cached_prefixes = set()
+        self.requests = []
+        self.batches = {}
+        self.lock = threading.Lock()
+
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # Headers and body go out in separate writes; without TCP_NODELAY each reply waits for a delayed ACK
+            disable_nagle_algorithm = True
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_POST(self):
+                length = int(self.headers.get("content-length", 0))
+                body = json.loads(self.rfile.read(length) or b"{}")
+                with stub.lock:
+                    stub.requests.append(body)
+                    failing = len(stub.requests) <= stub.fail_first
+
+                if stub.latency:
+                    time.sleep(stub.latency)
+
+                if failing:
+                    payload = json.dumps({"type": "error", "error": {"type": "rate_limit_error"}}).encode("utf-8")
+                    self.send_response(stub.fail_status)
+                    if stub.retry_after is not None:
+                        self.send_header("retry-after", str(stub.retry_after))
+                    self.send_header("content-type", "application/json")
+                    self.send_header("content-length", str(len(payload)))
+                    self.end_headers()
+                    self.wfile.write(payload)
+                    return
+
+                if self.path.rstrip("/").endswith("/batches"):
+                    self.create_batch(body)
+                    return
+                
+                text = stub.responder(body)
+                usage = dict(stub.prompt_usage(body), output_tokens=len(text) // 4)
+                if body.get("stream"):
+                    self.send_sse(body, text, usage)
+                    return
+                
+                payload = json.dumps({
+                    "id": f"msg_stub_{len(stub.requests)}",
+                    "type": "message",
+                    "role": "assistant",
+                    "model": body.get("model"),
+                    "content": [{"type": "text", "text": text}],
+                    "stop_reason": "end_turn",
+                    "usage": usage
+                }).encode("utf-8")
+                self.send_response(200)
+                self.send_header("content-type", "application/json")
+                self.send_header("content-length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def send_json(self, data, status=200):
+                """Reply with a JSON body"""
+                payload = json.dumps(data).encode("utf-8")
+                self.send_response(status)
+                self.send_header("content-type", "application/json")
+                self.send_header("content-length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def create_batch(self, body):
+                """Answer every request of a Message Batches job right away; it reports "ended" on the first poll"""
+                with stub.lock:
+                    batch_id = f"msgbatch_stub_{len(stub.batches)}"
+                results = []
+                for entry in body.get("requests", []):
+                    text = stub.responder(entry["params"])
+                    results.append({"custom_id": entry["custom_id"], "result": {"type": "succeeded", "message": {
+                        "type": "message", "role": "assistant", "content": [{"type": "text", "text": text}]
+                    }}})
+                with stub.lock:
+                    stub.batches[batch_id] = results
+                self.send_json({"id": batch_id, "type": "message_batch", "processing_status": "in_progress"})
+
+            def do_GET(self):
+                parts = self.path.rstrip("/").split("/")
+                batch_id = parts[-2] if parts[-1] == "results" else parts[-1]
+                with stub.lock:
+                    results = stub.batches.get(batch_id)
+                if results is None:
+                    self.send_json({"type": "error", "error": {"type": "not_found_error"}}, status=404)
+                elif parts[-1] == "results":
+                    payload = "\n".join(json.dumps(result) for result in results).encode("utf-8")
+                    self.send_response(200)
+                    self.send_header("content-type", "application/x-jsonl")
+                    self.send_header("content-length", str(len(payload)))
+                    self.end_headers()
+                    self.wfile.write(payload)
+                else:
+                    host, port = self.server.server_address[:2]
+                    self.send_json({
+                        "id": batch_id, "type": "message_batch", "processing_status": "ended",
+                        "results_url": f"http://{host}:{port}/v1/messages/batches/{batch_id}/results"
+                    })
+
+            def send_sse(self, body, text, usage):
+                """Reply with the Messages API server-sent event sequence, one word per delta"""
+                self.send_response(200)
+                self.send_header("content-type", "text/event-stream")
+                self.send_header("connection", "close")
+                self.end_headers()
+                self.close_connection = True
+
+                def emit(event_type, data):
+                    data = dict(data, type=event_type)
+                    self.wfile.write(f"event: {event_type}\ndata: {json.dumps(data)}\n\n".encode("utf-8"))
+                    self.wfile.flush()
+
+                emit("message_start", {"message": {
+                    "id": f"msg_stub_{len(stub.requests)}", "type": "message", "role": "assistant",
+                    "model": body.get("model"), "content": [],
+                    "usage": dict(usage, output_tokens=0)
+                }})
+                emit("content_block_start", {"index": 0, "content_block": {"type": "text", "text": ""}})
+                words = text.split(" ")
+                for i, word in enumerate(words):
+                    if stub.stream_delay:
+                        time.sleep(stub.stream_delay)
+                    emit("content_block_delta", {"index": 0, "delta": {
+                        "type": "text_delta", "text": word if i == len(words) - 1 else word + " "
+                    }})
+                emit("content_block_stop", {"index": 0})
+                emit("message_delta", {"delta": {"stop_reason": "end_turn"}, "usage": {"output_tokens": usage["output_tokens"]}})
+                emit("message_stop", {})
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.thread = None
+
+    def prompt_usage(self, body):
+        """Input token usage of a request (about 4 characters per token), split by prompt cache status"""
+        blocks = []
+        system = body.get("system")
+        blocks += system if isinstance(system, list) else [{"type": "text", "text": system or ""}]
+        for message in body.get("messages", []):
+            content = message.get("content")
+            blocks += content if isinstance(content, list) else [{"type": "text", "text": content or ""}]
+
+        cached = max([i + 1 for i, block in enumerate(blocks) if isinstance(block, dict) and block.get("cache_control")] or [0])
+        prefix = json.dumps(blocks[:cached], sort_keys=True)
+        total = len(json.dumps(blocks)) // 4
+        usage = {"input_tokens": total, "cache_creation_input_tokens": 0, "cache_read_input_tokens": 0}
+        if cached and len(prefix) // 4 >= self.cache_min_tokens:
+            key = hashlib.sha256((str(body.get("model")) + prefix).encode("utf-8")).hexdigest()
+            with self.lock:
+                hit = key in self.cached_prefixes
+                self.cached_prefixes.add(key)
+            usage["cache_read_input_tokens" if hit else "cache_creation_input_tokens"] = len(prefix) // 4
+            usage["input_tokens"] = max(0, total - len(prefix) // 4)
+        return usage
+
+    @property
+    def url(self):
+        """URL to use as ClaudeClient api_url"""
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/v1/messages"
+
+    def start(self):
+        """Start serving in a background thread"""
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        """Stop the server"""
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+
+if __name__ == "__main__":
+    with ClaudeStubServer(port=8765) as stub:
+        print(f"Servidor stub da API Claude em {stub.url}")
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,160 @@
+import random
+import threading
+import time
+from contextlib import contextmanager
+import requests
+from requests.adapters import HTTPAdapter
+
+class RateLimiter:
+    """Token bucket limiting how many requests are started per minute"""
+
+    def __init__(self, requests_per_minute=50):
+        """Initialize with the allowed number of requests per minute"""
+        self.rate = requests_per_minute / 60.0
+        self.capacity = max(1.0, float(requests_per_minute))
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Block until a request may be sent"""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class ClaudeTransport:
+    """Pooled, keep-alive HTTP transport with retries for the Claude API"""
+
+    # Status codes worth retrying (rate limit, overload and transient server errors)
+    RETRY_STATUS = {408, 429, 500, 502, 503, 504, 529}
+
+    def __init__(self, timeout=(5, 60), max_retries=4, backoff_base=1.0, backoff_max=30.0,
+                 max_concurrency=8, requests_per_minute=50, pool_size=None):
+        """Initialize the session, connection pool, limiter and retry policy"""
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+        pool_size = pool_size or max_concurrency
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        self.semaphore = threading.BoundedSemaphore(max_concurrency)
+        self.rate_limiter = RateLimiter(requests_per_minute) if requests_per_minute else None
+
+        self.stats = {"requests": 0, "retries": 0, "failures": 0}
+        self.stats_lock = threading.Lock()
+
+        # Per-thread deadline (time.monotonic()) set with deadline(); no attempt or backoff goes past it
+        self._local = threading.local()
+
+    def _count(self, name):
+        """Increment a transport counter"""
+        with self.stats_lock:
+            self.stats[name] += 1
+
+    @contextmanager
+    def deadline(self, deadline):
+        """Bound the requests this thread sends inside the block by a time.monotonic() deadline (None: no bound)"""
+        previous = getattr(self._local, "deadline", None)
+        self._local.deadline = deadline
+        try:
+            yield
+        finally:
+            self._local.deadline = previous
+
+    def _remaining(self):
+        """Seconds left before this thread's deadline, or None without one"""
+        deadline = getattr(self._local, "deadline", None)
+        return None if deadline is None else deadline - time.monotonic()
+
+    def _timeout(self, remaining):
+        """The (connect, read) timeout, capped by the time left"""
+        if remaining is None:
+            return self.timeout
+        if isinstance(self.timeout, tuple):
+            return tuple(min(value, remaining) for value in self.timeout)
+        return min(self.timeout, remaining) if self.timeout else remaining
+
+    def _backoff(self, attempt, response=None):
+        """Return how long to wait before the next attempt"""
+        if response is not None:
+            retry_after = response.headers.get("retry-after")
+            if retry_after:
+                try:
+                    return min(float(retry_after), self.backoff_max)
+                except ValueError:
+                    pass
+        # Full jitter exponential backoff
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def post(self, url, headers=None, json=None, stream=False):
+        """POST with pooling, rate limiting and retries; raises on final failure"""
+        return self.request("POST", url, headers=headers, json=json, stream=stream)
+
+    def get(self, url, headers=None, stream=False):
+        """GET with pooling, rate limiting and retries; raises on final failure"""
+        return self.request("GET", url, headers=headers, stream=stream)
+
+    def request(self, method, url, headers=None, json=None, stream=False):
+        """Send a request with pooling, rate limiting and retries; raises on final failure"""
+        attempt = 0
+        while True:
+            if self.rate_limiter:
+                self.rate_limiter.acquire()
+
+            remaining = self._remaining()
+            if remaining is not None and remaining <= 0:
+                self._count("failures")
+                raise requests.exceptions.Timeout("Prazo da requisição esgotado")
+
+            response = None
+            error = None
+            with self.semaphore:
+                self._count("requests")
+                try:
+                    response = self.session.request(method, url, headers=headers, json=json,
+                                                    timeout=self._timeout(remaining), stream=stream)
+                except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                    error = e
+
+            if error is None and response.status_code not in self.RETRY_STATUS:
+                if response.status_code >= 400:
+                    self._count("failures")
+                    response.raise_for_status()
+                return response
+
+            delay = self._backoff(attempt, response)
+            remaining = self._remaining()
+            # A retry that would start after the deadline is not worth the wait
+            if attempt >= self.max_retries or (remaining is not None and delay >= remaining):
+                self._count("failures")
+                if error is not None:
+                    raise error
+                response.raise_for_status()
+
+            self._count("retries")
+            if response is not None:
+                response.close()
+            time.sleep(delay)
+            attempt += 1
+
+    def get_stats(self):
+        """Return request, retry and failure counters"""
+        with self.stats_lock:
+            return dict(self.stats)
+
+    def close(self):
+        """Close pooled connections"""
+        self.session.close()
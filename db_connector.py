@@ -1,34 +1,233 @@
+import os
 import sqlite3
-import pandas as pd
+import threading
+import time
+from contextlib import contextmanager
 
 class DatabaseConnector:
-    def __init__(self, db_path="dados (2).db"):
+    # Derived date columns generated from the ISO "data" text (see optimize_storage)
+    DATE_COLUMNS = {
+        "ano": "CAST(substr(data, 1, 4) AS INTEGER)",
+        "mes": "CAST(substr(data, 6, 2) AS INTEGER)",
+        "dia": "CAST(substr(data, 9, 2) AS INTEGER)",
+        "dia_semana": "CAST(strftime('%w', data) AS INTEGER)"
+    }
+    
+    # Pragmas applied to every pooled connection
+    DEFAULT_PRAGMAS = {
+        "mmap_size": 256 * 1024 * 1024,
+        "cache_size": -64000,
+        "temp_store": "MEMORY",
+        "busy_timeout": 5000
+    }
+    
+    # Natural key of the sales rows, used by ingest() to upsert (a missing hora counts as -1)
+    INGEST_KEY = ("loja_nome", "data", "hora")
+    
+    def __init__(self, db_path="dados (2).db", wal=False, pragmas=None):
+        """
+        Initialize the connector
+        
+        With wal=True the first read-write connection switches the database
+        file to WAL journaling, which rewrites its header; otherwise the
+        journal mode is left as found (enable_wal() or migrate_db.py make
+        the switch an explicit step).
+        """
         self.db_path = db_path
-        self.conn = None
+        self.wal = wal
+        self.pragmas = dict(self.DEFAULT_PRAGMAS, **(pragmas or {}))
+        
+        # One connection per thread and mode; self.lock serializes writers and pool bookkeeping
+        self.lock = threading.RLock()
+        self._local = threading.local()
+        self._pool = []
+        self.stats = {"opened": 0, "closed": 0, "checkouts": 0, "queries": 0, "errors": 0}
+        
+        # Called as hook(table, inserted, updated) after ingest() commits changes
+        self.ingest_hooks = []
+    
+    @property
+    def conn(self):
+        """The calling thread's read-write connection, or None if not connected yet"""
+        return getattr(self._local, "rw", None)
+    
+    def _open(self, read_only):
+        """Open and configure a new connection"""
+        if read_only:
+            path = os.path.abspath(self.db_path).replace("?", "%3f").replace("#", "%23")
+            conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+        else:
+            conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            if self.wal:
+                conn.execute("PRAGMA journal_mode=WAL")
+            # Reading the mode does not touch the file; NORMAL is only safe (and only useful) under WAL
+            if conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal":
+                conn.execute("PRAGMA synchronous=NORMAL")
+        
+        for name, value in self.pragmas.items():
+            conn.execute(f"PRAGMA {name}={value}")
+        return conn
+    
+    def _prune(self):
+        """Close connections owned by threads that have exited (caller holds self.lock)"""
+        alive = []
+        for thread, mode, conn in self._pool:
+            if thread.is_alive():
+                alive.append((thread, mode, conn))
+            else:
+                conn.close()
+                self.stats["closed"] += 1
+        self._pool = alive
+    
+    def get_connection(self, read_only=False):
+        """Return the calling thread's connection, opening it on first use"""
+        mode = "ro" if read_only else "rw"
+        conn = getattr(self._local, mode, None)
+        if conn is None:
+            conn = self._open(read_only)
+            setattr(self._local, mode, conn)
+            with self.lock:
+                self._prune()
+                self._pool.append((threading.current_thread(), mode, conn))
+                self.stats["opened"] += 1
+        with self.lock:
+            self.stats["checkouts"] += 1
+        return conn
     
     def connect(self):
         """Connect to the SQLite database"""
-        self.conn = sqlite3.connect(self.db_path)
-        return self.conn
+        return self.get_connection()
     
     def disconnect(self):
-        """Disconnect from the SQLite database"""
-        if self.conn:
-            self.conn.close()
-            self.conn = None
+        """Disconnect from the SQLite database (closes every pooled connection)"""
+        with self.lock:
+            for _, _, conn in self._pool:
+                conn.close()
+                self.stats["closed"] += 1
+            self._pool = []
+            # Start a fresh thread-local so no thread keeps a closed connection
+            self._local = threading.local()
     
-    def execute_query(self, query):
-        """Execute a SQL query and return the results as a pandas DataFrame"""
-        if not self.conn:
-            self.connect()
+    def get_pool_stats(self):
+        """Return connection pool metrics"""
+        with self.lock:
+            stats = dict(self.stats)
+            stats["open"] = len(self._pool)
+            stats["open_read_only"] = sum(1 for _, mode, _ in self._pool if mode == "ro")
+        return stats
+    
+    @contextmanager
+    def _deadline(self, conn, timeout):
+        """Interrupt statements on conn that run longer than timeout seconds"""
+        if not timeout:
+            yield
+            return
         
+        deadline = time.monotonic() + timeout
+        conn.set_progress_handler(lambda: 1 if time.monotonic() > deadline else 0, 10000)
         try:
-            df = pd.read_sql_query(query, self.conn)
+            yield
+        finally:
+            conn.set_progress_handler(None, 0)
+    
+    def iter_query(self, query, chunksize=1000, read_only=False):
+        """Execute a SQL query and yield the results as DataFrame chunks"""
+        # pandas is imported on first use so that starting the app does not pay for it
+        import pandas as pd
+        
+        conn = self.get_connection(read_only)
+        cursor = conn.execute(query)
+        try:
+            columns = [description[0] for description in cursor.description or []]
+            empty = True
+            while True:
+                rows = cursor.fetchmany(chunksize)
+                if not rows:
+                    break
+                empty = False
+                yield pd.DataFrame.from_records(rows, columns=columns)
+            if empty:
+                yield pd.DataFrame(columns=columns)
+        finally:
+            cursor.close()
+    
+    def execute_query(self, query, read_only=False, max_rows=None, max_bytes=None, summarizer=None, chunksize=1000, timeout=None):
+        """
+        Execute a SQL query and return the results as a pandas DataFrame
+        
+        Without limits the whole result is materialized. With max_rows and/or
+        max_bytes (approximate, from the rows' text size) the result is streamed
+        with fetchmany: only rows within the budget are kept, the rest are just
+        counted. The frame's attrs then carry "row_count" and "truncated", and
+        "summary" when a ResultSummarizer is passed (it sees every row).
+        A timeout (seconds) interrupts the statement through a progress handler.
+        """
+        import pandas as pd
+        
+        conn = self.get_connection(read_only)
+        if max_rows is None and max_bytes is None and summarizer is None:
+            try:
+                with self._deadline(conn, timeout):
+                    df = pd.read_sql_query(query, conn)
+                with self.lock:
+                    self.stats["queries"] += 1
+                return df
+            except Exception as e:
+                with self.lock:
+                    self.stats["errors"] += 1
+                self._local.last_error = str(e)
+                print(f"Error executing query: {e}")
+                return None
+        
+        try:
+            kept = []
+            kept_rows = 0
+            kept_bytes = 0
+            row_count = 0
+            columns = None
+            with self._deadline(conn, timeout):
+                for chunk in self.iter_query(query, chunksize=chunksize, read_only=read_only):
+                    columns = list(chunk.columns)
+                    row_count += len(chunk)
+                    if summarizer is not None:
+                        summarizer.update(chunk)
+                    
+                    if (max_rows is not None and kept_rows >= max_rows) or (max_bytes is not None and kept_bytes >= max_bytes):
+                        continue
+                    if max_rows is not None:
+                        chunk = chunk.head(max_rows - kept_rows)
+                    if max_bytes is not None:
+                        sizes = chunk.astype(str).apply(lambda row: sum(len(value) for value in row), axis=1).cumsum()
+                        chunk = chunk[(sizes + kept_bytes <= max_bytes).to_numpy()]
+                        if len(chunk):
+                            kept_bytes += int(sizes.iloc[len(chunk) - 1])
+                        else:
+                            kept_bytes = max_bytes
+                    kept.append(chunk)
+                    kept_rows += len(chunk)
+            
+            if kept:
+                df = pd.concat(kept, ignore_index=True)
+            else:
+                df = pd.DataFrame(columns=columns or [])
+            df.attrs["row_count"] = row_count
+            df.attrs["truncated"] = row_count > len(df)
+            if summarizer is not None:
+                df.attrs["summary"] = summarizer
+            with self.lock:
+                self.stats["queries"] += 1
             return df
         except Exception as e:
+            with self.lock:
+                self.stats["errors"] += 1
+            self._local.last_error = str(e)
             print(f"Error executing query: {e}")
             return None
     
+    def last_error(self):
+        """Return the error of the calling thread's last failed execute_query (None if none failed yet)"""
+        return getattr(self._local, "last_error", None)
+    
     def get_tables(self):
         """Get list of tables in the database"""
         if not self.conn:
@@ -45,13 +244,16 @@ class DatabaseConnector:
         if not self.conn:
             self.connect()
         
-        query = f"PRAGMA table_info({table_name})"
+        # table_xinfo also lists generated columns (hidden = 2 or 3)
+        query = f"PRAGMA table_xinfo({table_name})"
         cursor = self.conn.cursor()
         cursor.execute(query)
         schema = cursor.fetchall()
         
         columns = []
         for col in schema:
+            if col[6] == 1:
+                continue
             columns.append({
                 "name": col[1],
                 "type": col[2]
@@ -67,6 +269,244 @@ class DatabaseConnector:
         query = f"SELECT * FROM {table_name} LIMIT {limit}"
         return self.execute_query(query)
     
+    def get_sample_rows(self, table_name, limit=5):
+        """Get sample rows from a table as a list of dicts (no pandas)"""
+        if not self.conn:
+            self.connect()
+        
+        cursor = self.conn.execute(f'SELECT * FROM "{table_name}" LIMIT {int(limit)}')
+        try:
+            columns = [description[0] for description in cursor.description]
+            return [dict(zip(columns, row)) for row in cursor.fetchall()]
+        finally:
+            cursor.close()
+    
+    def get_schema_version(self):
+        """Return PRAGMA schema_version (changes whenever a table, index or column is created or altered)"""
+        if not self.conn:
+            self.connect()
+        
+        return self.conn.execute("PRAGMA schema_version").fetchone()[0]
+    
+    def optimize_storage(self, tables=None):
+        """
+        Add derived date columns and composite indexes to the sales tables
+        
+        Adds virtual generated columns ano/mes/dia/dia_semana and indexes on
+        (loja_nome, data, hora), (data, loja_nome) and (ano, mes, loja_nome) so
+        that date-range and per-store filters become index seeks. Safe to run
+        more than once. Returns the list of statements executed.
+        """
+        if not self.conn:
+            self.connect()
+        
+        if tables is None:
+            tables = [
+                table for table in self.get_tables()
+                if {"data", "loja_nome"} <= {col["name"] for col in self.get_table_schema(table)}
+            ]
+        
+        executed = []
+        with self.lock:
+            cursor = self.conn.cursor()
+            for table in tables:
+                existing = {col["name"] for col in self.get_table_schema(table)}
+                statements = [
+                    f'ALTER TABLE "{table}" ADD COLUMN {name} INTEGER GENERATED ALWAYS AS ({expr}) VIRTUAL'
+                    for name, expr in self.DATE_COLUMNS.items() if name not in existing
+                ]
+                index_columns = {"loja_data_hora": "loja_nome, data"}
+                if "hora" in existing:
+                    index_columns["loja_data_hora"] += ", hora"
+                index_columns["data_loja"] = "data, loja_nome"
+                index_columns["ano_mes_loja"] = "ano, mes, loja_nome"
+                statements += [
+                    f'CREATE INDEX IF NOT EXISTS "ix_{table}_{suffix}" ON "{table}" ({columns})'
+                    for suffix, columns in index_columns.items()
+                ]
+                for statement in statements:
+                    cursor.execute(statement)
+                    executed.append(statement)
+            cursor.execute("ANALYZE")
+            self.conn.commit()
+        
+        return executed
+    
+    def enable_wal(self):
+        """
+        Switch the database file to WAL journaling (persistent, so later
+        connections inherit it), letting queries run during ingest().
+        Returns the resulting journal mode.
+        """
+        if not self.conn:
+            self.connect()
+        
+        with self.lock:
+            mode = self.conn.execute("PRAGMA journal_mode=WAL").fetchone()[0]
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.wal = True
+        return mode
+    
+    def add_ingest_hook(self, hook):
+        """Register hook(table, inserted, updated), called after ingest() commits new or changed rows"""
+        self.ingest_hooks.append(hook)
+    
+    def _insertable_columns(self, table):
+        """Stored columns of a table (generated columns cannot be written)"""
+        return [col[1] for col in self.conn.execute(f'PRAGMA table_xinfo("{table}")').fetchall() if col[6] == 0]
+    
+    def _ensure_ingest_tables(self, table, key):
+        """Create the watermark table and the unique index the upserts rely on"""
+        key_exprs = ", ".join(f'COALESCE("{col}", -1)' if col == "hora" else f'"{col}"' for col in key)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS ingest_watermark (
+                tabela TEXT PRIMARY KEY,
+                max_data TEXT,
+                max_index INTEGER,
+                linhas INTEGER NOT NULL DEFAULT 0,
+                atualizado_em TEXT NOT NULL
+            )
+        """)
+        index_name = f"ux_{table}_{'_'.join(key)}"
+        try:
+            self.conn.execute(f'CREATE UNIQUE INDEX IF NOT EXISTS "{index_name}" ON "{table}" ({key_exprs})')
+        except sqlite3.IntegrityError as e:
+            raise ValueError(f"A tabela {table} tem linhas repetidas para a chave {key}: {e}")
+        return key_exprs
+    
+    def ingest(self, table, rows, key=None, batch_size=5000):
+        """
+        Upsert new or corrected rows into a sales table
+        
+        rows is a list of dicts or a DataFrame with the table's columns.
+        Rows are matched on key (default INGEST_KEY) through a unique index:
+        new keys are inserted with "index" values above the current maximum,
+        existing keys are updated only when a value differs, so reloading the
+        same data is a no-op. Everything is written with executemany in
+        batches of batch_size inside one transaction, together with the
+        ingest_watermark row of the table; in WAL mode readers keep their
+        snapshot meanwhile. After the commit the ingest hooks are called.
+        Returns {"inserted", "updated", "unchanged", "max_data"}.
+        """
+        key = tuple(key or self.INGEST_KEY)
+        if hasattr(rows, "to_dict"):
+            rows = rows.astype(object).where(rows.notna(), None).to_dict("records")
+        
+        with self.lock:
+            if not self.conn:
+                self.connect()
+            columns = self._insertable_columns(table)
+            if not columns:
+                raise ValueError(f"Tabela desconhecida: {table}")
+            missing_key = [col for col in key if col not in columns]
+            if missing_key:
+                raise ValueError(f"A tabela {table} não tem as colunas da chave: {missing_key}")
+            
+            # The last row wins when the same key appears more than once; NULL keys never
+            # conflict in the unique index (hora is coalesced there), so they would duplicate rows
+            required = [col for col in key if col != "hora"]
+            latest = {}
+            for row in rows:
+                missing = [col for col in required if row.get(col) is None]
+                if missing:
+                    raise ValueError(f"Linha sem {', '.join(missing)}: {row}")
+                latest[tuple(row.get(col) for col in key)] = row
+            rows = list(latest.values())
+            
+            unknown = sorted({col for row in rows for col in row} - set(columns))
+            if unknown:
+                raise ValueError(f"Colunas desconhecidas em {table}: {unknown}")
+            data_columns = [col for col in columns if col != "index" and any(col in row for row in rows)]
+            data_columns += [col for col in key if col not in data_columns]
+            
+            key_exprs = self._ensure_ingest_tables(table, key)
+            updates = [col for col in data_columns if col not in key]
+            has_index = "index" in columns
+            insert_columns = (['"index"'] if has_index else []) + [f'"{col}"' for col in data_columns]
+            statement = (
+                f'INSERT INTO "{table}" ({", ".join(insert_columns)}) VALUES ({", ".join("?" * len(insert_columns))}) '
+                f'ON CONFLICT ({key_exprs}) '
+            )
+            if updates:
+                statement += (
+                    "DO UPDATE SET " + ", ".join(f'"{col}" = excluded."{col}"' for col in updates)
+                    + " WHERE " + " OR ".join(f'"{col}" IS NOT excluded."{col}"' for col in updates)
+                )
+            else:
+                statement += "DO NOTHING"
+            
+            conn = self.conn
+            if conn.in_transaction:
+                conn.commit()
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                base = conn.execute(f'SELECT MAX("index") FROM "{table}"').fetchone()[0] if has_index else None
+                base = -1 if base is None else base
+                changes_before = conn.total_changes
+                for start in range(0, len(rows), batch_size):
+                    batch = rows[start:start + batch_size]
+                    params = [
+                        ([base + 1 + start + i] if has_index else []) + [row.get(col) for col in data_columns]
+                        for i, row in enumerate(batch)
+                    ]
+                    conn.executemany(statement, params)
+                changes = conn.total_changes - changes_before
+                
+                # Updated rows keep their "index", so everything above the old maximum is new
+                if has_index:
+                    inserted, max_index = conn.execute(f'SELECT COUNT(*), MAX("index") FROM "{table}" WHERE "index" > ?', (base,)).fetchone()
+                else:
+                    inserted, max_index = changes, None
+                updated = changes - inserted
+                max_data = max((str(row["data"]) for row in rows if row.get("data") is not None), default=None)
+                if changes:
+                    conn.execute("""
+                        INSERT INTO ingest_watermark (tabela, max_data, max_index, linhas, atualizado_em)
+                        VALUES (?, ?, ?, ?, datetime('now'))
+                        ON CONFLICT (tabela) DO UPDATE SET
+                            max_data = CASE WHEN max_data IS NULL OR excluded.max_data > max_data THEN excluded.max_data ELSE max_data END,
+                            max_index = COALESCE(excluded.max_index, max_index),
+                            linhas = linhas + excluded.linhas,
+                            atualizado_em = excluded.atualizado_em
+                    """, (table, max_data, max_index, changes))
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+        
+        if changes:
+            for hook in list(self.ingest_hooks):
+                try:
+                    hook(table, inserted, updated)
+                except Exception as e:
+                    print(f"Erro em gancho de ingestão ({table}): {e}")
+        return {"inserted": inserted, "updated": updated, "unchanged": len(rows) - changes, "max_data": max_data}
+    
+    def get_ingest_watermark(self, table):
+        """Return the ingest_watermark row of a table as a dict, or None before the first ingest"""
+        if not self.conn:
+            self.connect()
+        
+        try:
+            cursor = self.conn.execute("SELECT * FROM ingest_watermark WHERE tabela = ?", (table,))
+        except sqlite3.OperationalError:
+            return None
+        row = cursor.fetchone()
+        return dict(zip([description[0] for description in cursor.description], row)) if row else None
+    
+    def get_data_version(self):
+        """Return a marker that changes whenever the database file (or its WAL) is modified"""
+        parts = []
+        for path in (self.db_path, self.db_path + "-wal"):
+            try:
+                stat = os.stat(path)
+            except OSError:
+                if path == self.db_path:
+                    return None
+                continue
+            parts.append(f"{stat.st_mtime_ns}-{stat.st_size}")
+        return "/".join(parts)
+    
     def __enter__(self):
         self.connect()
         return self
@@ -0,0 +1,92 @@
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+class EvaluationRunner:
+    """Run a batch of questions through the RAG pipeline with bounded concurrency"""
+
+    def __init__(self, process_fn, max_workers=4, timeout=120, progress_callback=None):
+        """
+        Initialize with process_fn(question, deadline) and the concurrency/timeout settings
+
+        deadline is the time.monotonic() value at which the question's timeout
+        expires (None without a timeout); process_fn must stop its own work
+        there (RAGSystem.process_query bounds its Claude requests and SQL
+        statements with it). A question still running past it is reported
+        as timed out, but a Python thread cannot be interrupted from outside.
+        """
+        self.process_fn = process_fn
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.progress_callback = progress_callback or self._print_progress
+
+    @staticmethod
+    def _print_progress(done, total, result, elapsed):
+        """Default progress reporter"""
+        status = "erro" if "error" in result else "ok"
+        print(f"[{done}/{total}] ({elapsed:.1f}s) {status}: {result.get('query')}")
+
+    @staticmethod
+    def to_serializable(result):
+        """Return a JSON-serializable copy of a pipeline result"""
+        import pandas as pd
+        
+        result = dict(result)
+        if isinstance(result.get("results"), pd.DataFrame):
+            result["results"] = result["results"].to_dict(orient="records")
+        return result
+
+    def run(self, questions, jsonl_path=None):
+        """Process all questions; results are returned in input order and streamed to jsonl_path"""
+        total = len(questions)
+        results = [None] * total
+        started_at = {}
+        lock = threading.Lock()
+        run_start = time.monotonic()
+        jsonl_file = open(jsonl_path, "w", encoding="utf-8") if jsonl_path else None
+
+        def task(index, question):
+            with lock:
+                started_at[index] = time.monotonic()
+            deadline = started_at[index] + self.timeout if self.timeout is not None else None
+            try:
+                return self.process_fn(question, deadline)
+            except Exception as e:
+                return {"query": question, "error": str(e)}
+
+        def record(index, result):
+            result = dict(result, index=index, elapsed=round(time.monotonic() - started_at.get(index, run_start), 3))
+            results[index] = result
+            if jsonl_file:
+                jsonl_file.write(json.dumps(self.to_serializable(result), ensure_ascii=False, default=str) + "\n")
+                jsonl_file.flush()
+            done = sum(1 for item in results if item is not None)
+            self.progress_callback(done, total, result, time.monotonic() - run_start)
+
+        executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        try:
+            pending = {executor.submit(task, i, q): i for i, q in enumerate(questions)}
+            while pending:
+                finished, _ = wait(pending, timeout=0.1, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    record(pending.pop(future), future.result())
+
+                # Report questions past the per-question timeout (process_fn was given the same deadline)
+                if self.timeout is not None:
+                    now = time.monotonic()
+                    with lock:
+                        expired = [f for f, i in pending.items() if i in started_at and now - started_at[i] > self.timeout]
+                    for future in expired:
+                        index = pending.pop(future)
+                        future.cancel()
+                        record(index, {
+                            "query": questions[index],
+                            "error": f"Tempo limite de {self.timeout}s excedido"
+                        })
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+            if jsonl_file:
+                jsonl_file.close()
+
+        return results
@@ -0,0 +1,189 @@
+import heapq
+import json
+import math
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import deque
+from sql_dataset import load_sql_dataset
+
+class ExampleIndex:
+    """BM25 index of question/SQL examples (SQL_dataset.txt plus verified history) for few-shot prompts"""
+
+    STOPWORDS = {"a", "o", "as", "os", "de", "da", "do", "das", "dos", "e", "em", "no", "na", "nos", "nas", "para",
+                 "por", "com", "que", "qual", "quais", "foi", "sao", "um", "uma", "se", "como", "esta", "ao", "aos",
+                 "me", "mostre", "liste", "quanto", "quantos", "quanta", "quantas", "ha", "houve", "teve", "tem"}
+
+    def __init__(self, path="exemplos_sql.jsonl", dataset_path="SQL_dataset.txt", max_history=5000, k1=1.5, b=0.75):
+        """Initialize with the history file (JSON lines, None keeps history in memory only) and the curated pairs"""
+        self.path = path
+        self.dataset_path = dataset_path
+        self.max_history = max_history
+        self.k1 = k1
+        self.b = b
+        self.lock = threading.Lock()
+        self._loaded = False
+        self.docs = []
+        self.keys = {}
+        self.postings = {}
+        self.total_length = 0
+        self.count = 0
+        self.history_lines = 0
+        self.history = deque()
+        self.history_count = 0
+
+    @staticmethod
+    def normalize_question(question):
+        """Lowercase, strip accents and punctuation (used to spot repeated questions)"""
+        text = unicodedata.normalize("NFKD", question.lower())
+        text = "".join(c for c in text if not unicodedata.combining(c))
+        return " ".join(re.sub(r"[^\w\s]", " ", text).split())
+
+    def tokens(self, text):
+        """Index terms of a text: normalized words without stopwords, plural "s" removed"""
+        terms = []
+        for word in self.normalize_question(text).split():
+            if word in self.STOPWORDS or len(word) < 2:
+                continue
+            if len(word) > 3 and word.endswith("s"):
+                word = word[:-1]
+            terms.append(word)
+        return terms
+
+    def _add_doc(self, question, sql, source, text=None):
+        """Index one example, replacing an earlier one for the same question (caller holds the lock)"""
+        key = self.normalize_question(question)
+        if key in self.keys:
+            self._remove_doc(self.keys[key])
+
+        terms = self.tokens(text or question)
+        doc_id = len(self.docs)
+        counts = {}
+        for term in terms:
+            counts[term] = counts.get(term, 0) + 1
+        for term, tf in counts.items():
+            self.postings.setdefault(term, {})[doc_id] = tf
+        self.docs.append({"question": question, "sql": sql, "source": source, "length": len(terms), "terms": list(counts)})
+        self.keys[key] = doc_id
+        self.total_length += len(terms)
+        self.count += 1
+
+        if source == "history":
+            self.history.append(doc_id)
+            self.history_count += 1
+            while self.history_count > self.max_history:
+                oldest = self.history.popleft()
+                if self.docs[oldest] is not None:
+                    self.keys.pop(self.normalize_question(self.docs[oldest]["question"]), None)
+                    self._remove_doc(oldest)
+
+    def _remove_doc(self, doc_id):
+        """Drop an example from the index (caller holds the lock)"""
+        doc = self.docs[doc_id]
+        if doc["source"] == "history":
+            self.history_count -= 1
+        for term in doc["terms"]:
+            self.postings[term].pop(doc_id, None)
+        self.total_length -= doc["length"]
+        self.count -= 1
+        self.docs[doc_id] = None
+
+    def _load(self):
+        """Index the curated pairs and the stored history (caller holds the lock)"""
+        self._loaded = True
+        try:
+            dataset = load_sql_dataset(self.dataset_path) if self.dataset_path else []
+        except OSError:
+            dataset = []
+        for entry in dataset:
+            self._add_doc(entry["question"], entry["sql"][0], "dataset", f"{entry['question']} {entry['hint']}")
+
+        history = {}
+        if self.path and os.path.exists(self.path):
+            with open(self.path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        item = json.loads(line)
+                        history[self.normalize_question(item["question"])] = item
+                    except (ValueError, KeyError, TypeError):
+                        continue
+                    self.history_lines += 1
+        # Oldest first, so later entries win and the most recent max_history are kept
+        items = sorted(history.values(), key=lambda item: item.get("ts", 0))[-self.max_history:]
+        for item in items:
+            self._add_doc(item["question"], item["sql"], "history")
+
+        # Repeated questions and dropped entries make the file grow; rewrite it when mostly stale
+        if self.history_lines > 2 * len(items) + 100:
+            self._rewrite(items)
+
+    def _rewrite(self, items):
+        """Rewrite the history file with the given entries (atomically)"""
+        tmp_path = f"{self.path}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                for item in items:
+                    f.write(json.dumps(item, ensure_ascii=False) + "\n")
+            os.replace(tmp_path, self.path)
+            self.history_lines = len(items)
+        except OSError as e:
+            print(f"Não foi possível reescrever o histórico de exemplos: {e}")
+
+    def add(self, question, sql):
+        """Add a question whose SQL ran successfully (persisted as one JSON line)"""
+        item = {"question": question, "sql": " ".join(sql.split()), "ts": time.time()}
+        with self.lock:
+            if not self._loaded:
+                self._load()
+            key = self.normalize_question(question)
+            current = self.keys.get(key)
+            if current is not None and self.docs[current]["sql"] == item["sql"]:
+                return
+            self._add_doc(question, item["sql"], "history")
+            if self.path:
+                try:
+                    with open(self.path, "a", encoding="utf-8") as f:
+                        f.write(json.dumps(item, ensure_ascii=False) + "\n")
+                    self.history_lines += 1
+                except OSError as e:
+                    print(f"Não foi possível salvar o exemplo: {e}")
+
+    def search(self, question, k=3):
+        """Return up to k examples most similar to a question: [{"question", "sql", "score", "source"}]"""
+        with self.lock:
+            if not self._loaded:
+                self._load()
+            if not self.count:
+                return []
+            average_length = self.total_length / self.count or 1.0
+            scores = {}
+            for term in set(self.tokens(question)):
+                postings = self.postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (self.count - len(postings) + 0.5) / (len(postings) + 0.5))
+                for doc_id, tf in postings.items():
+                    length = self.docs[doc_id]["length"]
+                    norm = tf * (self.k1 + 1) / (tf + self.k1 * (1 - self.b + self.b * length / average_length))
+                    scores[doc_id] = scores.get(doc_id, 0.0) + idf * norm
+            best = heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+            return [
+                {"question": self.docs[doc_id]["question"], "sql": self.docs[doc_id]["sql"],
+                 "score": round(score, 3), "source": self.docs[doc_id]["source"]}
+                for doc_id, score in best
+            ]
+
+    def get_stats(self):
+        """Return the number of indexed examples by source"""
+        with self.lock:
+            if not self._loaded:
+                self._load()
+            docs = [doc for doc in self.docs if doc is not None]
+            return {
+                "examples": len(docs),
+                "dataset": sum(1 for doc in docs if doc["source"] == "dataset"),
+                "history": sum(1 for doc in docs if doc["source"] == "history"),
+                "terms": sum(1 for postings in self.postings.values() if postings)
+            }
@@ -0,0 +1,24 @@
+import sys
+import pandas as pd
+from db_connector import DatabaseConnector
+from rollups import RollupManager
+
+# Upsert new or corrected rows from a CSV file into a sales table
+if len(sys.argv) < 3:
+    print('Uso: python ingest_data.py <tabela> <arquivo.csv> ["dados (2).db"]')
+    sys.exit(1)
+
+table, csv_path = sys.argv[1], sys.argv[2]
+db_path = sys.argv[3] if len(sys.argv) > 3 else "dados (2).db"
+
+rows = pd.read_csv(csv_path)
+with DatabaseConnector(db_path) as db:
+    # Keep the rollup tables (if the database has them) in step with the load
+    if "rollup_watermark" in db.get_tables():
+        db.add_ingest_hook(RollupManager(db).on_ingest)
+    result = db.ingest(table, rows)
+    watermark = db.get_ingest_watermark(table)
+
+print(f"{result['inserted']} linhas inseridas, {result['updated']} atualizadas e {result['unchanged']} sem mudança em {table}.")
+if watermark:
+    print(f"Dados até {watermark['max_data']} (última carga em {watermark['atualizado_em']} UTC).")
@@ -0,0 +1,248 @@
+import math
+import re
+import threading
+import unicodedata
+from collections import Counter
+from sql_dataset import load_sql_dataset
+
+class IntentMatcher:
+    """Map recurring questions to QueryExecutor.query_patterns without calling the LLM"""
+
+    SALES_WORDS = ["venda", "vendeu", "lucro", "faturamento", "receita", "total liquido"]
+
+    # (pattern, keyword groups that must all match, required parameters), checked in order
+    RULES = [
+        ("vendas_por_dia", [SALES_WORDS, ["loja"]], ["year", "month", "day"]),
+        ("max_vendas_por_hora", [["por hora", "horario", "hora"], ["mes"]], ["year", "month"]),
+        ("vendas_por_mes", [SALES_WORDS, ["loja"]], ["year"]),
+        ("metodos_pagamento", [["pagamento"]], []),
+        ("vendas_fim_de_semana", [["fim de semana", "finais de semana"], ["dias uteis", "dia util", "durante a semana"]], []),
+        ("correlacao_desconto_vendas", [["correla", "relacao"], ["desconto"], SALES_WORDS], []),
+        ("vendas_por_dia_semana", [["dia da semana", "dias da semana", "fim de semana", "finais de semana", "dias uteis"]], []),
+        ("horas_entrega", [["entrega"], ["hora", "horario"]], []),
+        ("evolucao_ticket", [["ticket", "tiket"], ["evolu"]], []),
+        ("vendas_por_hora_do_dia", [SALES_WORDS, ["hora do dia", "horario", "horarios", "por hora"]], []),
+        ("vendas_mensais", [["liste", "listar"], ["valores das vendas"]], [])
+    ]
+
+    # Patterns that take a date range; the others cannot honor a date in the question
+    DATE_PATTERNS = {"vendas_por_mes", "vendas_por_dia", "max_vendas_por_hora"}
+
+    # Words (matched at the start of a word) that change the meaning of an otherwise matching
+    # question: aggregates and comparisons, rankings and row limits, and counts
+    DISQUALIFIERS = ["media", "medio", "compar", "crescimento", "porcentage", "percentu", "proporcao", "relacao",
+                     "correla", "versus", "margem", "custo", "desconto", "primeira metade", "segunda metade",
+                     "maior", "menor", "mais", "menos", "melhor", "pior", "top", "ranking", "primeiros", "primeiras",
+                     "ultimos", "ultimas", "limite", "quant", "numero de", "contage"]
+
+    # Disqualifiers a pattern already answers (a weekend/weekday comparison is what vendas_fim_de_semana returns)
+    RULE_EXCEPTIONS = {
+        "max_vendas_por_hora": ["maior", "mais"],
+        "horas_entrega": ["maior", "mais"],
+        "vendas_fim_de_semana": ["media", "medio", "compar", "versus", "mais", "menos"],
+        "correlacao_desconto_vendas": ["correla", "relacao", "desconto"]
+    }
+
+    # Topic words a question may only contain when the matched pattern's keywords consume them
+    # (an hour or weekday in the question means a per-store total does not answer it)
+    CUES = ["hora", "horario", "dia da semana", "dias da semana", "fim de semana", "finais de semana", "dias uteis",
+            "dia util", "durante a semana", "pagamento", "entrega", "ticket", "tiket", "evolu", "desconto", "correla"]
+
+    # Periods the extracted year/month/day cannot represent (weekday phrases are removed first)
+    PERIOD_WORDS = ["trimestre", "semestre", "bimestre", "quinzena", "semana"]
+    WEEKDAY_PHRASES = ["dia da semana", "dias da semana", "fim de semana", "finais de semana", "durante a semana"]
+    # A date range only narrows to its first month; an exclusion would be read as the store itself
+    RANGE_WORDS = ["entre", "ate", "a partir", "desde"]
+    NEGATION_WORDS = ["exceto", "excluindo", "excluir", "sem", "fora", "salvo"]
+
+    STOPWORDS = {"a", "o", "as", "os", "de", "da", "do", "das", "dos", "e", "em", "no", "na", "nos", "nas",
+                 "para", "por", "com", "que", "qual", "quais", "foi", "sao", "e", "um", "uma", "se", "como", "esta"}
+
+    MONTHS = {
+        "janeiro": 1, "fevereiro": 2, "marco": 3, "abril": 4, "maio": 5, "junho": 6,
+        "julho": 7, "agosto": 8, "setembro": 9, "outubro": 10, "novembro": 11, "dezembro": 12
+    }
+
+    def __init__(self, query_executor, dataset_path="SQL_dataset.txt", similarity_threshold=0.7, default_limit=100):
+        """Initialize with a QueryExecutor and the curated question/SQL pairs"""
+        self.query_executor = query_executor
+        self.similarity_threshold = similarity_threshold
+        self.default_limit = default_limit
+        self.stores = None
+        self.stats = {"fast_path": 0, "llm": 0}
+        self.lock = threading.Lock()
+
+        # Label each curated pair with the pattern its SQL resembles most
+        self.examples = []
+        try:
+            dataset = load_sql_dataset(dataset_path)
+        except OSError:
+            dataset = []
+        for entry in dataset:
+            pattern, score = self._closest_pattern(entry["sql"][0])
+            if pattern and score >= 0.6:
+                self.examples.append((pattern, self._vector(entry["question"])))
+
+    @staticmethod
+    def _normalize(text):
+        """Lowercase, strip accents and punctuation"""
+        text = unicodedata.normalize("NFKD", text.lower())
+        text = "".join(c for c in text if not unicodedata.combining(c))
+        return " ".join(re.sub(r"[^\w\s/-]", " ", text).split())
+
+    def _vector(self, text):
+        """Bag-of-words vector of a question"""
+        return Counter(token for token in self._normalize(text).split() if token not in self.STOPWORDS)
+
+    @staticmethod
+    def _cosine(a, b):
+        """Cosine similarity of two bag-of-words vectors"""
+        dot = sum(count * b[token] for token, count in a.items())
+        norm = math.sqrt(sum(v * v for v in a.values())) * math.sqrt(sum(v * v for v in b.values()))
+        return dot / norm if norm else 0.0
+
+    @staticmethod
+    def _sql_tokens(sql):
+        """Identifier tokens of a statement, ignoring literals and short aliases"""
+        sql = re.sub(r"'[^']*'", " ", sql.lower())
+        return {token for token in re.findall(r"[a-z_]+", sql) if not re.fullmatch(r"[a-z]\d*", token)}
+
+    def _closest_pattern(self, sql):
+        """Return the query pattern whose template is most similar to sql (Jaccard)"""
+        tokens = self._sql_tokens(sql)
+        best, best_score = None, 0.0
+        for name, template in self.query_executor.query_patterns.items():
+            template_tokens = self._sql_tokens(re.sub(r"\{\w+\}", " ", template))
+            score = len(tokens & template_tokens) / len(tokens | template_tokens)
+            if score > best_score:
+                best, best_score = name, score
+        return best, best_score
+
+    def _get_stores(self):
+        """Return the store names known to the database"""
+        if self.stores is None:
+            try:
+                df = self.query_executor.execute_sql("SELECT DISTINCT loja_nome FROM dados_mensais WHERE loja_nome IS NOT NULL")
+                self.stores = [] if df is None else df["loja_nome"].tolist()
+            except Exception:
+                self.stores = []
+        return self.stores
+
+    def extract_params(self, question):
+        """Extract year, month, day and store from a question"""
+        text = self._normalize(question)
+        params = {}
+
+        date_parts = self.query_executor.extract_date_parts(text)
+        if date_parts:
+            params = {key: int(value) for key, value in date_parts.items()}
+        else:
+            month_names = "|".join(self.MONTHS)
+            day_match = re.search(rf"\b(?:dia\s+)?(\d{{1,2}}|primeiro)\s+de\s+({month_names})\b", text)
+            month_match = re.search(rf"\b({month_names})\b", text)
+            year_match = re.search(r"\b(20\d{2})\b", text)
+            if year_match:
+                params["year"] = int(year_match.group(1))
+            if month_match:
+                params["month"] = self.MONTHS[month_match.group(1)]
+            if day_match:
+                params["day"] = 1 if day_match.group(1) == "primeiro" else int(day_match.group(1))
+
+        for store in self._get_stores():
+            name = self._normalize(store.strip("_"))
+            if name and re.search(rf"\b{re.escape(name)}\b", text):
+                params["loja"] = store
+                break
+        return params
+
+    def _unsupported(self, question, text, params):
+        """
+        Return why a question cannot be answered from the extracted parameters
+        (period, several months/years, range, exclusion or unknown store), or None
+        """
+        plain = text
+        for phrase in self.WEEKDAY_PHRASES:
+            plain = plain.replace(phrase, " ")
+        if any(re.search(rf"\b{word}", plain) for word in self.PERIOD_WORDS):
+            return "periodo"
+
+        months = set(re.findall(rf"\b({'|'.join(self.MONTHS)})\b", text)) | set(re.findall(r"\b\d{4}[-/](\d{1,2})\b", text))
+        years = set(re.findall(r"\b(20\d{2})\b", text))
+        if len(months) > 1 or len(years) > 1:
+            return "varias datas"
+        if any(key in params for key in ("year", "month", "day")) and any(re.search(rf"\b{word}\b", text) for word in self.RANGE_WORDS):
+            return "intervalo"
+        if any(re.search(rf"\b{word}\b", text) for word in self.NEGATION_WORDS):
+            return "exclusao"
+
+        # "loja Gamma" / "Loja 1": a capitalized or numeric name after "loja" must be a known store
+        known = {self._normalize(store.strip("_")) for store in self._get_stores()}
+        for name in re.findall(r"\blojas?\s+(?:de\s+|do\s+|da\s+)?_?([A-Z0-9][\w]*)", question, re.IGNORECASE):
+            if (name[0].isupper() or name[0].isdigit()) and self._normalize(name.strip("_")) not in known:
+                return "loja desconhecida"
+        return None
+
+    def _has_group(self, text, group):
+        """Check whether any keyword of a group occurs in text"""
+        return any(keyword in text for keyword in group)
+
+    def _consumes_cues(self, text, groups):
+        """Check that every cue in text is part of a keyword of the pattern's groups"""
+        for keyword in sorted((keyword for group in groups for keyword in group), key=len, reverse=True):
+            text = text.replace(keyword, " ")
+        return not any(cue in text for cue in self.CUES)
+
+    def match(self, question):
+        """
+        Return {"pattern", "params", "confidence", "source"} when the question
+        confidently maps to a query pattern, otherwise None
+        """
+        text = self._normalize(question)
+        params = self.extract_params(question)
+        # Parameters that would silently answer a different question: leave it to the LLM
+        if self._unsupported(question, text, params):
+            return None
+        has_date = any(key in params for key in ("year", "month", "day"))
+        result = None
+
+        def usable(pattern, required):
+            if has_date and pattern not in self.DATE_PATTERNS:
+                return False
+            return all(key in params for key in required)
+
+        disqualifiers = [word for word in self.DISQUALIFIERS if re.search(rf"\b{re.escape(word)}", text)]
+        for pattern, groups, required in self.RULES:
+            if any(word not in self.RULE_EXCEPTIONS.get(pattern, []) for word in disqualifiers):
+                continue
+            if (all(self._has_group(text, group) for group in groups) and self._consumes_cues(text, groups)
+                    and usable(pattern, required)):
+                result = {"pattern": pattern, "confidence": 1.0, "source": "regra"}
+                break
+
+        if result is None and not disqualifiers and self.examples:
+            vector = self._vector(question)
+            score, pattern = max((self._cosine(vector, example), name) for name, example in self.examples)
+            rules = {name: (groups, req) for name, groups, req in self.RULES}
+            groups, required = rules.get(pattern, ([], []))
+            if score >= self.similarity_threshold and self._consumes_cues(text, groups) and usable(pattern, required):
+                result = {"pattern": pattern, "confidence": round(score, 3), "source": "similaridade"}
+
+        if result is not None:
+            if result["pattern"] == "evolucao_ticket":
+                params.setdefault("limit", self.default_limit)
+            # Only pass the date parts the pattern needs (a day narrows a month query otherwise)
+            if result["pattern"] in ("vendas_por_mes", "max_vendas_por_hora"):
+                params.pop("day", None)
+            result["params"] = params
+        return result
+
+    def record(self, fast_path):
+        """Count a question as answered by the fast path or by the LLM"""
+        with self.lock:
+            self.stats["fast_path" if fast_path else "llm"] += 1
+
+    def get_stats(self):
+        """Return fast-path counters and hit rate"""
+        with self.lock:
+            total = self.stats["fast_path"] + self.stats["llm"]
+            return dict(self.stats, hit_rate=self.stats["fast_path"] / total if total else 0.0)
@@ -0,0 +1,20 @@
+import sys
+from db_connector import DatabaseConnector
+from rollups import RollupManager
+
+# Add derived date columns and composite indexes to an existing database and switch it to WAL journaling
+# (with --rollups, also build the rollup tables used by RAGSystem(rollups=True))
+args = [arg for arg in sys.argv[1:] if arg != "--rollups"]
+db_path = args[0] if args else "dados (2).db"
+build_rollups = "--rollups" in sys.argv[1:]
+
+with DatabaseConnector(db_path) as db:
+    statements = db.optimize_storage()
+    journal_mode = db.enable_wal()
+    refreshed = RollupManager(db).refresh() if build_rollups else None
+
+for statement in statements:
+    print(statement)
+print(f"{len(statements)} comandos executados em {db_path} (journal_mode={journal_mode}).")
+if refreshed is not None:
+    print(f"Rollups atualizados: {refreshed}")
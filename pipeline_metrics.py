@@ -0,0 +1,287 @@
+import datetime
+import json
+import os
+import threading
+import time
+import tracemalloc
+import uuid
+from collections import defaultdict, deque
+from contextlib import contextmanager
+
+class QueryTrace:
+    """Timings, token usage, events and errors of one pipeline run"""
+
+    def __init__(self, name, span_id=None, **attrs):
+        """Start a trace with an optional span id and initial attributes"""
+        self.name = name
+        self.span_id = span_id
+        self.attrs = dict(attrs)
+        self.stages = defaultdict(float)
+        self.tokens = defaultdict(int)
+        self.events = defaultdict(int)
+        self.error = None
+        self.started = time.time()
+        self.start = time.perf_counter()
+        self.duration = None
+
+    def to_dict(self):
+        """Return the trace as a JSON-serializable dict"""
+        return {
+            "ts": datetime.datetime.fromtimestamp(self.started, datetime.timezone.utc).isoformat(),
+            "span_id": self.span_id,
+            "name": self.name,
+            "status": "error" if self.error else "ok",
+            "duration_ms": round((self.duration or 0) * 1000, 3),
+            "stages_ms": {stage: round(seconds * 1000, 3) for stage, seconds in self.stages.items()},
+            "tokens": dict(self.tokens),
+            "events": dict(self.events),
+            "attrs": self.attrs,
+            "error": self.error
+        }
+
+
+class PipelineMetrics:
+    """Per-stage timers, token usage and cache events for the RAG pipeline, exported as JSON logs and Prometheus text"""
+
+    # Histogram buckets in seconds (LLM calls take seconds, SQLite stages milliseconds)
+    BUCKETS = [0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0]
+
+    def __init__(self, log_path=None, span_ids=True, window=1000, prefix="rag", track_memory=False):
+        """
+        Initialize with an optional JSONL log file and the number of recent samples kept for percentiles
+
+        track_memory records the peak memory of each stage while tracemalloc
+        is running. The peak counter is process-global (every stage resets
+        it), so only enable it while a single thread runs the pipeline, as
+        the benchmark's memory pass does.
+        """
+        self.log_path = log_path
+        self.span_ids = span_ids
+        self.prefix = prefix
+        self.lock = threading.Lock()
+        self._local = threading.local()
+        self.recent = deque(maxlen=100)
+        self.samples = defaultdict(lambda: deque(maxlen=window))
+        self.histograms = {}
+        self.counters = defaultdict(int)
+        self.track_memory = track_memory
+        self.stage_memory = {}
+        # Highest traced memory seen while tracking (the stages reset tracemalloc's own peak)
+        self.memory_peak = 0
+
+    def current(self):
+        """Return the trace active in this thread, if any"""
+        return getattr(self._local, "trace", None)
+
+    def start_trace(self, name, span_id=None, **attrs):
+        """Create a trace without making it current (see resume() and finish_trace())"""
+        if span_id is None and self.span_ids:
+            span_id = uuid.uuid4().hex[:16]
+        return QueryTrace(name, span_id, **attrs)
+
+    @contextmanager
+    def resume(self, trace):
+        """Make trace the current one in this thread for the duration of the block"""
+        parent = self.current()
+        self._local.trace = trace
+        try:
+            yield trace
+        finally:
+            self._local.trace = parent
+
+    def finish_trace(self, trace):
+        """Close a trace created with start_trace() and aggregate it"""
+        trace.duration = time.perf_counter() - trace.start
+        self._finish(trace)
+
+    @contextmanager
+    def trace(self, name, span_id=None, **attrs):
+        """Trace one pipeline run in this thread; yields the QueryTrace"""
+        trace = self.start_trace(name, span_id, **attrs)
+        try:
+            with self.resume(trace):
+                yield trace
+        except Exception as e:
+            if trace.error is None:
+                trace.error = {"stage": None, "type": type(e).__name__, "message": str(e)}
+            raise
+        finally:
+            self.finish_trace(trace)
+
+    @contextmanager
+    def stage(self, name):
+        """Time a pipeline stage (added to the current trace and to the stage histograms)"""
+        # Opt-in (see __init__), and only while tracemalloc is running (it slows everything down)
+        tracing = self.track_memory and tracemalloc.is_tracing()
+        if tracing:
+            self.memory_peak = max(self.memory_peak, tracemalloc.get_traced_memory()[1])
+            tracemalloc.reset_peak()
+            memory_base = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        try:
+            yield
+        except Exception as e:
+            self.error(name, e)
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            if tracing:
+                peak = tracemalloc.get_traced_memory()[1] - memory_base
+                with self.lock:
+                    self.stage_memory[name] = max(self.stage_memory.get(name, 0), peak)
+            self.record_stage(name, elapsed)
+
+    def record_stage(self, name, seconds):
+        """Add time spent in a stage to the current trace and to the stage histograms (for stages timed by hand)"""
+        trace = self.current()
+        if trace is not None:
+            trace.stages[name] += seconds
+        self._observe("stage_duration_seconds", (("stage", name),), seconds)
+
+    def error(self, stage, error):
+        """Record an error, also when it is handled and does not propagate (once per trace)"""
+        trace = self.current()
+        if trace is not None:
+            if trace.error is not None:
+                return
+            trace.error = {"stage": stage, "type": type(error).__name__, "message": str(error)}
+        with self.lock:
+            self.counters[("errors_total", (("stage", stage or "unknown"),))] += 1
+
+    def event(self, name, value=1):
+        """Count an event such as a cache hit"""
+        trace = self.current()
+        if trace is not None:
+            trace.events[name] += value
+        with self.lock:
+            self.counters[("events_total", (("event", name),))] += value
+
+    def set(self, key, value):
+        """Attach an attribute (row count, pattern, ...) to the current trace"""
+        trace = self.current()
+        if trace is not None:
+            trace.attrs[key] = value
+
+    def record_usage(self, usage):
+        """Add the token counts of an API response "usage" field"""
+        trace = self.current()
+        with self.lock:
+            for key, value in (usage or {}).items():
+                if isinstance(value, int):
+                    self.counters[("tokens_total", (("type", key),))] += value
+                    if trace is not None:
+                        trace.tokens[key] += value
+
+    def _observe(self, name, labels, value):
+        """Add an observation to a histogram and to the percentile window"""
+        with self.lock:
+            histogram = self.histograms.get((name, labels))
+            if histogram is None:
+                histogram = self.histograms[(name, labels)] = {"buckets": [0] * len(self.BUCKETS), "sum": 0.0, "count": 0}
+            for i, bound in enumerate(self.BUCKETS):
+                if value <= bound:
+                    histogram["buckets"][i] += 1
+            histogram["sum"] += value
+            histogram["count"] += 1
+            self.samples[(name, labels)].append(value)
+
+    def _finish(self, trace):
+        """Aggregate a finished trace and write its log line"""
+        status = "error" if trace.error else "ok"
+        self._observe("query_duration_seconds", (("name", trace.name),), trace.duration)
+        with self.lock:
+            self.counters[("queries_total", (("name", trace.name), ("status", status)))] += 1
+            if isinstance(trace.attrs.get("row_count"), int):
+                self.counters[("result_rows_total", ())] += trace.attrs["row_count"]
+            self.recent.append(trace.to_dict())
+
+        if self.log_path:
+            line = json.dumps(trace.to_dict(), ensure_ascii=False, default=str)
+            with self.lock:
+                with open(self.log_path, "a", encoding="utf-8") as f:
+                    f.write(line + "\n")
+
+    @staticmethod
+    def _percentile(values, q):
+        """Nearest-rank percentile of a list of values"""
+        values = sorted(values)
+        return values[min(len(values) - 1, int(round(q * (len(values) - 1))))]
+
+    def get_stats(self):
+        """Return p50/p95/p99 (ms) per stage and per query name over the recent window, plus counters"""
+        with self.lock:
+            samples = {key: list(values) for key, values in self.samples.items()}
+            counters = dict(self.counters)
+
+        latencies = {}
+        for (name, labels), values in samples.items():
+            if not values:
+                continue
+            label = f"{name}:{dict(labels).get('stage', dict(labels).get('name'))}"
+            latencies[label] = {
+                "count": len(values),
+                **{f"p{int(q * 100)}_ms": round(self._percentile(values, q) * 1000, 3) for q in (0.5, 0.95, 0.99)}
+            }
+        totals = {f"{name}{self._labels(labels)}": value for (name, labels), value in counters.items()}
+        stats = {"latencies": latencies, "counters": totals}
+        if self.stage_memory:
+            stats["peak_memory_kb"] = {name: round(peak / 1024, 1) for name, peak in self.stage_memory.items()}
+        return stats
+
+    def get_recent(self, limit=20):
+        """Return the most recent traces as dicts"""
+        with self.lock:
+            return list(self.recent)[-limit:]
+
+    @staticmethod
+    def _labels(labels, extra=()):
+        """Format Prometheus labels"""
+        pairs = list(labels) + list(extra)
+        if not pairs:
+            return ""
+        escape = lambda value: str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        return "{" + ",".join(f'{key}="{escape(value)}"' for key, value in pairs) + "}"
+
+    def to_prometheus(self):
+        """Return the metrics in the Prometheus text exposition format"""
+        help_text = {
+            "stage_duration_seconds": ("histogram", "Duração de cada etapa do pipeline"),
+            "query_duration_seconds": ("histogram", "Duração total de cada consulta"),
+            "queries_total": ("counter", "Consultas processadas"),
+            "errors_total": ("counter", "Erros por etapa"),
+            "events_total": ("counter", "Eventos do pipeline (acertos de cache, caminho rápido, ...)"),
+            "tokens_total": ("counter", "Tokens informados pela API Claude"),
+            "result_rows_total": ("counter", "Linhas retornadas pelas consultas")
+        }
+        with self.lock:
+            histograms = {key: dict(value, buckets=list(value["buckets"])) for key, value in self.histograms.items()}
+            counters = dict(self.counters)
+
+        lines = []
+        for metric, (kind, description) in help_text.items():
+            name = f"{self.prefix}_{metric}"
+            if kind == "histogram":
+                series = sorted((key, value) for key, value in histograms.items() if key[0] == metric)
+            else:
+                series = sorted((key, value) for key, value in counters.items() if key[0] == metric)
+            if not series:
+                continue
+            lines.append(f"# HELP {name} {description}")
+            lines.append(f"# TYPE {name} {kind}")
+            for (_, labels), value in series:
+                if kind == "histogram":
+                    for bound, count in zip(self.BUCKETS, value["buckets"]):
+                        lines.append(f"{name}_bucket{self._labels(labels, [('le', bound)])} {count}")
+                    lines.append(f"{name}_bucket{self._labels(labels, [('le', '+Inf')])} {value['count']}")
+                    lines.append(f"{name}_sum{self._labels(labels)} {value['sum']:.6f}")
+                    lines.append(f"{name}_count{self._labels(labels)} {value['count']}")
+                else:
+                    lines.append(f"{name}{self._labels(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path):
+        """Write the Prometheus text atomically (e.g. for the node_exporter textfile collector)"""
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(self.to_prometheus())
+        os.replace(tmp_path, path)
@@ -1,36 +1,117 @@
 from db_connector import DatabaseConnector
 import re
-import pandas as pd
+import datetime
 
 class QueryExecutor:
-    def __init__(self, db_connector=None):
+    def __init__(self, db_connector=None, rollup_manager=None, analytics_engine=None, result_cache=None):
         """Initialize with a database connector instance or create a new one"""
         self.db_connector = db_connector if db_connector else DatabaseConnector()
         
+        # Optional RollupManager; patterns it knows are answered from the rollup tables
+        self.rollup_manager = rollup_manager
+        
+        # Optional AnalyticsEngine; execute_pattern computes the patterns it knows in memory
+        self.analytics_engine = analytics_engine
+        
+        # Optional ResultCache; SELECT results are reused until the database changes
+        self.result_cache = result_cache
+        if result_cache is not None:
+            self.db_connector.add_ingest_hook(result_cache.on_ingest)
+        
         # Common SQL query patterns for this database
         self.query_patterns = {
             "vendas_mensais": "SELECT loja_nome, total_liquido, data FROM dados_mensais",
             "vendas_diarias": "SELECT loja_nome, total_liquido, data, hora FROM dados_diarios",
-            "vendas_por_mes": "SELECT loja_nome, SUM(total_liquido) as total FROM dados_mensais WHERE data LIKE '{year}-{month}-%' GROUP BY loja_nome",
-            "vendas_por_dia": "SELECT loja_nome, SUM(total_liquido) as total FROM dados_mensais WHERE data LIKE '{year}-{month}-{day}' GROUP BY loja_nome",
-            "max_vendas_por_hora": "SELECT d1.loja_nome, d1.total_liquido, d1.data, d1.hora FROM dados_diarios d1 WHERE d1.data LIKE '{pattern}' AND d1.total_liquido = (SELECT MAX(d2.total_liquido) FROM dados_diarios d2 WHERE d2.loja_nome = d1.loja_nome AND d2.data LIKE '{pattern}')",
+            # Date filters use half-open ranges on the ISO "data" text ({start}/{end}
+            # are filled in by execute_pattern) so they can use the data indexes
+            "vendas_por_mes": "SELECT loja_nome, SUM(total_liquido) as total FROM dados_mensais WHERE data >= '{start}' AND data < '{end}' GROUP BY loja_nome",
+            # dados_mensais only has first-of-month rows; a single day comes from the daily table
+            "vendas_por_dia": "SELECT loja_nome, SUM(total_liquido) as total FROM dados_diarios WHERE data >= '{start}' AND data < '{end}' GROUP BY loja_nome",
+            "max_vendas_por_hora": "SELECT d1.loja_nome, d1.total_liquido, d1.data, d1.hora FROM dados_diarios d1 WHERE d1.data >= '{start}' AND d1.data < '{end}' AND d1.total_liquido = (SELECT MAX(d2.total_liquido) FROM dados_diarios d2 WHERE d2.loja_nome = d1.loja_nome AND d2.data >= '{start}' AND d2.data < '{end}')",
             "metodos_pagamento": "SELECT data, loja_nome, MAX(dinheiro) as dinheiro, MAX(cheque) as cheque, MAX(cartao) as cartao, MAX(convenio) as convenio, MAX(deposito) as deposito, MAX(outros) as outros FROM dados_mensais GROUP BY loja_nome, data ORDER BY hora DESC",
             "evolucao_ticket": "SELECT data, loja_nome, tiket_medio, hora FROM dados_diarios ORDER BY data DESC, loja_nome LIMIT {limit}",
-            "horas_entrega": "SELECT data, loja_nome, MAX(entregas_req) as max_entregas, hora FROM dados_diarios GROUP BY loja_nome ORDER BY hora DESC"
+            "horas_entrega": "SELECT data, loja_nome, MAX(entregas_req) as max_entregas, hora FROM dados_diarios GROUP BY loja_nome ORDER BY hora DESC",
+            "vendas_por_hora_do_dia": "SELECT loja_nome, hora, SUM(total_liquido) as total FROM dados_diarios WHERE hora IS NOT NULL GROUP BY loja_nome, hora ORDER BY loja_nome, hora",
+            "vendas_por_dia_semana": "SELECT loja_nome, CAST(strftime('%w', data) AS INTEGER) as dia_semana, SUM(total_liquido) as total FROM dados_diarios GROUP BY loja_nome, dia_semana ORDER BY loja_nome, dia_semana",
+            "vendas_fim_de_semana": "SELECT loja_nome, CASE WHEN CAST(strftime('%w', data) AS INTEGER) IN (0, 6) THEN 'fim de semana' ELSE 'dia útil' END as periodo, SUM(total_liquido) as total, COUNT(DISTINCT data) as dias, SUM(total_liquido) / COUNT(DISTINCT data) as total_liquido_medio FROM dados_diarios GROUP BY loja_nome, periodo ORDER BY loja_nome, periodo",
+            # Daily discount (one value per day) against daily net sales, Pearson per store
+            "correlacao_desconto_vendas": "SELECT loja_nome, (COUNT(*) * SUM(x * y) - SUM(x) * SUM(y)) / sqrt((COUNT(*) * SUM(x * x) - SUM(x) * SUM(x)) * (COUNT(*) * SUM(y * y) - SUM(y) * SUM(y))) as correlacao, COUNT(*) as dias FROM (SELECT loja_nome, data, MAX(total_desconto) as x, SUM(total_liquido) as y FROM dados_diarios GROUP BY loja_nome, data) WHERE x IS NOT NULL AND y IS NOT NULL GROUP BY loja_nome ORDER BY loja_nome"
         }
     
-    def execute_sql(self, query):
-        """Execute a SQL query directly"""
-        return self.db_connector.execute_query(query)
+    def execute_sql(self, query, read_only=False, **limits):
+        """Execute a SQL query directly (read_only uses a mode=ro connection; see DatabaseConnector.execute_query for limits)"""
+        if self.result_cache is None or not re.match(r"\s*(SELECT|WITH)\b", query, re.IGNORECASE):
+            return self.db_connector.execute_query(query, read_only=read_only, **limits)
+        
+        # The row/byte budget and the summary change the result; the timeout does not
+        summarizer = limits.get("summarizer")
+        key = self.result_cache.make_key(query, limits.get("max_rows"), limits.get("max_bytes"), summarizer is not None)
+        # Open the connection first: opening a WAL database creates its -wal file and would change the version
+        self.db_connector.get_connection(read_only)
+        version = self.db_connector.get_data_version()
+        results = self.result_cache.get(key, version)
+        if results is not None:
+            cached_summary = results.attrs.get("summary")
+            if summarizer is not None and cached_summary is not None:
+                # Hand the caller's summarizer the digest computed when the result was cached
+                summarizer.copy_from(cached_summary)
+                results.attrs["summary"] = summarizer
+            return results
+        
+        results = self.db_connector.execute_query(query, read_only=read_only, **limits)
+        if results is not None and version is not None:
+            self.result_cache.set(key, version, results)
+        return results
     
     def execute_pattern(self, pattern_name, **kwargs):
         """Execute a query using a predefined pattern with parameter substitution"""
+        if self.uses_analytics(pattern_name):
+            return self.analytics_engine.run_pattern(pattern_name, **self._with_date_range(kwargs))
+        return self.execute_sql(self.build_pattern_query(pattern_name, **kwargs))
+    
+    def uses_analytics(self, pattern_name):
+        """Check whether execute_pattern computes a pattern with the analytics engine"""
+        return self.analytics_engine is not None and self.analytics_engine.has_route(pattern_name)
+    
+    def _with_date_range(self, kwargs):
+        """Add the start/end range for year/month/day parameters"""
+        if "year" in kwargs and "start" not in kwargs:
+            start, end = self.date_range(kwargs["year"], kwargs.get("month"), kwargs.get("day"))
+            kwargs = dict(kwargs, start=start, end=end)
+        return kwargs
+    
+    def build_pattern_query(self, pattern_name, loja=None, **kwargs):
+        """Return the SQL for a predefined pattern, optionally restricted to one store"""
         if pattern_name not in self.query_patterns:
             raise ValueError(f"Padrão de consulta desconhecido: {pattern_name}")
         
-        query_template = self.query_patterns[pattern_name]
-        query = query_template.format(**kwargs)
-        return self.execute_sql(query)
+        kwargs = self._with_date_range(kwargs)
+        
+        # Rollups are only read here (see RollupManager.is_current); building them is a write
+        if self.rollup_manager and self.rollup_manager.has_route(pattern_name) and self.rollup_manager.is_current():
+            query = self.rollup_manager.build_query(pattern_name, **kwargs)
+        else:
+            query_template = self.query_patterns[pattern_name]
+            query = query_template.format(**kwargs)
+        
+        if loja:
+            query = "SELECT * FROM ({}) WHERE loja_nome = '{}'".format(query, loja.replace("'", "''"))
+        return query
+    
+    def date_range(self, year, month=None, day=None):
+        """Return the half-open [start, end) ISO date range for a year, month or day"""
+        year = int(year)
+        if month is None:
+            return f"{year:04d}-01-01", f"{year + 1:04d}-01-01"
+        
+        month = int(month)
+        if day is None:
+            start = datetime.date(year, month, 1)
+            end = datetime.date(year + month // 12, month % 12 + 1, 1)
+        else:
+            start = datetime.date(year, month, int(day))
+            end = start + datetime.timedelta(days=1)
+        return start.isoformat(), end.isoformat()
     
     def extract_date_parts(self, date_string):
         """Extract year, month, day from a date string"""
@@ -68,8 +149,9 @@ class QueryExecutor:
             "dezembro": "12", "dez": "12", "december": "12"
         }
         
+        # Whole words only, so e.g. "maior" is not read as "mai"
         for month_name, month_num in months.items():
-            if month_name in month_string.lower():
+            if re.search(rf"\b{month_name}\b", month_string.lower()):
                 return month_num
         
         return None
@@ -80,19 +162,23 @@ class QueryExecutor:
         db_info = {"tables": []}
         
         for table in tables:
+            # Rollup and ingest bookkeeping tables are internal and kept out of the prompts
+            if table.startswith("rollup_") or table == "ingest_watermark":
+                continue
+            
             schema = self.db_connector.get_table_schema(table)
-            sample = self.db_connector.get_sample_data(table)
             
-            # Convert sample data to a serializable format
-            if sample is not None:
-                sample_dict = sample.to_dict(orient="records")
-            else:
-                sample_dict = []
+            # Plain rows keep startup free of pandas
+            try:
+                sample_rows = self.db_connector.get_sample_rows(table)
+            except Exception as e:
+                print(f"Erro ao ler amostra da tabela {table}: {e}")
+                sample_rows = []
             
             table_info = {
                 "name": table,
                 "schema": schema,
-                "sample_data": sample_dict
+                "sample_data": sample_rows
             }
             
             db_info["tables"].append(table_info)
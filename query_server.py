@@ -0,0 +1,300 @@
+import argparse
+import json
+import os
+import signal
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from answer_cache import AnswerCache
+
+class QueryServer:
+    """HTTP API over RAGSystem (or TenantRegistry) with a worker pool, coalesced identical questions and per-client limits"""
+
+    FORMATS = ("default", "direct", "summary", "bullet")
+
+    def __init__(self, rag_system=None, registry=None, host="127.0.0.1", port=8000, workers=8,
+                 max_per_client=4, max_pending=256, request_timeout=120.0, max_rows=100):
+        """
+        Initialize the server
+
+        Questions run on a pool of `workers` threads, so the pipeline (and its
+        per-thread database connections) is bounded no matter how many clients
+        are connected. Concurrent requests for the same question and format
+        share one pipeline run. A client (X-Client-Id header, or its address)
+        may have at most max_per_client requests in flight; beyond max_pending
+        requests overall new ones are refused with 503. Answers carry at most
+        max_rows result rows. With a TenantRegistry the tenant comes from the
+        "tenant" field or the X-Tenant header.
+        """
+        if (rag_system is None) == (registry is None):
+            raise ValueError("Informe rag_system ou registry")
+        self.rag_system = rag_system
+        self.registry = registry
+        self.metrics = registry.metrics if registry else rag_system.metrics
+        self.workers = workers
+        self.max_per_client = max_per_client
+        self.max_pending = max_pending
+        self.request_timeout = request_timeout
+        self.max_rows = max_rows
+
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="rag-worker")
+        # Reentrant: a run that finishes before add_done_callback calls _finished on the submitting thread
+        self.lock = threading.RLock()
+        # (tenant, normalized question, format) -> Future of the pipeline run
+        self.in_flight = {}
+        self.clients = {}
+        self.pending = 0
+        self.draining = False
+        self.started = time.time()
+        self.stats = {"requests": 0, "runs": 0, "coalesced": 0, "rejected_client": 0, "rejected_busy": 0,
+                      "timeouts": 0, "errors": 0}
+
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                path = self.path.split("?")[0].rstrip("/")
+                if path == "/health":
+                    health = server.health()
+                    self.send_json(health, status=200 if health["status"] == "ok" else 503)
+                elif path == "/metrics":
+                    self.send_text(server.prometheus(), "text/plain; version=0.0.4; charset=utf-8")
+                else:
+                    self.send_json({"error": "Recurso não encontrado"}, status=404)
+
+            def do_POST(self):
+                if self.path.split("?")[0].rstrip("/") != "/query":
+                    self.send_json({"error": "Recurso não encontrado"}, status=404)
+                    return
+                length = int(self.headers.get("content-length", 0))
+                if length > 64 * 1024:
+                    self.close_connection = True
+                    self.send_json({"error": "Requisição muito grande"}, status=413)
+                    return
+                try:
+                    body = json.loads(self.rfile.read(length) or b"{}")
+                except ValueError:
+                    self.send_json({"error": "JSON inválido"}, status=400)
+                    return
+                if not isinstance(body, dict):
+                    self.send_json({"error": "JSON inválido"}, status=400)
+                    return
+
+                client = self.headers.get("x-client-id") or self.client_address[0]
+                tenant = body.get("tenant") or self.headers.get("x-tenant")
+                status, payload, headers = server.handle_query(client, tenant, body.get("question"), body.get("format", "direct"))
+                self.send_json(payload, status=status, headers=headers)
+
+            def send_json(self, data, status=200, headers=None):
+                """Reply with a JSON body"""
+                self.send_text(json.dumps(data, ensure_ascii=False, default=str), "application/json; charset=utf-8", status, headers)
+
+            def send_text(self, text, content_type, status=200, headers=None):
+                """Reply with a text body"""
+                payload = text.encode("utf-8")
+                self.send_response(status)
+                self.send_header("content-type", content_type)
+                self.send_header("content-length", str(len(payload)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(payload)
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self):
+        """Base URL of the server"""
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def handle_query(self, client, tenant, question, output_format):
+        """Answer one request; returns (HTTP status, JSON payload, extra headers)"""
+        if not isinstance(question, str) or not question.strip():
+            return 400, {"error": "Informe a pergunta no campo \"question\""}, None
+        if output_format not in self.FORMATS:
+            return 400, {"error": f"Formato inválido: {output_format}"}, None
+        if self.registry:
+            if not tenant:
+                return 400, {"error": "Informe o cliente no campo \"tenant\" ou no cabeçalho X-Tenant"}, None
+            try:
+                self.registry.resolve(tenant)
+            except ValueError as e:
+                return 404, {"error": str(e)}, None
+            tenant = str(tenant)
+
+        with self.lock:
+            self.stats["requests"] += 1
+            if self.draining:
+                return 503, {"error": "Servidor em desligamento"}, {"retry-after": "5"}
+            if self.clients.get(client, 0) >= self.max_per_client:
+                self.stats["rejected_client"] += 1
+                return 429, {"error": "Muitas consultas simultâneas deste cliente"}, {"retry-after": "1"}
+            if self.pending >= self.max_pending:
+                self.stats["rejected_busy"] += 1
+                return 503, {"error": "Servidor ocupado"}, {"retry-after": "1"}
+            self.clients[client] = self.clients.get(client, 0) + 1
+            self.pending += 1
+
+            key = (tenant, AnswerCache.normalize_question(question), output_format)
+            future = self.in_flight.get(key)
+            if future is None:
+                future = self.executor.submit(self._run, tenant, question, output_format)
+                self.in_flight[key] = future
+                future.add_done_callback(lambda _, key=key: self._finished(key))
+                self.stats["runs"] += 1
+            else:
+                self.stats["coalesced"] += 1
+
+        try:
+            result = future.result(timeout=self.request_timeout)
+            return 200, self._serialize(result, question), None
+        except FutureTimeoutError:
+            with self.lock:
+                self.stats["timeouts"] += 1
+            return 504, {"error": "Tempo limite excedido"}, None
+        except Exception as e:
+            with self.lock:
+                self.stats["errors"] += 1
+            return 500, {"error": str(e)}, None
+        finally:
+            with self.lock:
+                self.pending -= 1
+                self.clients[client] -= 1
+                if not self.clients[client]:
+                    del self.clients[client]
+
+    def _run(self, tenant, question, output_format):
+        """Run the pipeline for a question (on a worker thread)"""
+        if self.registry:
+            return self.registry.process_query(tenant, question, output_format)
+        return self.rag_system.process_query(question, output_format)
+
+    def _finished(self, key):
+        """Forget a finished run so later requests start a fresh one"""
+        with self.lock:
+            self.in_flight.pop(key, None)
+
+    def _serialize(self, result, question):
+        """JSON payload of a process_query result (results as columns and at most max_rows rows)"""
+        payload = {key: value for key, value in result.items() if key != "results"}
+        # Coalesced requests answer with their own wording of the question
+        payload["query"] = question
+        results = result.get("results")
+        if results is not None:
+            payload["columns"] = [str(column) for column in results.columns]
+            payload["rows"] = json.loads(results.head(self.max_rows).to_json(orient="values", date_format="iso"))
+            payload["row_count"] = int(results.attrs.get("row_count", len(results)))
+        return payload
+
+    def health(self):
+        """Server state for load balancers and monitoring"""
+        with self.lock:
+            return {
+                "status": "draining" if self.draining else "ok",
+                "uptime_s": round(time.time() - self.started, 1),
+                "pending": self.pending,
+                "in_flight_runs": len(self.in_flight),
+                "clients": len(self.clients),
+                "workers": self.workers
+            }
+
+    def get_stats(self):
+        """Return request counters and the current load"""
+        with self.lock:
+            return dict(self.stats, pending=self.pending, in_flight_runs=len(self.in_flight), clients=len(self.clients))
+
+    def prometheus(self):
+        """Pipeline metrics plus the server counters in the Prometheus text format"""
+        stats = self.get_stats()
+        name = f"{self.metrics.prefix}_http"
+        lines = [f"# HELP {name}_requests_total Requisições HTTP por resultado", f"# TYPE {name}_requests_total counter"]
+        for outcome in ("runs", "coalesced", "rejected_client", "rejected_busy", "timeouts", "errors"):
+            lines.append(f'{name}_requests_total{{outcome="{outcome}"}} {stats[outcome]}')
+        for gauge, description in (("pending", "Requisições aguardando resposta"), ("in_flight_runs", "Execuções do pipeline em andamento")):
+            lines += [f"# HELP {name}_{gauge} {description}", f"# TYPE {name}_{gauge} gauge", f"{name}_{gauge} {stats[gauge]}"]
+        return self.metrics.to_prometheus() + "\n".join(lines) + "\n"
+
+    def start(self):
+        """Start serving in a background thread"""
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def shutdown(self, timeout=30.0):
+        """
+        Stop gracefully: refuse new questions, wait up to timeout seconds for
+        the pending ones, then stop the listener and the workers and close
+        the RAG system(s)
+        """
+        with self.lock:
+            self.draining = True
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            with self.lock:
+                if not self.pending:
+                    break
+            time.sleep(0.05)
+
+        self.server.shutdown()
+        self.server.server_close()
+        self.executor.shutdown(wait=True, cancel_futures=True)
+        if self.registry:
+            self.registry.close()
+        else:
+            self.rag_system.close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Servidor HTTP do sistema RAG")
+    parser.add_argument("--host", default="127.0.0.1", help="endereço de escuta")
+    parser.add_argument("--port", type=int, default=8000, help="porta de escuta")
+    parser.add_argument("--db", default="dados (2).db", help="banco de dados (um único cliente)")
+    parser.add_argument("--tenants-dir", default=None, help="diretório com um banco <cliente>.db por cliente (multi-tenant)")
+    parser.add_argument("--workers", type=int, default=8, help="execuções simultâneas do pipeline")
+    parser.add_argument("--max-per-client", type=int, default=4, help="consultas simultâneas por cliente")
+    parser.add_argument("--analytics", action="store_true", help="usa o motor analítico em memória")
+    parser.add_argument("--rollups", action="store_true", help="responde os padrões pelas tabelas de rollup")
+    parser.add_argument("--shutdown-timeout", type=float, default=30.0, help="espera pelas consultas em andamento ao desligar (segundos)")
+    args = parser.parse_args()
+
+    api_key = os.environ.get("CLAUDE_API_KEY")
+    if not api_key:
+        print("CLAUDE_API_KEY não encontrada nas variáveis de ambiente. Saindo.")
+        exit(1)
+
+    if args.tenants_dir:
+        from tenant_registry import TenantRegistry
+        targets = {"registry": TenantRegistry(db_dir=args.tenants_dir, api_key=api_key, analytics=args.analytics,
+                                               rollups=args.rollups)}
+    else:
+        from rag_app import RAGSystem
+        targets = {"rag_system": RAGSystem(api_key=api_key, db_path=args.db, analytics=args.analytics,
+                                             rollups=args.rollups)}
+
+    query_server = QueryServer(host=args.host, port=args.port, workers=args.workers,
+                               max_per_client=args.max_per_client, **targets).start()
+    print(f"Servidor RAG em {query_server.url} (POST /query, GET /health, GET /metrics)")
+
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    signal.signal(signal.SIGINT, lambda *_: stop.set())
+    while not stop.wait(1):
+        pass
+    print("Desligando: aguardando consultas em andamento...")
+    query_server.shutdown(args.shutdown_timeout)
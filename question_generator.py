@@ -1,68 +1,220 @@
 import json
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from claude_client import ClaudeClient
+from example_index import ExampleIndex
+from schema_context import SchemaContext
 
 class QuestionGenerator:
     """Generate diverse example questions for the RAG system"""
     
-    def __init__(self, db_info, claude_client=None):
-        """Initialize with database information and optional Claude client"""
+    # Question categories requested in parallel, with the guidance sent for each
+    CATEGORIES = {
+        "temporal": "Análise temporal: tendências ao longo do tempo, comparações entre meses, dias da semana e horários",
+        "lojas": "Análise por loja: desempenho, comparações e características de lojas específicas",
+        "agregacao": "Agregação e agrupamento: totais, médias, contagens e proporções por categoria",
+        "ranking": "Ordenação e classificação: melhores e piores desempenhos, maiores e menores valores",
+        "filtros": "Condições de filtragem: períodos específicos, limiares de valores, combinações de condições"
+    }
+    
+    # Rounds of requests for the questions still missing after deduplication
+    MAX_ROUNDS = 5
+    
+    def __init__(self, db_info, claude_client=None, schema_context=None, max_workers=8, per_request=25,
+                 similarity_threshold=0.75):
+        """
+        Initialize with database information and optional Claude client
+        
+        Generation fans out requests of at most per_request questions over the
+        categories, max_workers at a time. A question whose terms overlap an
+        accepted one by similarity_threshold (Jaccard) or more is a near duplicate.
+        """
         self.db_info = db_info
         self.claude_client = claude_client
+        self.schema_context = schema_context or SchemaContext(db_info)
+        self.max_workers = max_workers
+        self.per_request = per_request
+        self.similarity_threshold = similarity_threshold
+        # Only the tokenizer is used (accents, stopwords and plurals normalized)
+        self.terms = ExampleIndex(path=None, dataset_path=None).tokens
     
-    def generate_questions(self, num_questions=30):
-        """Generate diverse example questions using Claude API"""
+    def generate_questions(self, num_questions=30, existing=None):
+        """
+        Generate num_questions new questions using Claude API, in parallel by category
+        
+        Each request streams its JSON array; questions are validated and
+        deduplicated (against each other and against existing) as soon as they
+        arrive, and requests stop once enough questions were accepted. Missing
+        questions are requested again, for up to MAX_ROUNDS rounds. Without a
+        client, or when nothing could be generated, returns the default questions.
+        """
         if not self.claude_client:
             print("Cliente Claude não fornecido. Não é possível gerar perguntas.")
             return self.get_default_questions()
         
-        system_prompt = """
-        Você é um assistente prestativo que gera perguntas diversas e realistas sobre um banco de dados.
-        As perguntas devem abranger diferentes tipos de consultas, desde simples até complexas, e devem ser
-        projetadas para testar a capacidade de um sistema RAG de interpretar linguagem natural e gerar consultas SQL.
-        
-        As perguntas devem ter complexidade e tópicos variados, abrangendo diferentes aspectos dos dados,
-        tais como:
-        - Análise temporal (tendências ao longo do tempo, comparações entre períodos)
-        - Análise focada em entidades (informações sobre lojas específicas, produtos, etc.)
-        - Agregação e agrupamento (totais, médias, contagens por categoria)
-        - Ordenação e classificação (melhores desempenhos, piores desempenhos)
-        - Condições de filtragem (períodos de tempo específicos, limiares)
-        - Relações complexas (correlações, se existirem nos dados)
-        
-        Retorne exatamente o número solicitado de perguntas em formato de array JSON.
-        """
+        index = self._new_index(existing or [])
+        accepted = []
+        lock = threading.Lock()
         
-        # Prepare database schema info as a prompt
-        db_schema_str = json.dumps(self.db_info, indent=2)
+        def accept(question):
+            """Keep a question unless it is invalid, a near duplicate or over the target; False stops the request"""
+            with lock:
+                if len(accepted) >= num_questions:
+                    return False
+                if self._valid(question) and self._add_if_new(index, question):
+                    accepted.append(question)
+                return len(accepted) < num_questions
         
-        prompt = f"""
-        Com base nas seguintes informações do banco de dados:
+        categories = list(self.CATEGORIES)
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            for _ in range(self.MAX_ROUNDS):
+                missing = num_questions - len(accepted)
+                if missing <= 0:
+                    break
+                # Ask for some extra questions: a share of them is usually dropped as duplicates
+                wanted = missing + max(5, missing // 5)
+                # At least one request per category, none over per_request questions
+                count = len(categories)
+                while -(-wanted // count) > self.per_request:
+                    count += len(categories)
+                size = -(-wanted // count)
+                requests = [(categories[i % len(categories)], size) for i in range(count)]
+                futures = [executor.submit(self._generate_category, category, count, existing or [], accept)
+                           for category, count in requests]
+                for future in futures:
+                    future.result()
+                # A round without new questions means the model keeps repeating itself
+                if num_questions - len(accepted) == missing:
+                    break
+        
+        if not accepted and not existing:
+            return self.get_default_questions()
+        return accepted
+    
+    def _generate_category(self, category, count, existing, accept):
+        """Stream one category request, passing each complete question to accept"""
+        system_prompt = f"""
+        Você é um assistente prestativo que gera perguntas diversas e realistas sobre um banco de dados.
+        As perguntas devem ser projetadas para testar a capacidade de um sistema RAG de interpretar
+        linguagem natural e gerar consultas SQL, variando de simples a complexas.
         
-        {db_schema_str}
+        Com base nas seguintes informações do banco de dados:
         
-        Gere {num_questions} perguntas diversas e realistas que poderiam ser feitas sobre este banco de dados.
-        As perguntas devem variar em complexidade e tópico, e devem ser projetadas para testar a capacidade
-        de um sistema RAG de entender linguagem natural e gerar consultas SQL.
+        {self.schema_context.build()}
         
-        Por favor, retorne as perguntas como um array JSON de strings em português brasileiro.
+        Retorne APENAS um array JSON de strings em português brasileiro, sem texto adicional.
         """
         
-        response = self.claude_client.generate_response(prompt, system_prompt=system_prompt, temperature=0.8)
+        # A sample of known questions of any category steers the model away from repeats
+        avoid = ""
+        if existing:
+            avoid = "Não repita estas perguntas já existentes:\n" + "\n".join(f"- {question}" for question in existing[-15:])
+        prompt = f"""
+        Gere {count} perguntas diferentes entre si desta categoria:
+        {self.CATEGORIES[category]}
+        
+        {avoid}
+        
+        Retorne APENAS um array JSON com {count} strings.
+        """
         
         try:
-            # Try to extract JSON from the response
-            if "```json" in response:
-                json_text = response.split("```json")[1].split("```")[0].strip()
-            elif "```" in response:
-                json_text = response.split("```")[1].split("```")[0].strip()
-            else:
-                json_text = response.strip()
-            
-            questions = json.loads(json_text)
-            return questions
+            for question in self._stream_strings(self.claude_client.stream_response(
+                    prompt, system_prompt=system_prompt, max_tokens=min(8000, 80 * count + 200), temperature=0.9)):
+                if not accept(question):
+                    # Closing the stream stops the generation (and its cost) early
+                    break
         except Exception as e:
-            print(f"Erro ao analisar perguntas geradas: {e}")
-            return self.get_default_questions()
+            print(f"Erro ao gerar perguntas ({category}): {e}")
+    
+    @staticmethod
+    def _stream_strings(chunks):
+        """Yield each complete string of a streamed JSON array as soon as it is closed"""
+        buffer = ""
+        position = 0
+        started = False
+        for chunk in chunks:
+            buffer += chunk
+            if not started:
+                position = buffer.find("[")
+                if position < 0:
+                    continue
+                started = True
+            matches = list(re.finditer(r'"((?:[^"\\]|\\.)*)"', buffer[position:]))
+            for match in matches:
+                try:
+                    yield json.loads(match.group(0))
+                except ValueError:
+                    pass
+            if matches:
+                position += matches[-1].end()
+    
+    @staticmethod
+    def _valid(question):
+        """A question worth keeping: a string of a few words, not too long"""
+        return isinstance(question, str) and 15 <= len(question.strip()) <= 300 and len(question.split()) >= 4
+    
+    def _new_index(self, questions):
+        """Similarity index (term -> question ids) preloaded with questions"""
+        index = {"postings": {}, "sizes": [], "keys": set()}
+        for question in questions:
+            self._add_if_new(index, question, force=True)
+        return index
+    
+    def _add_if_new(self, index, question, force=False):
+        """Add a question to the index unless it nearly duplicates one already there; returns whether it was added"""
+        key = ExampleIndex.normalize_question(question)
+        terms = set(self.terms(question))
+        if not force:
+            if key in index["keys"]:
+                return False
+            shared = {}
+            for term in terms:
+                for question_id in index["postings"].get(term, ()):
+                    shared[question_id] = shared.get(question_id, 0) + 1
+            for question_id, count in shared.items():
+                union = len(terms) + index["sizes"][question_id] - count
+                if union and count / union >= self.similarity_threshold:
+                    return False
+        
+        question_id = len(index["sizes"])
+        index["sizes"].append(len(terms))
+        index["keys"].add(key)
+        for term in terms:
+            index["postings"].setdefault(term, []).append(question_id)
+        return True
+    
+    def deduplicate(self, questions):
+        """Drop near duplicates from a list of questions, keeping the first of each"""
+        index = self._new_index([])
+        return [question for question in questions if self._add_if_new(index, question)]
+    
+    def top_up(self, filename="perguntas_exemplo.json", num_questions=30):
+        """
+        Bring the question corpus in filename up to num_questions questions
+        
+        Existing questions are kept; only the missing ones are generated
+        (deduplicated against the corpus) and the file is rewritten
+        atomically. Returns the whole corpus.
+        """
+        questions = []
+        if os.path.exists(filename):
+            try:
+                with open(filename, "r", encoding="utf-8") as f:
+                    questions = [question for question in json.load(f) if isinstance(question, str)]
+            except (OSError, ValueError) as e:
+                print(f"Erro ao ler {filename}: {e}")
+        
+        if len(questions) < num_questions:
+            generated = self.generate_questions(num_questions - len(questions), existing=questions)
+            questions = questions + generated
+            tmp_path = f"{filename}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(questions, f, indent=2, ensure_ascii=False)
+            os.replace(tmp_path, filename)
+        return questions
     
     def get_default_questions(self):
         """Return default questions in case generation fails"""
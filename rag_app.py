@@ -1,26 +1,101 @@
 import os
 import json
-import pandas as pd
+import threading
+import time
+from contextlib import contextmanager, nullcontext
 from db_connector import DatabaseConnector
 from query_executor import QueryExecutor
 from claude_client import ClaudeClient
 from question_generator import QuestionGenerator
+from answer_cache import AnswerCache
+from schema_context import SchemaContext
+from evaluation_runner import EvaluationRunner
+from result_summarizer import ResultSummarizer
+from sql_guard import SQLGuard
+from intent_matcher import IntentMatcher
+from response_renderer import ResponseRenderer
+from schema_snapshot import SchemaSnapshot
+from pipeline_metrics import PipelineMetrics
+from result_cache import ResultCache
+from example_index import ExampleIndex
+from rollups import RollupManager
 
 class RAGSystem:
-    def __init__(self, api_key=None, db_path="dados (2).db"):
-        """Initialize the RAG system with all required components"""
+    def __init__(self, api_key=None, db_path="dados (2).db", cache_path="cache_respostas.db", max_result_rows=1000,
+                 fast_path=True, local_render=True, schema_cache_path="schema_cache.json",
+                 metrics_log_path=None, analytics=False, claude_client=None, metrics=None, tenant_id=None,
+                 result_cache_bytes=32 * 1024 * 1024, examples_path="exemplos_sql.jsonl", num_examples=3, max_repairs=1,
+                 rollups=False):
+        """Initialize the RAG system with all required components (claude_client and metrics can be shared between instances)"""
+        # Tenant this instance serves (see TenantRegistry); added to every trace
+        self.tenant_id = tenant_id
+        
         # Initialize database components
         self.db_connector = DatabaseConnector(db_path)
-        self.query_executor = QueryExecutor(self.db_connector)
+        
+        # Optional in-memory columnar copy of the sales tables for the heavy fast-path aggregations (loaded on
+        # first use); imported only when enabled, since analytics_engine pulls in numpy
+        self.analytics_engine = None
+        if analytics:
+            from analytics_engine import AnalyticsEngine
+            self.analytics_engine = AnalyticsEngine(self.db_connector)
+            self.db_connector.add_ingest_hook(self.analytics_engine.on_ingest)
+        
+        # Optional pre-aggregated rollup tables, built by migrate_db.py --rollups and kept up to date by the ingest
+        # hook; while they are missing or behind, the patterns run on the source tables
+        self.rollup_manager = RollupManager(self.db_connector) if rollups else None
+        if self.rollup_manager:
+            self.db_connector.add_ingest_hook(self.rollup_manager.on_ingest)
+        
+        # In-memory cache of query results, keyed on normalized SQL and dropped when the database changes
+        self.result_cache = ResultCache(result_cache_bytes) if result_cache_bytes else None
+        self.query_executor = QueryExecutor(self.db_connector, rollup_manager=self.rollup_manager,
+                                            analytics_engine=self.analytics_engine, result_cache=self.result_cache)
+        
+        # Per-stage timers, token usage and cache events (JSON lines in metrics_log_path when set)
+        self.metrics = metrics or PipelineMetrics(metrics_log_path)
         
         # Initialize Claude API client
-        self.claude_client = ClaudeClient(api_key)
+        self.claude_client = claude_client or ClaudeClient(api_key, usage_callback=self.metrics.record_usage)
+        
+        # Database schema information (snapshot reused until the schema or the file changes)
+        if schema_cache_path:
+            self.db_info = SchemaSnapshot(self.query_executor, schema_cache_path).load()
+        else:
+            self.db_info = self.query_executor.get_database_info()
+        
+        # Compact schema description used in prompts
+        self.schema_context = SchemaContext(self.db_info, self.db_connector)
+        
+        # Row budget for model-generated SQL (the summary still covers every row)
+        self.max_result_rows = max_result_rows
+        
+        # Pre-execution checks for model-generated SQL (unknown names are corrected against the cached schema)
+        self.sql_guard = SQLGuard(self.db_connector, schema=self.db_info)
+        
+        # Deadline (time.monotonic()) of the question this thread is answering, see process_query
+        self._local = threading.local()
+        
+        # Round trips that send a failing statement and its SQLite error back to Claude
+        self.max_repairs = max_repairs
+        
+        # Template fast path: recognized questions skip LLM SQL generation
+        self.intent_matcher = IntentMatcher(self.query_executor) if fast_path else None
         
-        # Database schema information
-        self.db_info = self.query_executor.get_database_info()
+        # Local templates for small results (skips the explanation call to Claude)
+        self.renderer = ResponseRenderer() if local_render else None
+        
+        # Similar solved questions shown to Claude as few-shot examples (num_examples=0 disables;
+        # examples_path=None keeps the learned examples in memory only)
+        self.num_examples = num_examples
+        self.example_index = ExampleIndex(examples_path) if num_examples else None
+        
+        # Answer cache (disabled when cache_path is None)
+        self.answer_cache = AnswerCache(cache_path) if cache_path else None
+        self.schema_fingerprint = AnswerCache.schema_fingerprint(self.db_info)
         
         # Initialize question generator
-        self.question_generator = QuestionGenerator(self.db_info, self.claude_client)
+        self.question_generator = QuestionGenerator(self.db_info, self.claude_client, self.schema_context)
         
         # System prompt for general queries
         self.system_prompt = """
@@ -33,7 +108,37 @@ class RAGSystem:
         para tornar as informações mais acessíveis.
         """
     
-    def process_query(self, user_query, output_format="direct"):
+    def _trace(self, name, **attrs):
+        """Start a metrics trace, tagged with the tenant when there is one"""
+        if self.tenant_id is not None:
+            attrs["tenant"] = self.tenant_id
+        return self.metrics.trace(name, **attrs)
+    
+    def _start_trace(self, name, **attrs):
+        """Create a metrics trace for resume()/finish_trace(), tagged with the tenant when there is one"""
+        if self.tenant_id is not None:
+            attrs["tenant"] = self.tenant_id
+        return self.metrics.start_trace(name, **attrs)
+    
+    @contextmanager
+    def _deadline(self, deadline):
+        """Bound the Claude requests and SQL statements this thread runs inside the block by a time.monotonic() deadline"""
+        previous = getattr(self._local, "deadline", None)
+        self._local.deadline = deadline
+        transport = getattr(self.claude_client, "transport", None)
+        try:
+            with transport.deadline(deadline) if transport is not None else nullcontext():
+                yield
+        finally:
+            self._local.deadline = previous
+    
+    def close(self):
+        """Close the database connections and the answer cache"""
+        self.db_connector.disconnect()
+        if self.answer_cache:
+            self.answer_cache.close()
+    
+    def process_query(self, user_query, output_format="direct", deadline=None):
         """
         Process a natural language query and return results
         
@@ -44,47 +149,518 @@ class RAGSystem:
           - "direct": Only the data, no explanations
           - "summary": Very brief 1-2 sentence summary
           - "bullet": Bullet point format
+        - deadline (float): Optional time.monotonic() value; Claude requests (and their
+          retries) and SQL statements are cut off when it passes
+        """
+        with self._trace("process_query", query=user_query, output_format=output_format) as trace, self._deadline(deadline):
+            try:
+                sql_query, results, fast_path = self._prepare(user_query)
+                
+                explanation = self._explain(user_query, results, sql_query, output_format)
+                
+                return {
+                    "query": user_query,
+                    "sql_query": sql_query,
+                    "results": results,
+                    "explanation": explanation,
+                    "fast_path": fast_path["pattern"] if fast_path else None,
+                    "span_id": trace.span_id
+                }
+            except Exception as e:
+                self.metrics.error(None, e)
+                return {
+                    "query": user_query,
+                    "error": str(e),
+                    "explanation": f"Ocorreu um erro ao processar sua consulta: {str(e)}",
+                    "span_id": trace.span_id
+                }
+    
+    def process_query_stream(self, user_query, output_format="direct"):
+        """
+        Process a natural language query and yield the answer text as it is generated
+        
+        Same pipeline as process_query, but the explanation is streamed from
+        Claude so the first words can be shown right away. The trace is only
+        current while the pipeline runs, never while a chunk is out with the
+        caller, so whatever the caller does on this thread between chunks is
+        not recorded in it.
         """
+        trace = self._start_trace("process_query_stream", query=user_query, output_format=output_format)
+        stream = None
         try:
-            # Generate SQL query from natural language
-            sql_query = self.claude_client.generate_sql(user_query, self.db_info)
+            with self.metrics.resume(trace):
+                try:
+                    sql_query, results, _ = self._prepare(user_query)
+                    failure = None
+                except Exception as e:
+                    self.metrics.error(None, e)
+                    failure = e
+                if failure is None:
+                    explanation = self._render(user_query, results, output_format)
+                    data_version = self.db_connector.get_data_version()
+                    if explanation is None and self.answer_cache and results is not None:
+                        explanation = self.answer_cache.get_explanation(user_query, sql_query, data_version, output_format)
+                        self.metrics.event("explanation_cache_hit" if explanation is not None else "explanation_cache_miss")
+                    if explanation is None:
+                        with self.metrics.stage("result_summary"):
+                            results_text = self._results_text(results)
+            if failure is not None:
+                yield f"Ocorreu um erro ao processar sua consulta: {str(failure)}"
+                return
+            if explanation is not None:
+                yield explanation
+                return
             
-            # Clean up query if needed
-            sql_query = sql_query.strip()
-            if sql_query.startswith("```sql"):
-                sql_query = sql_query.split("```sql")[1].split("```")[0].strip()
-            elif sql_query.startswith("```"):
-                sql_query = sql_query.split("```")[1].split("```")[0].strip()
+            # The explanation stage is timed by hand: only the time spent fetching chunks counts
+            chunks = []
+            elapsed = 0.0
+            stream = self.claude_client.explain_results_stream(user_query, results_text, sql_query, output_format)
+            while True:
+                with self.metrics.resume(trace):
+                    started = time.perf_counter()
+                    try:
+                        text = next(stream, None)
+                    except Exception as e:
+                        text, failure = None, e
+                    elapsed += time.perf_counter() - started
+                    if text is not None and not chunks:
+                        self.metrics.set("time_to_first_chunk_ms", round(elapsed * 1000, 3))
+                    if text is None:
+                        self.metrics.record_stage("explanation", elapsed)
+                        if failure is not None:
+                            self.metrics.error("explanation", failure)
+                        elif self.answer_cache and results is not None and chunks:
+                            self.answer_cache.set_explanation(user_query, sql_query, data_version, output_format, "".join(chunks))
+                if text is None:
+                    break
+                chunks.append(text)
+                yield text
+            if failure is not None:
+                yield f"\nOcorreu um erro ao gerar a resposta: {str(failure)}"
+        finally:
+            # Also reached when the caller stops iterating early
+            if stream is not None:
+                stream.close()
+            self.metrics.finish_trace(trace)
+    
+    def process_batch(self, questions, output_format="direct", use_batches_api=False, chunk_size=10, poll_interval=30):
+        """
+        Answer many questions at once, sharing work between them
+        
+        Repeated questions are answered once and identical SQL runs once. The
+        SQL generation and explanation left for Claude is grouped into
+        multi-question prompts of up to chunk_size questions, or sent through
+        the Message Batches API when use_batches_api is set (for offline jobs;
+        results may take minutes to hours). Returns one process_query-style
+        dict per question, in order.
+        """
+        with self._trace("process_batch", questions=len(questions), output_format=output_format):
+            return self._process_batch(questions, output_format, use_batches_api, chunk_size, poll_interval)
+    
+    def _process_batch(self, questions, output_format, use_batches_api, chunk_size, poll_interval):
+        """Body of process_batch, run inside its trace"""
+        items = {}
+        for question in questions:
+            items.setdefault(AnswerCache.normalize_question(question), {"query": question})
+        
+        # SQL from the template fast path or the SQL cache
+        for item in items.values():
+            try:
+                with self.metrics.stage("fast_path"):
+                    fast_path = self.intent_matcher.match(item["query"]) if self.intent_matcher else None
+                if fast_path:
+                    item["sql_query"] = self.query_executor.build_pattern_query(fast_path["pattern"], **fast_path["params"])
+                    item["fast_path"] = fast_path["pattern"]
+                    if self.query_executor.uses_analytics(fast_path["pattern"]):
+                        results = self._run_fast_path(fast_path, item["sql_query"])
+                        if results is None:
+                            item["error"] = "Falha ao executar a consulta SQL."
+                        else:
+                            item["results"] = results
+                elif self.answer_cache:
+                    item["cached_sql"] = self.answer_cache.get_sql(item["query"], self.schema_fingerprint)
+                    self.metrics.event("sql_cache_hit" if item["cached_sql"] is not None else "sql_cache_miss")
+            except Exception as e:
+                item["error"] = str(e)
+        self._run_batch_sql([item for item in items.values() if item.get("fast_path") and "results" not in item and "error" not in item])
+        
+        # A failed or empty template result falls back to the LLM, as in process_query
+        for item in items.values():
+            if item.get("fast_path") and ("error" in item or len(item["results"]) == 0):
+                for key in ("fast_path", "sql_query", "results", "error"):
+                    item.pop(key, None)
+            if self.intent_matcher and "error" not in item:
+                self.intent_matcher.record(bool(item.get("fast_path")))
+            if item.get("fast_path"):
+                self.metrics.event("fast_path")
+        
+        # Grouped SQL generation for the questions with neither a template nor cached SQL
+        pending = [item for item in items.values() if "error" not in item and not item.get("sql_query")]
+        to_generate = [item for item in pending if not item.get("cached_sql")]
+        if to_generate:
+            pending_questions = [item["query"] for item in to_generate]
+            with self.metrics.stage("example_retrieval"):
+                examples = [self._find_examples(question) for question in pending_questions]
+            with self.metrics.stage("sql_generation"):
+                generated = self.claude_client.generate_sql_many(
+                    pending_questions, self.schema_context.build(" ".join(pending_questions)),
+                    use_batches_api=use_batches_api, chunk_size=chunk_size, poll_interval=poll_interval,
+                    examples=examples
+                )
+            for item, sql_query in zip(to_generate, generated):
+                if sql_query is None:
+                    item["error"] = "Não foi possível gerar a consulta SQL (falha na API Claude)."
+                else:
+                    item["sql_query"] = self._clean_sql(sql_query)
+        
+        # Cached and generated SQL take the same guard -> run -> repair path as _run_generated_sql
+        for item in pending:
+            if item.get("cached_sql"):
+                item["sql_query"] = item["cached_sql"]
+            if "error" in item:
+                continue
+            # Rejected statements are repaired below; only a final failure counts as an error
+            with self.metrics.stage("sql_guard"):
+                try:
+                    item["sql_query"] = self.sql_guard.check(item["sql_query"])["sql"]
+                except ValueError as e:
+                    item["error"] = str(e)
+        self._run_batch_sql([item for item in pending if "error" not in item], timeout=self.sql_guard.timeout)
+        
+        # Failed statements get their own repair round trips
+        for item in pending:
+            if "error" in item and item.get("sql_query"):
+                try:
+                    item["sql_query"], item["results"], _ = self._run_generated_sql(
+                        item["query"], item.pop("sql_query"), error=item.pop("error"))
+                    item["repaired"] = True
+                except Exception as e:
+                    item["error"] = str(e)
+        
+        # Only cache SQL that actually ran
+        for item in pending:
+            if "error" not in item and (item.get("repaired") or not item.get("cached_sql")):
+                if self.answer_cache:
+                    self.answer_cache.set_sql(item["query"], self.schema_fingerprint, item["sql_query"])
+                self._learn_example(item["query"], item["sql_query"], item["results"])
+        
+        # Explanations: local rendering and cache first, the rest grouped
+        data_version = self.db_connector.get_data_version()
+        to_explain = []
+        for item in items.values():
+            if "error" in item:
+                continue
+            explanation = self._render(item["query"], item["results"], output_format)
+            if explanation is None and self.answer_cache:
+                explanation = self.answer_cache.get_explanation(item["query"], item["sql_query"], data_version, output_format)
+                self.metrics.event("explanation_cache_hit" if explanation is not None else "explanation_cache_miss")
+            if explanation is None:
+                to_explain.append(item)
+            item["explanation"] = explanation
+        
+        if to_explain:
+            with self.metrics.stage("result_summary"):
+                explain_items = [(item["query"], self._results_text(item["results"]), item["sql_query"]) for item in to_explain]
+            with self.metrics.stage("explanation"):
+                explanations = self.claude_client.explain_results_many(
+                    explain_items, output_format,
+                    use_batches_api=use_batches_api, chunk_size=chunk_size, poll_interval=poll_interval
+                )
+            for item, explanation in zip(to_explain, explanations):
+                item["explanation"] = explanation
+                if self.answer_cache and explanation is not None:
+                    self.answer_cache.set_explanation(item["query"], item["sql_query"], data_version, output_format, explanation)
+        
+        output = []
+        errors = [item for item in items.values() if "error" in item]
+        self.metrics.set("errors", len(errors))
+        for question in questions:
+            item = items[AnswerCache.normalize_question(question)]
+            if "error" in item:
+                output.append({
+                    "query": question,
+                    "error": item["error"],
+                    "explanation": f"Ocorreu um erro ao processar sua consulta: {item['error']}"
+                })
+            else:
+                output.append({
+                    "query": question,
+                    "sql_query": item["sql_query"],
+                    "results": item["results"],
+                    "explanation": item["explanation"],
+                    "fast_path": item.get("fast_path")
+                })
+        return output
+    
+    def _run_batch_sql(self, items, timeout=None):
+        """Run each distinct statement of a batch once and share its result between the items"""
+        groups = {}
+        for item in items:
+            groups.setdefault(" ".join(item["sql_query"].split()), []).append(item)
+        
+        for group in groups.values():
+            try:
+                results = self._execute_sql(group[0]["sql_query"], timeout=timeout)
+                error = None if results is not None else f"Falha ao executar a consulta SQL: {self.db_connector.last_error()}"
+            except Exception as e:
+                results, error = None, str(e)
+            for item in group:
+                if error:
+                    item["error"] = error
+                else:
+                    item["results"] = results
+    
+    def _prepare(self, user_query):
+        """Produce the SQL and its results for a question; returns (sql_query, results, fast_path)"""
+        with self.metrics.stage("fast_path"):
+            fast_path = self.intent_matcher.match(user_query) if self.intent_matcher else None
+            if fast_path:
+                sql_query = self.query_executor.build_pattern_query(fast_path["pattern"], **fast_path["params"])
+        if fast_path:
+            results = self._run_fast_path(fast_path, sql_query)
+            # An empty template result usually means the template does not fit; ask the LLM instead
+            if results is None or len(results) == 0:
+                fast_path = None
+        if self.intent_matcher:
+            self.intent_matcher.record(fast_path is not None)
+        if fast_path:
+            self.metrics.event("fast_path")
+            self.metrics.set("pattern", fast_path["pattern"])
+        
+        if fast_path is None:
+            sql_query, sql_from_cache = self._get_sql(user_query)
+            sql_query, results, repairs = self._run_generated_sql(user_query, sql_query)
             
-            # Execute the SQL query
-            results = self.query_executor.execute_sql(sql_query)
+            # Only cache SQL that actually ran
+            if self.answer_cache and (repairs or not sql_from_cache):
+                self.answer_cache.set_sql(user_query, self.schema_fingerprint, sql_query)
+            if repairs or not sql_from_cache:
+                self._learn_example(user_query, sql_query, results)
+        
+        return sql_query, results, fast_path
+    
+    def _run_generated_sql(self, user_query, sql_query, error=None):
+        """
+        Check and run model-generated SQL; returns (sql_query, results, repairs)
+        
+        The guard validates the statement locally (compiles it, corrects known
+        name typos) before anything runs. A statement the guard rejects or that
+        fails while running is sent back to Claude with the exact error, at most
+        max_repairs times; after that the error is raised instead of explaining
+        a missing result. Pass error to start with a repair of a statement that
+        already failed.
+        """
+        repairs = 0
+        failure = ValueError(error) if error else None
+        while True:
+            if failure is None:
+                # Reject non-SELECT/too costly statements and rewrite known slow shapes
+                with self.metrics.stage("sql_guard"):
+                    try:
+                        guard = self.sql_guard.check(sql_query)
+                    except ValueError as e:
+                        failure = e
+                if failure is None:
+                    sql_query = guard["sql"]
+                    if guard["rewrites"]:
+                        self.metrics.set("rewrites", guard["rewrites"])
+                    results = self._execute_sql(sql_query, timeout=self.sql_guard.timeout)
+                    if results is not None:
+                        return sql_query, results, repairs
+                    failure = RuntimeError(f"Falha ao executar a consulta SQL: {self.db_connector.last_error()}")
             
-            # Generate explanation of results
-            explanation = self.claude_client.explain_results(user_query, results, sql_query, output_format)
+            if repairs >= self.max_repairs:
+                self.metrics.error("sql_guard" if isinstance(failure, ValueError) else "sql_execution", failure)
+                raise failure
+            repairs += 1
+            self.metrics.event("sql_repair")
+            with self.metrics.stage("sql_repair"):
+                repaired = self.claude_client.repair_sql(user_query, self.schema_context.build(user_query), sql_query, str(failure))
+            if repaired is None:
+                raise failure
+            sql_query = self._clean_sql(repaired)
+            failure = None
+    
+    def _run_fast_path(self, fast_path, sql_query):
+        """Run a fast-path pattern in the analytics engine when it has the pattern, otherwise run its SQL"""
+        if self.query_executor.uses_analytics(fast_path["pattern"]):
+            try:
+                with self.metrics.stage("analytics"):
+                    results = self.query_executor.execute_pattern(fast_path["pattern"], **fast_path["params"])
+                self.metrics.set("row_count", len(results))
+                return results
+            except Exception as e:
+                # Answered with the pattern's SQL instead; keep the failure on the trace
+                self.metrics.error("analytics", e)
+                self.metrics.event("analytics_fallback")
+        return self._execute_sql(sql_query)
+    
+    def _get_sql(self, user_query):
+        """Return (sql, from_cache) for a question, asking Claude on a cache miss"""
+        if self.answer_cache:
+            with self.metrics.stage("sql_cache"):
+                sql_query = self.answer_cache.get_sql(user_query, self.schema_fingerprint)
+            self.metrics.event("sql_cache_hit" if sql_query is not None else "sql_cache_miss")
+            if sql_query is not None:
+                return sql_query, True
+        
+        with self.metrics.stage("example_retrieval"):
+            examples = self._find_examples(user_query)
+        
+        # Generate SQL query from natural language
+        with self.metrics.stage("sql_generation"):
+            sql_query = self.claude_client.generate_sql(user_query, self.schema_context.build(user_query), examples)
+            if sql_query is None:
+                raise RuntimeError("Não foi possível gerar a consulta SQL (falha na API Claude).")
+        with self.metrics.stage("sql_cleanup"):
+            return self._clean_sql(sql_query), False
+    
+    def _find_examples(self, user_query):
+        """Similar solved questions for the SQL prompt"""
+        if not self.example_index:
+            return []
+        examples = self.example_index.search(user_query, self.num_examples)
+        self.metrics.set("examples", len(examples))
+        return examples
+    
+    def _learn_example(self, user_query, sql_query, results):
+        """Keep generated SQL that ran and returned rows as a future example"""
+        if self.example_index and results is not None and len(results) > 0:
+            self.example_index.add(user_query, sql_query)
+    
+    @staticmethod
+    def _clean_sql(sql_query):
+        """Strip whitespace and Markdown code fences from generated SQL"""
+        sql_query = sql_query.strip()
+        if sql_query.startswith("```sql"):
+            sql_query = sql_query.split("```sql")[1].split("```")[0].strip()
+        elif sql_query.startswith("```"):
+            sql_query = sql_query.split("```")[1].split("```")[0].strip()
+        return sql_query
+    
+    def _execute_sql(self, sql_query, timeout=None):
+        """Run SQL on a read-only connection with the row budget, result summary and the question's deadline"""
+        deadline = getattr(self._local, "deadline", None)
+        if deadline is not None:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError("Tempo limite da pergunta excedido antes da consulta SQL")
+            timeout = min(timeout, remaining) if timeout else remaining
+        with self.metrics.stage("sql_execution"):
+            results = self.query_executor.execute_sql(
+                sql_query,
+                read_only=True,
+                max_rows=self.max_result_rows,
+                summarizer=ResultSummarizer(),
+                timeout=timeout
+            )
+        if results is not None:
+            self.metrics.set("row_count", int(results.attrs.get("row_count", len(results))))
+        return results
+    
+    def _results_text(self, results):
+        """Bounded text of a result for the explanation prompt"""
+        try:
+            return ResultSummarizer.summarize(results)
+        except Exception:
+            return str(results)[:4000]
+    
+    def _explain(self, user_query, results, sql_query, output_format):
+        """Return the (cached) explanation of a query result"""
+        explanation = self._render(user_query, results, output_format)
+        if explanation is not None:
+            return explanation
+        
+        data_version = self.db_connector.get_data_version()
+        if self.answer_cache and results is not None:
+            explanation = self.answer_cache.get_explanation(user_query, sql_query, data_version, output_format)
+            self.metrics.event("explanation_cache_hit" if explanation is not None else "explanation_cache_miss")
+        
+        if explanation is None:
+            with self.metrics.stage("result_summary"):
+                results_text = self._results_text(results)
             
-            return {
-                "query": user_query,
-                "sql_query": sql_query,
-                "results": results,
-                "explanation": explanation
-            }
-        except Exception as e:
-            return {
-                "query": user_query,
-                "error": str(e),
-                "explanation": f"Ocorreu um erro ao processar sua consulta: {str(e)}"
-            }
+            # Generate explanation of results
+            with self.metrics.stage("explanation"):
+                explanation = self.claude_client.explain_results(user_query, results_text, sql_query, output_format)
+            if self.answer_cache and results is not None and explanation is not None:
+                self.answer_cache.set_explanation(user_query, sql_query, data_version, output_format, explanation)
+        return explanation
+    
+    def _render(self, user_query, results, output_format):
+        """Render small results locally; None means Claude should write the answer"""
+        if not self.renderer or results is None:
+            return None
+        with self.metrics.stage("render"):
+            explanation = self.renderer.render(user_query, results, output_format)
+        if explanation is not None:
+            self.metrics.event("rendered_locally")
+        return explanation
+    
+    def get_render_stats(self):
+        """Return how many answers were rendered without calling Claude"""
+        if not self.renderer:
+            return {}
+        return self.renderer.get_stats()
+    
+    def get_metrics_stats(self):
+        """Return per-stage latency percentiles and pipeline counters"""
+        return self.metrics.get_stats()
+    
+    def export_metrics(self, path=None):
+        """Return the metrics as Prometheus text, also writing them to path when given"""
+        if path:
+            self.metrics.write_prometheus(path)
+        return self.metrics.to_prometheus()
+    
+    def get_token_stats(self):
+        """Return Claude token totals, including prompt cache reads and writes"""
+        return self.claude_client.get_usage_stats()
+    
+    def get_fast_path_stats(self):
+        """Return how many questions skipped LLM SQL generation"""
+        if not self.intent_matcher:
+            return {}
+        return self.intent_matcher.get_stats()
+    
+    def get_result_cache_stats(self):
+        """Return query result cache hit/miss counters and sizes"""
+        if not self.result_cache:
+            return {}
+        return self.result_cache.get_stats()
+    
+    def get_example_stats(self):
+        """Return how many few-shot examples are indexed, by source"""
+        if not self.example_index:
+            return {}
+        return self.example_index.get_stats()
+    
+    def get_cache_stats(self):
+        """Return answer cache hit/miss counters"""
+        if not self.answer_cache:
+            return {}
+        return self.answer_cache.get_stats()
     
     def generate_example_questions(self, num_questions=30):
         """Generate example questions for the RAG system"""
         return self.question_generator.generate_questions(num_questions)
     
     def save_example_questions(self, filename="perguntas_exemplo.json", num_questions=30):
-        """Generate and save example questions to a file"""
-        questions = self.generate_example_questions(num_questions)
-        with open(filename, "w", encoding="utf-8") as f:
-            json.dump(questions, f, indent=2, ensure_ascii=False)
-        return questions
+        """Top up the example questions in a file to num_questions (only the missing ones are generated)"""
+        return self.question_generator.top_up(filename, num_questions)
+    
+    def save_example_questions_in_background(self, filename="perguntas_exemplo.json", num_questions=30):
+        """Top up the example questions in a daemon thread unless the file has enough; returns the thread or None"""
+        if os.path.exists(filename):
+            try:
+                if len(self.load_example_questions(filename)) >= num_questions:
+                    return None
+            except ValueError:
+                pass
+        
+        thread = threading.Thread(target=self.save_example_questions, args=(filename, num_questions), daemon=True)
+        thread.start()
+        return thread
     
     def load_example_questions(self, filename="perguntas_exemplo.json"):
         """Load example questions from a file"""
@@ -99,31 +675,32 @@ class RAGSystem:
         """Return default example questions"""
         return self.question_generator.get_default_questions()
     
-    def evaluate_on_examples(self, examples=None, save_results=True, output_format="direct"):
-        """Evaluate the RAG system on example questions"""
+    def evaluate_on_examples(self, examples=None, save_results=True, output_format="direct",
+                             max_workers=4, timeout=120, output_file="resultados_avaliacao.json"):
+        """
+        Evaluate the RAG system on example questions
+        
+        Questions run concurrently (up to max_workers at a time, each limited to
+        timeout seconds). When save_results is set, every result is appended to
+        a JSONL file as soon as it finishes, so an interrupted run keeps what it
+        already processed; the full list is written to output_file at the end.
+        """
         if examples is None:
             examples = self.get_default_questions()
         
-        results = []
-        
-        for i, question in enumerate(examples):
-            print(f"Processando pergunta {i+1}/{len(examples)}: {question}")
-            try:
-                result = self.process_query(question, output_format)
-                results.append(result)
-            except Exception as e:
-                results.append({
-                    "query": question,
-                    "error": str(e)
-                })
+        runner = EvaluationRunner(
+            lambda question, deadline: self.process_query(question, output_format, deadline=deadline),
+            max_workers=max_workers,
+            timeout=timeout
+        )
+        jsonl_path = os.path.splitext(output_file)[0] + ".jsonl" if save_results else None
+        results = runner.run(examples, jsonl_path=jsonl_path)
         
         if save_results:
-            with open("resultados_avaliacao.json", "w", encoding="utf-8") as f:
+            with open(output_file, "w", encoding="utf-8") as f:
                 # Convert DataFrame to dictionary before serialization
-                for result in results:
-                    if "results" in result and isinstance(result["results"], pd.DataFrame):
-                        result["results"] = result["results"].to_dict(orient="records")
-                json.dump(results, f, indent=2, ensure_ascii=False)
+                serializable = [EvaluationRunner.to_serializable(result) for result in results]
+                json.dump(serializable, f, indent=2, ensure_ascii=False, default=str)
         
         return results
 
@@ -142,10 +719,12 @@ if __name__ == "__main__":
     # Initialize RAG system
     rag_system = RAGSystem(api_key=api_key)
     
-    # Generate and save example questions
-    print("Gerando perguntas de exemplo...")
-    questions = rag_system.save_example_questions()
-    print(f"Foram geradas {len(questions)} perguntas de exemplo.")
+    # Example questions are only generated when missing, without blocking the prompt
+    if rag_system.save_example_questions_in_background():
+        print("Gerando perguntas de exemplo em segundo plano...")
+    
+    # Load pandas while the user types the first question
+    threading.Thread(target=__import__, args=("pandas",), daemon=True).start()
     
     # Interactive mode
     print("\nEntrando no modo interativo. Digite 'sair' para encerrar.")
@@ -166,10 +745,7 @@ if __name__ == "__main__":
         else:
             query = user_input
         
-        result = rag_system.process_query(query, output_format)
-        
-        # Mostrar apenas a explicação/resposta final
-        if "error" in result:
-            print(f"Erro: {result['error']}")
-        else:
-            print(result["explanation"]) 
\ No newline at end of file
+        # Mostrar apenas a resposta final, à medida que é gerada
+        for text in rag_system.process_query_stream(query, output_format):
+            print(text, end="", flush=True)
+        print() 
\ No newline at end of file
@@ -0,0 +1,244 @@
+import math
+import numbers
+import re
+import threading
+import unicodedata
+
+class ResponseRenderer:
+    """Render small query results as Portuguese text without calling the LLM"""
+
+    FORMATS = ("direct", "bullet", "summary")
+
+    # Questions that ask for interpretation rather than numbers go to the LLM
+    NARRATIVE_WORDS = ["por que", "porque", "explique", "explica", "analise", "analisar", "compar", "tendencia",
+                       "evolu", "insight", "recomend", "sugest", "motivo", "cresc", "padrao", "padroes"]
+
+    LABELS = {
+        "loja_nome": "Loja", "loja": "Loja", "data": "Data", "hora": "Hora", "mes": "Mês", "ano": "Ano",
+        "dia": "Dia", "dia_semana": "Dia da semana", "total": "Total", "total_liquido": "Total líquido",
+        "total_bruto": "Total bruto", "total_desconto": "Total de descontos", "total_custo": "Custo total",
+        "total_requisicao": "Requisições", "tiket_medio": "Ticket médio", "ticket_medio": "Ticket médio",
+        "desconto_medio": "Desconto médio", "desconto_medio_p": "Desconto médio (%)", "total_itens": "Itens",
+        "itens_por_requisicao": "Itens por requisição", "total_projecao": "Projeção", "dinheiro": "Dinheiro",
+        "cheque": "Cheque", "cheque_pre": "Cheque pré-datado", "cartao": "Cartão", "convenio": "Convênio",
+        "deposito": "Depósito", "outros": "Outros", "devolucao_liquido": "Devoluções",
+        "entregas_req": "Entregas", "max_entregas": "Máximo de entregas", "total_req": "Requisições"
+    }
+
+    AGGREGATE_LABELS = {"sum": "Soma de", "avg": "Média de", "max": "Máximo de", "min": "Mínimo de", "count": "Quantidade de"}
+
+    # Whole name tokens (checked in order) telling counts and percentages apart from money
+    PERCENT_HINTS = {"p", "percent", "percentual", "pct", "perc", "porcentagem"}
+    COUNT_HINTS = {"count", "quantidade", "qtd", "qtde", "requisicao", "requisicoes", "req", "itens", "entregas",
+                   "hora", "horas", "hr", "dia", "dias", "mes", "meses", "ano", "anos", "numero", "num", "linhas",
+                   "registros"}
+    MONEY_HINTS = {"total", "valor", "vlr", "venda", "vendas", "liquido", "bruto", "receita", "faturamento", "lucro",
+                   "ticket", "tiket", "custo", "desconto", "projecao", "dinheiro", "cheque", "cartao", "convenio",
+                   "deposito", "outros", "devolucao", "pbm", "beneficio", "subsidio", "media", "medio", "soma",
+                   "max", "min"}
+    # Money tokens that win over count tokens ("total_liquido_dia" is money, "total_requisicao" a count)
+    MONEY_OVERRIDES = {"liquido", "bruto", "valor", "vlr", "custo", "ticket", "tiket"}
+    # Money tokens that only describe an aggregate; an integer column named like this is a count ("COUNT(*) AS total")
+    GENERIC_HINTS = {"total", "soma", "max", "min", "media", "medio", "venda", "vendas"}
+    SQL_WORDS = {"distinct", "as", "integer", "int", "real", "text", "numeric", "null", "and", "or", "not", "is",
+                 "case", "when", "then", "else", "end"}
+
+    WEEKDAYS = ["domingo", "segunda-feira", "terça-feira", "quarta-feira", "quinta-feira", "sexta-feira", "sábado"]
+
+    def __init__(self, max_rows=10, max_columns=5):
+        """Initialize with the largest table rendered locally"""
+        self.max_rows = max_rows
+        self.max_columns = max_columns
+        self.stats = {"local": 0, "llm": 0}
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def _normalize(text):
+        """Lowercase and strip accents"""
+        text = unicodedata.normalize("NFKD", str(text).lower())
+        return "".join(c for c in text if not unicodedata.combining(c))
+
+    def label(self, column):
+        """Human-readable label of a result column"""
+        name = column.strip().strip('"')
+        match = re.fullmatch(r"(\w+)\s*\(\s*(?:DISTINCT\s+)?(?:\w+\.)?([\w*]+)\s*\)", name, re.IGNORECASE)
+        if match and match.group(1).lower() in self.AGGREGATE_LABELS:
+            inner = "registros" if match.group(2) == "*" else self.label(match.group(2)).lower()
+            return f"{self.AGGREGATE_LABELS[match.group(1).lower()]} {inner}"
+        name = name.split(".")[-1]
+        if name.lower() in self.LABELS:
+            return self.LABELS[name.lower()]
+        return name.replace("_", " ").strip().capitalize()
+
+    def _kind(self, column, values=None):
+        """
+        Classify a numeric column as "count", "percent" or "money", or None when unsure
+
+        COUNT(...) is always a count and other expressions are classified by
+        the single column they use; names are matched by whole tokens. With
+        the column values, an integer column whose name only has generic
+        hints ("total", "max") is a count, and an unknown name is a count
+        when integer and None otherwise.
+        """
+        import pandas as pd
+        
+        name = self._normalize(column).strip().strip('"')
+        integer = values is not None and pd.api.types.is_integer_dtype(values)
+        if re.fullmatch(r"count\s*\(.*\)", name, re.DOTALL) and "(" not in name[name.index("(") + 1:]:
+            return "count"
+        if not re.fullmatch(r"[\w.]+", name):
+            expression = re.sub(r"'[^']*'|\b\w+\.", "", name)
+            identifiers = set(re.findall(r"\b([a-z_]\w*)\b(?!\s*\()", expression)) - self.SQL_WORDS
+            if len(identifiers) != 1:
+                return "count" if not identifiers and re.search(r"\bcount\s*\(", expression) else None
+            name = identifiers.pop()
+
+        tokens = set(re.split(r"[^a-z0-9]+", name.split(".")[-1])) - {""}
+        if tokens & self.PERCENT_HINTS:
+            return "percent"
+        if tokens & self.COUNT_HINTS and not tokens & self.MONEY_OVERRIDES:
+            return "count"
+        money = tokens & self.MONEY_HINTS
+        if money:
+            return "count" if integer and money <= self.GENERIC_HINTS else "money"
+        if integer or values is None:
+            return "count"
+        return None
+
+    @staticmethod
+    def _number(value, decimals):
+        """Format a number the Brazilian way (1.234,56)"""
+        text = f"{value:,.{decimals}f}"
+        return text.replace(",", "_").replace(".", ",").replace("_", ".")
+
+    def format_value(self, column, value, kind=None):
+        """Format a single cell for display (kind as returned by _kind; guessed from the name when omitted)"""
+        if value is None or (isinstance(value, float) and math.isnan(value)):
+            return "sem dados"
+        name = self._normalize(column).split(".")[-1]
+
+        if isinstance(value, str):
+            if re.fullmatch(r"_\w+_", value):
+                return value.strip("_")
+            date = re.fullmatch(r"(\d{4})-(\d{2})-(\d{2})(?:[T ](\d{2}):(\d{2}).*)?", value)
+            if date:
+                year, month, day, hour, minute = date.groups()
+                text = f"{day}/{month}/{year}"
+                if hour and (hour, minute) != ("00", "00"):
+                    text += f" {hour}:{minute}"
+                return text
+            return value
+
+        if isinstance(value, bool) or not isinstance(value, numbers.Number):
+            return str(value)
+        value = float(value)
+
+        if name == "dia_semana" and value.is_integer() and 0 <= value <= 6:
+            return self.WEEKDAYS[int(value)]
+        if name == "hora" and value.is_integer():
+            return f"{int(value)}h"
+
+        kind = kind or self._kind(column) or "count"
+        if kind == "money":
+            return f"R$ {self._number(value, 2)}"
+        if kind == "percent":
+            return f"{self._number(value, 2)}%"
+        return self._number(value, 0 if value.is_integer() else 2)
+
+    def needs_llm(self, question, results, output_format):
+        """Check whether a result needs a narrative answer from the LLM"""
+        import pandas as pd
+        
+        if output_format not in self.FORMATS or not isinstance(results, pd.DataFrame):
+            return True
+        if results.attrs.get("truncated"):
+            return True
+        if len(results) == 0:
+            return False
+        if len(results) > self.max_rows or len(results.columns) > self.max_columns:
+            return True
+        # A number whose unit cannot be told is better explained by the LLM than mislabeled
+        if any(kind is None for kind in self._kinds(results).values()):
+            return True
+        text = self._normalize(question)
+        return any(word in text for word in self.NARRATIVE_WORDS)
+
+    def _kinds(self, results):
+        """Return {column: kind} for the numeric columns of a result"""
+        import pandas as pd
+        
+        return {
+            column: self._kind(column, results[column]) for column in results.columns
+            if pd.api.types.is_numeric_dtype(results[column]) and not pd.api.types.is_bool_dtype(results[column])
+        }
+
+    def _row_text(self, row, columns, kinds, separator=", "):
+        """Render one row as "label: value" pairs (a leading text column becomes the row title)"""
+        values = [(column, self.format_value(column, row[column], kinds.get(column))) for column in columns]
+        first_column, first_value = values[0]
+        if len(values) > 1 and isinstance(row[first_column], str):
+            rest = separator.join(f"{self.label(column)}: {value}" for column, value in values[1:])
+            return f"{first_value} — {rest}"
+        return separator.join(f"{self.label(column)}: {value}" for column, value in values)
+
+    def _summary(self, results):
+        """One or two sentences about a small table (only label + single numeric column)"""
+        import pandas as pd
+        
+        columns = list(results.columns)
+        numeric = [c for c in columns if pd.api.types.is_numeric_dtype(results[c]) and not pd.api.types.is_bool_dtype(results[c])]
+        labels = [c for c in columns if c not in numeric]
+        if len(numeric) != 1 or len(labels) != 1 or results[numeric[0]].isna().all():
+            return None
+
+        value_column, label_column = numeric[0], labels[0]
+        ordered = results.dropna(subset=[value_column]).sort_values(value_column, ascending=False)
+        top, bottom = ordered.iloc[0], ordered.iloc[-1]
+        kind = self._kind(value_column, results[value_column])
+        fmt = lambda row: f"{self.format_value(label_column, row[label_column])} ({self.format_value(value_column, row[value_column], kind)})"
+        text = f"{self.label(value_column)}: maior em {fmt(top)}"
+        if len(ordered) > 1:
+            text += f" e menor em {fmt(bottom)}"
+        if kind == "money" and len(ordered) > 1:
+            text += f"; soma de {self.format_value(value_column, ordered[value_column].sum(), kind)}"
+        return text + "."
+
+    def render(self, question, results, output_format="direct"):
+        """Return the answer text for a small result, or None when the LLM should write it"""
+        if self.needs_llm(question, results, output_format):
+            self._record(False)
+            return None
+
+        columns = list(results.columns)
+        kinds = self._kinds(results)
+        text = None
+        if len(results) == 0:
+            text = "Nenhum dado encontrado para essa pergunta."
+        elif len(results) == 1 and len(columns) == 1:
+            value = self.format_value(columns[0], results.iloc[0, 0], kinds.get(columns[0]))
+            text = f"- {self.label(columns[0])}: {value}" if output_format == "bullet" else f"{self.label(columns[0])}: {value}."
+        elif len(results) == 1:
+            row = results.iloc[0]
+            if output_format == "bullet":
+                text = "\n".join(f"- {self.label(c)}: {self.format_value(c, row[c], kinds.get(c))}" for c in columns)
+            else:
+                text = self._row_text(row, columns, kinds, separator="; ") + "."
+        elif output_format == "summary":
+            text = self._summary(results)
+        else:
+            prefix = "- " if output_format == "bullet" else ""
+            text = "\n".join(prefix + self._row_text(row, columns, kinds) for _, row in results.iterrows())
+
+        self._record(text is not None)
+        return text
+
+    def _record(self, local):
+        """Count an answer as rendered locally or left to the LLM"""
+        with self.lock:
+            self.stats["local" if local else "llm"] += 1
+
+    def get_stats(self):
+        """Return how many answers were rendered locally vs. left to the LLM"""
+        with self.lock:
+            total = self.stats["local"] + self.stats["llm"]
+            return dict(self.stats, local_rate=self.stats["local"] / total if total else 0.0)
@@ -0,0 +1,168 @@
+import hashlib
+import os
+import pickle
+import re
+import threading
+from collections import OrderedDict
+
+class ResultCache:
+    """Size-capped LRU of pickled query results keyed on normalized SQL, with optional spill to disk"""
+
+    def __init__(self, max_bytes=32 * 1024 * 1024, spill_dir=None, max_spill_bytes=256 * 1024 * 1024, max_entry_bytes=None):
+        """Initialize with the memory budget, an optional spill directory and its budget (bytes)"""
+        self.max_bytes = max_bytes
+        self.spill_dir = spill_dir
+        self.max_spill_bytes = max_spill_bytes
+        # One result may take at most a quarter of the memory budget by default
+        self.max_entry_bytes = max_entry_bytes if max_entry_bytes is not None else max_bytes // 4
+        self.lock = threading.Lock()
+        self.memory = OrderedDict()
+        self.memory_bytes = 0
+        self.spilled = OrderedDict()
+        self.spilled_bytes = 0
+        self.stats = {"hits": 0, "disk_hits": 0, "misses": 0, "stores": 0, "evictions": 0, "invalidations": 0}
+
+        if spill_dir:
+            os.makedirs(spill_dir, exist_ok=True)
+            # Spilled files of an earlier process cannot be validated; start empty
+            for name in os.listdir(spill_dir):
+                if re.fullmatch(r"[0-9a-f]{64}\.pkl", name):
+                    os.remove(os.path.join(spill_dir, name))
+
+    @staticmethod
+    def normalize_sql(sql):
+        """Collapse whitespace and lowercase everything outside string literals"""
+        parts = re.split(r"('(?:[^']|'')*')", sql.strip().rstrip(";").strip())
+        return "".join(part if part.startswith("'") else re.sub(r"\s+", " ", part.lower()) for part in parts)
+
+    @classmethod
+    def make_key(cls, sql, *options):
+        """Cache key of a statement and the options that shape its result"""
+        payload = "\x1f".join([cls.normalize_sql(sql)] + [str(option) for option in options])
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key, version):
+        """Return a fresh copy of the cached result, or None when missing or computed for another data version"""
+        with self.lock:
+            entry = self.memory.get(key)
+            if entry is not None:
+                if entry[0] == version:
+                    self.memory.move_to_end(key)
+                    self.stats["hits"] += 1
+                    return pickle.loads(entry[1])
+                self._drop_memory(key)
+                self.stats["invalidations"] += 1
+
+            spilled = self.spilled.pop(key, None)
+            if spilled is not None:
+                spill_version, path, size = spilled
+                self.spilled_bytes -= size
+                if spill_version == version:
+                    try:
+                        with open(path, "rb") as f:
+                            payload = f.read()
+                    except OSError:
+                        payload = None
+                    if payload is not None:
+                        self.stats["disk_hits"] += 1
+                        if size > self.max_entry_bytes:
+                            # Too large for memory: stays on disk, now most recently used
+                            self.spilled[key] = spilled
+                            self.spilled_bytes += size
+                        else:
+                            self._remove_file(path)
+                            self._put_memory(key, version, payload)
+                        return pickle.loads(payload)
+                    self._remove_file(path)
+                else:
+                    self._remove_file(path)
+                    self.stats["invalidations"] += 1
+
+            self.stats["misses"] += 1
+            return None
+
+    def set(self, key, version, result):
+        """Store a result computed for a data version"""
+        payload = pickle.dumps(result, protocol=pickle.HIGHEST_PROTOCOL)
+        with self.lock:
+            if key in self.memory:
+                self._drop_memory(key)
+            if len(payload) > self.max_entry_bytes:
+                self._spill(key, version, payload)
+            else:
+                self._put_memory(key, version, payload)
+            self.stats["stores"] += 1
+
+    def _put_memory(self, key, version, payload):
+        """Add an entry in memory and evict (or spill) the least recently used ones over budget (caller holds the lock)"""
+        self.memory[key] = (version, payload)
+        self.memory_bytes += len(payload)
+        while self.memory_bytes > self.max_bytes and len(self.memory) > 1:
+            old_key = next(iter(self.memory))
+            old_version, old_payload = self.memory[old_key]
+            self._drop_memory(old_key)
+            self.stats["evictions"] += 1
+            self._spill(old_key, old_version, old_payload)
+
+    def _drop_memory(self, key):
+        """Remove an entry from memory (caller holds the lock)"""
+        _, payload = self.memory.pop(key)
+        self.memory_bytes -= len(payload)
+
+    def _spill(self, key, version, payload):
+        """Write an entry to the spill directory, if any, keeping it under its budget (caller holds the lock)"""
+        if not self.spill_dir or len(payload) > self.max_spill_bytes:
+            return
+        old = self.spilled.pop(key, None)
+        if old is not None:
+            self.spilled_bytes -= old[2]
+            self._remove_file(old[1])
+        path = os.path.join(self.spill_dir, f"{key}.pkl")
+        try:
+            with open(path, "wb") as f:
+                f.write(payload)
+        except OSError as e:
+            print(f"Não foi possível gravar o resultado em disco: {e}")
+            return
+        self.spilled[key] = (version, path, len(payload))
+        self.spilled_bytes += len(payload)
+        while self.spilled_bytes > self.max_spill_bytes:
+            _, (_, old_path, size) = self.spilled.popitem(last=False)
+            self.spilled_bytes -= size
+            self._remove_file(old_path)
+
+    @staticmethod
+    def _remove_file(path):
+        """Delete a spilled file, ignoring errors"""
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def clear(self):
+        """Drop every cached result"""
+        with self.lock:
+            for _, path, _ in self.spilled.values():
+                self._remove_file(path)
+            self.memory.clear()
+            self.spilled.clear()
+            self.memory_bytes = 0
+            self.spilled_bytes = 0
+            self.stats["invalidations"] += 1
+
+    def on_ingest(self, table, inserted, updated):
+        """DatabaseConnector ingest hook: results computed before the load are stale"""
+        self.clear()
+
+    def get_stats(self):
+        """Return hit/miss counters and current sizes"""
+        with self.lock:
+            lookups = self.stats["hits"] + self.stats["disk_hits"] + self.stats["misses"]
+            return dict(
+                self.stats,
+                hit_rate=(self.stats["hits"] + self.stats["disk_hits"]) / lookups if lookups else 0.0,
+                entries=len(self.memory),
+                memory_bytes=self.memory_bytes,
+                spilled_entries=len(self.spilled),
+                spilled_bytes=self.spilled_bytes
+            )
@@ -0,0 +1,91 @@
+class ResultSummarizer:
+    """Accumulate a bounded digest of a query result (head, row count, numeric aggregates)"""
+
+    def __init__(self, head_rows=20, max_chars=4000):
+        """Initialize with the number of rows to keep and the digest size limit"""
+        self.head_rows = head_rows
+        self.max_chars = max_chars
+        self.columns = None
+        self.head = []
+        self.head_count = 0
+        self.row_count = 0
+        self.numeric = {}
+
+    def update(self, chunk):
+        """Fold a DataFrame chunk into the digest"""
+        import pandas as pd
+        
+        if self.columns is None:
+            self.columns = list(chunk.columns)
+
+        missing = self.head_rows - self.head_count
+        if missing > 0:
+            self.head.append(chunk.head(missing))
+            self.head_count += min(missing, len(chunk))
+        self.row_count += len(chunk)
+
+        for col in chunk.columns:
+            if not pd.api.types.is_numeric_dtype(chunk[col]) or pd.api.types.is_bool_dtype(chunk[col]):
+                continue
+            values = chunk[col].dropna()
+            if values.empty:
+                continue
+            stats = self.numeric.setdefault(col, {"count": 0, "sum": 0.0, "min": None, "max": None})
+            stats["count"] += len(values)
+            stats["sum"] += float(values.sum())
+            low, high = float(values.min()), float(values.max())
+            stats["min"] = low if stats["min"] is None else min(stats["min"], low)
+            stats["max"] = high if stats["max"] is None else max(stats["max"], high)
+
+    def copy_from(self, other):
+        """Take over the digest of another summarizer (e.g. one cached with the result); returns self"""
+        # head_rows comes along because it decided what the head holds; max_chars stays ours
+        self.head_rows = other.head_rows
+        self.columns = list(other.columns) if other.columns is not None else None
+        self.head = list(other.head)
+        self.head_count = other.head_count
+        self.row_count = other.row_count
+        self.numeric = {col: dict(stats) for col, stats in other.numeric.items()}
+        return self
+
+    def get_head(self):
+        """Return the kept leading rows as a DataFrame"""
+        import pandas as pd
+        
+        if not self.head:
+            return pd.DataFrame(columns=self.columns or [])
+        return pd.concat(self.head, ignore_index=True)
+
+    def _truncate(self, text):
+        """Cut the text to the size limit"""
+        if len(text) <= self.max_chars:
+            return text
+        return text[:self.max_chars] + "\n... (truncado)"
+
+    def to_text(self):
+        """Return the digest as text for the LLM prompt"""
+        head = self.get_head()
+        if self.row_count <= self.head_rows:
+            return self._truncate(head.to_string())
+
+        # Row count and aggregates go first so truncation only shortens the head
+        lines = [f"Total de linhas: {self.row_count} (mostrando as primeiras {len(head)})"]
+        if self.numeric:
+            lines.append("Agregados sobre todas as linhas:")
+            for col, stats in self.numeric.items():
+                mean = stats["sum"] / stats["count"]
+                lines.append(
+                    f"- {col}: soma={stats['sum']:.2f}, média={mean:.2f}, "
+                    f"mín={stats['min']:.2f}, máx={stats['max']:.2f}"
+                )
+        lines.append(head.to_string())
+        return self._truncate("\n".join(lines))
+
+    @classmethod
+    def summarize(cls, df, head_rows=20, max_chars=4000):
+        """Return the digest text of a DataFrame (uses a precomputed summary in df.attrs when present)"""
+        summary = df.attrs.get("summary")
+        if summary is None:
+            summary = cls(head_rows, max_chars)
+            summary.update(df)
+        return summary.to_text()
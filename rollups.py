@@ -0,0 +1,234 @@
+import sqlite3
+
+class RollupManager:
+    """Maintain pre-aggregated per-store rollup tables with incremental refresh"""
+
+    # Payment method columns kept (as per-day maximum, like the metodos_pagamento pattern)
+    PAYMENT_COLUMNS = ["dinheiro", "cheque", "cartao", "convenio", "deposito", "outros"]
+
+    # Rollup-backed equivalents of QueryExecutor.query_patterns
+    ROUTES = {
+        "vendas_por_mes": "SELECT loja_nome, SUM(total_liquido) as total FROM rollup_mensal WHERE fonte = 'dados_mensais' AND mes >= substr('{start}', 1, 7) AND mes < substr('{end}', 1, 7) GROUP BY loja_nome",
+        "vendas_por_dia": "SELECT loja_nome, SUM(total_liquido) as total FROM rollup_diario WHERE fonte = 'dados_diarios' AND data >= '{start}' AND data < '{end}' GROUP BY loja_nome",
+        "max_vendas_por_hora": "SELECT loja_nome, MAX(max_total_liquido) as total_liquido, data, hora_max as hora FROM rollup_diario WHERE fonte = 'dados_diarios' AND data >= '{start}' AND data < '{end}' GROUP BY loja_nome",
+        "metodos_pagamento": "SELECT data, loja_nome, dinheiro, cheque, cartao, convenio, deposito, outros FROM rollup_diario WHERE fonte = 'dados_mensais' ORDER BY data DESC, loja_nome",
+        "vendas_por_hora_do_dia": "SELECT loja_nome, hora, SUM(total_liquido) as total FROM rollup_hora WHERE fonte = 'dados_diarios' AND hora >= 0 GROUP BY loja_nome, hora ORDER BY loja_nome, hora",
+        "vendas_por_dia_semana": "SELECT loja_nome, dia_semana, SUM(total_liquido) as total FROM rollup_hora WHERE fonte = 'dados_diarios' GROUP BY loja_nome, dia_semana ORDER BY loja_nome, dia_semana"
+    }
+
+    # Used instead of ROUTES when the date range does not start and end on the first of a month
+    DAY_ROUTES = {
+        "vendas_por_mes": "SELECT loja_nome, SUM(total_liquido) as total FROM rollup_diario WHERE fonte = 'dados_mensais' AND data >= '{start}' AND data < '{end}' GROUP BY loja_nome"
+    }
+
+    def __init__(self, db_connector, sources=None):
+        """Initialize with a DatabaseConnector and the source tables to roll up"""
+        self.db_connector = db_connector
+        self.sources = sources
+        self._initialized = False
+        # is_current() result and the get_data_version() it was computed for
+        self._current = False
+        self._checked_version = None
+
+    def _conn(self):
+        """Return the connector's open connection"""
+        return self.db_connector.conn or self.db_connector.connect()
+
+    def _get_sources(self):
+        """Return the tables that can be rolled up"""
+        if self.sources is None:
+            required = {"index", "data", "loja_nome", "total_liquido", "hora"}
+            self.sources = [
+                table for table in self.db_connector.get_tables()
+                if not table.startswith("rollup_")
+                and required <= {col["name"] for col in self.db_connector.get_table_schema(table)}
+            ]
+        return self.sources
+
+    def create_tables(self):
+        """Create the rollup and watermark tables if needed"""
+        payment_defs = ", ".join(f"{col} REAL" for col in self.PAYMENT_COLUMNS)
+        conn = self._conn()
+        with self.db_connector.lock:
+            conn.executescript(f"""
+                CREATE TABLE IF NOT EXISTS rollup_diario (
+                    fonte TEXT NOT NULL,
+                    loja_nome TEXT NOT NULL,
+                    data TEXT NOT NULL,
+                    linhas INTEGER NOT NULL DEFAULT 0,
+                    total_liquido REAL NOT NULL DEFAULT 0,
+                    max_total_liquido REAL,
+                    hora_max REAL,
+                    {payment_defs},
+                    PRIMARY KEY (fonte, loja_nome, data)
+                );
+                CREATE TABLE IF NOT EXISTS rollup_mensal (
+                    fonte TEXT NOT NULL,
+                    loja_nome TEXT NOT NULL,
+                    mes TEXT NOT NULL,
+                    linhas INTEGER NOT NULL DEFAULT 0,
+                    total_liquido REAL NOT NULL DEFAULT 0,
+                    PRIMARY KEY (fonte, loja_nome, mes)
+                );
+                CREATE TABLE IF NOT EXISTS rollup_hora (
+                    fonte TEXT NOT NULL,
+                    loja_nome TEXT NOT NULL,
+                    dia_semana INTEGER NOT NULL,
+                    hora REAL NOT NULL,
+                    linhas INTEGER NOT NULL DEFAULT 0,
+                    total_liquido REAL NOT NULL DEFAULT 0,
+                    tiket_medio REAL NOT NULL DEFAULT 0,
+                    entregas_req REAL NOT NULL DEFAULT 0,
+                    PRIMARY KEY (fonte, loja_nome, dia_semana, hora)
+                );
+                CREATE TABLE IF NOT EXISTS rollup_watermark (
+                    fonte TEXT PRIMARY KEY,
+                    max_index INTEGER NOT NULL
+                );
+            """)
+        self._initialized = True
+
+    def _refresh_source(self, cursor, table, watermark):
+        """Fold rows of a source table with index > watermark into the rollups"""
+        payment_select = ", ".join(f"MAX({col})" for col in self.PAYMENT_COLUMNS)
+        payment_update = ", ".join(
+            f"{col} = CASE WHEN {col} IS NULL OR excluded.{col} > {col} THEN excluded.{col} ELSE {col} END"
+            for col in self.PAYMENT_COLUMNS
+        )
+        params = {"fonte": table, "watermark": watermark}
+
+        cursor.execute(f"""
+            INSERT INTO rollup_diario (fonte, loja_nome, data, linhas, total_liquido, {", ".join(self.PAYMENT_COLUMNS)})
+            SELECT :fonte, loja_nome, data, COUNT(*), TOTAL(total_liquido), {payment_select}
+            FROM "{table}" WHERE "index" > :watermark AND loja_nome IS NOT NULL AND data IS NOT NULL
+            GROUP BY loja_nome, data
+            ON CONFLICT (fonte, loja_nome, data) DO UPDATE SET
+                linhas = linhas + excluded.linhas,
+                total_liquido = total_liquido + excluded.total_liquido,
+                {payment_update}
+        """, params)
+
+        # A single MAX() makes the bare "hora" column come from the maximum row
+        cursor.execute(f"""
+            INSERT INTO rollup_diario (fonte, loja_nome, data, max_total_liquido, hora_max)
+            SELECT :fonte, loja_nome, data, MAX(total_liquido), hora
+            FROM "{table}" WHERE "index" > :watermark AND loja_nome IS NOT NULL AND data IS NOT NULL
+            GROUP BY loja_nome, data
+            ON CONFLICT (fonte, loja_nome, data) DO UPDATE SET
+                hora_max = CASE WHEN max_total_liquido IS NULL OR excluded.max_total_liquido > max_total_liquido
+                           THEN excluded.hora_max ELSE hora_max END,
+                max_total_liquido = CASE WHEN max_total_liquido IS NULL OR excluded.max_total_liquido > max_total_liquido
+                                    THEN excluded.max_total_liquido ELSE max_total_liquido END
+        """, params)
+
+        cursor.execute(f"""
+            INSERT INTO rollup_mensal (fonte, loja_nome, mes, linhas, total_liquido)
+            SELECT :fonte, loja_nome, substr(data, 1, 7), COUNT(*), TOTAL(total_liquido)
+            FROM "{table}" WHERE "index" > :watermark AND loja_nome IS NOT NULL AND data IS NOT NULL
+            GROUP BY loja_nome, substr(data, 1, 7)
+            ON CONFLICT (fonte, loja_nome, mes) DO UPDATE SET
+                linhas = linhas + excluded.linhas,
+                total_liquido = total_liquido + excluded.total_liquido
+        """, params)
+
+        # Rows without an hour are kept under hora = -1 so day-of-week totals stay complete
+        cursor.execute(f"""
+            INSERT INTO rollup_hora (fonte, loja_nome, dia_semana, hora, linhas, total_liquido, tiket_medio, entregas_req)
+            SELECT :fonte, loja_nome, CAST(strftime('%w', data) AS INTEGER), COALESCE(hora, -1),
+                   COUNT(*), TOTAL(total_liquido), TOTAL(tiket_medio), TOTAL(entregas_req)
+            FROM "{table}" WHERE "index" > :watermark AND loja_nome IS NOT NULL AND data IS NOT NULL
+            GROUP BY loja_nome, CAST(strftime('%w', data) AS INTEGER), COALESCE(hora, -1)
+            ON CONFLICT (fonte, loja_nome, dia_semana, hora) DO UPDATE SET
+                linhas = linhas + excluded.linhas,
+                total_liquido = total_liquido + excluded.total_liquido,
+                tiket_medio = tiket_medio + excluded.tiket_medio,
+                entregas_req = entregas_req + excluded.entregas_req
+        """, params)
+
+    def refresh(self, full=False):
+        """
+        Bring the rollups up to date with the source tables
+
+        Only rows whose "index" is above the stored high-water mark are
+        aggregated. If a source's maximum index drops below the mark (the
+        table was rewritten), that source is rebuilt from scratch.
+        Returns a dict with the number of new rows folded in per source.
+        """
+        if not self._initialized:
+            self.create_tables()
+
+        conn = self._conn()
+        refreshed = {}
+        with self.db_connector.lock:
+            cursor = conn.cursor()
+            for table in self._get_sources():
+                row = cursor.execute("SELECT max_index FROM rollup_watermark WHERE fonte = ?", (table,)).fetchone()
+                watermark = row[0] if row else None
+                current = cursor.execute(f'SELECT MAX("index") FROM "{table}"').fetchone()[0]
+                if current is None:
+                    continue
+
+                if full or watermark is None or current < watermark:
+                    for rollup in ("rollup_diario", "rollup_mensal", "rollup_hora"):
+                        cursor.execute(f"DELETE FROM {rollup} WHERE fonte = ?", (table,))
+                    watermark = -1
+                elif current == watermark:
+                    continue
+
+                new_rows = cursor.execute(f'SELECT COUNT(*) FROM "{table}" WHERE "index" > ?', (watermark,)).fetchone()[0]
+                self._refresh_source(cursor, table, watermark)
+                cursor.execute(
+                    "INSERT INTO rollup_watermark (fonte, max_index) VALUES (?, ?) "
+                    "ON CONFLICT (fonte) DO UPDATE SET max_index = excluded.max_index",
+                    (table, current)
+                )
+                refreshed[table] = new_rows
+            conn.commit()
+        return refreshed
+
+    def is_current(self):
+        """
+        Check, without writing, that the rollups cover every row of their sources
+
+        Cached per get_data_version(). While this is False (rollups never
+        built, or rows added by another process) the patterns must be
+        answered from the source tables.
+        """
+        version = self.db_connector.get_data_version()
+        if version is not None and version == self._checked_version:
+            return self._current
+
+        conn = self.db_connector.get_connection(read_only=True)
+        try:
+            marks = dict(conn.execute("SELECT fonte, max_index FROM rollup_watermark").fetchall())
+            current = bool(marks) and all(
+                marks.get(table) == conn.execute(f'SELECT MAX("index") FROM "{table}"').fetchone()[0]
+                for table in self._get_sources()
+            )
+        except sqlite3.OperationalError:
+            current = False
+        self._current, self._checked_version = current, version
+        return current
+
+    def on_ingest(self, table, inserted, updated):
+        """DatabaseConnector ingest hook: fold the load into the rollups right after it commits"""
+        # Changed rows cannot be folded in incrementally: dropping the watermark rebuilds that source
+        if updated:
+            if not self._initialized:
+                self.create_tables()
+            conn = self._conn()
+            with self.db_connector.lock:
+                conn.execute("DELETE FROM rollup_watermark WHERE fonte = ?", (table,))
+                conn.commit()
+        self.refresh()
+
+    def has_route(self, pattern_name):
+        """Check whether a query pattern can be answered from the rollups"""
+        return pattern_name in self.ROUTES
+
+    def build_query(self, pattern_name, **kwargs):
+        """Return the rollup-backed SQL for a query pattern"""
+        template = self.ROUTES[pattern_name]
+        if pattern_name in self.DAY_ROUTES and any(str(kwargs.get(key, ""))[8:10] != "01" for key in ("start", "end")):
+            template = self.DAY_ROUTES[pattern_name]
+        return template.format(**kwargs)
@@ -0,0 +1,154 @@
+import unicodedata
+
+class SchemaContext:
+    """Build a compact, token-efficient schema description for prompts"""
+
+    # Keywords that point a question at a specific table
+    TABLE_KEYWORDS = {
+        "dados_diarios": ["hora", "horario", "pico", "dia ", "dias", "diari", "semana", "manha", "tarde", "noite", "entrega"],
+        "dados_mensais": ["mes", "mensal", "mensais", "ano", "anual", "total", "lucro"],
+        "dados_mensais_hoje": ["hoje", "empresa"]
+    }
+
+    # Tables used when no keyword matches
+    DEFAULT_TABLES = ["dados_diarios", "dados_mensais"]
+
+    # TEXT columns with at most this many distinct values are listed in full
+    MAX_DISTINCT_VALUES = 20
+
+    def __init__(self, db_info, db_connector=None):
+        """Initialize with database information and an optional connector for value statistics"""
+        self.db_info = db_info
+        self.db_connector = db_connector
+        self.tables = {table["name"]: table for table in db_info.get("tables", [])}
+        self._stats = {}
+        self._cache = {}
+
+    @staticmethod
+    def _normalize(text):
+        """Lowercase and strip accents"""
+        text = unicodedata.normalize("NFKD", text.lower())
+        return "".join(c for c in text if not unicodedata.combining(c))
+
+    def select_tables(self, question=None):
+        """Select the tables relevant to a question"""
+        if not question:
+            return list(self.tables)
+
+        text = self._normalize(question) + " "
+        selected = [
+            name for name, keywords in self.TABLE_KEYWORDS.items()
+            if name in self.tables and any(keyword in text for keyword in keywords)
+        ]
+        # Tables not covered by the keyword map are always kept
+        selected += [name for name in self.tables if name not in self.TABLE_KEYWORDS]
+
+        if not selected:
+            selected = [name for name in self.DEFAULT_TABLES if name in self.tables] or list(self.tables)
+        return [name for name in self.tables if name in selected]
+
+    def _column_stats(self, table_name):
+        """Compute per-column value ranges for a table (cached)"""
+        if table_name in self._stats:
+            return self._stats[table_name]
+
+        table = self.tables[table_name]
+        columns = [col["name"] for col in table["schema"]]
+        stats = {"row_count": None, "columns": {}}
+
+        if self.db_connector is not None:
+            conn = self.db_connector.conn or self.db_connector.connect()
+            select = ["COUNT(*)"]
+            for col in columns:
+                select += [f'MIN("{col}")', f'MAX("{col}")', f'COUNT(DISTINCT "{col}")']
+            row = conn.execute(f'SELECT {", ".join(select)} FROM "{table_name}"').fetchone()
+            stats["row_count"] = row[0]
+            for i, col in enumerate(columns):
+                stats["columns"][col] = {
+                    "min": row[1 + 3 * i],
+                    "max": row[2 + 3 * i],
+                    "distinct": row[3 + 3 * i]
+                }
+            for col in table["schema"]:
+                col_stats = stats["columns"][col["name"]]
+                if col["type"] == "TEXT" and col_stats["distinct"] <= self.MAX_DISTINCT_VALUES:
+                    values = conn.execute(
+                        f'SELECT DISTINCT "{col["name"]}" FROM "{table_name}" WHERE "{col["name"]}" IS NOT NULL ORDER BY 1'
+                    ).fetchall()
+                    col_stats["values"] = [value[0] for value in values]
+        else:
+            # Fall back to the sample rows in db_info
+            samples = table.get("sample_data", [])
+            for col in columns:
+                values = [row.get(col) for row in samples if row.get(col) is not None]
+                stats["columns"][col] = {
+                    "min": min(values) if values else None,
+                    "max": max(values) if values else None,
+                    "distinct": len(set(values))
+                }
+
+        self._stats[table_name] = stats
+        return stats
+
+    @staticmethod
+    def _format_value(value):
+        """Format a value compactly"""
+        if isinstance(value, float):
+            return f"{value:.2f}".rstrip("0").rstrip(".")
+        if isinstance(value, str):
+            return f"'{value}'"
+        return str(value)
+
+    def build(self, question=None):
+        """Return the compact schema text for a question (cached per table set)"""
+        table_names = tuple(self.select_tables(question))
+        if table_names in self._cache:
+            return self._cache[table_names]
+
+        columns_by_table = {
+            name: [(col["name"], col["type"]) for col in self.tables[name]["schema"]]
+            for name in table_names
+        }
+
+        # Columns (name and type) shared by every selected table
+        common = []
+        if len(table_names) > 1:
+            common = [col for col in columns_by_table[table_names[0]] if all(col in columns_by_table[name] for name in table_names)]
+
+        lines = ["Tabelas (SQLite):"]
+        for name in table_names:
+            row_count = self._column_stats(name)["row_count"]
+            extra = [col for col in columns_by_table[name] if col not in common]
+            line = f"- {name}"
+            if row_count is not None:
+                line += f" ({row_count} linhas)"
+            if extra:
+                line += (": + " if common else ": ") + ", ".join(f"{col} {col_type}" for col, col_type in extra)
+            lines.append(line)
+
+        if common:
+            lines.append("Colunas comuns a todas: " + ", ".join(f"{col} {col_type}" for col, col_type in common))
+
+        # Value ranges merged across the selected tables
+        lines.append("Valores:")
+        seen = set()
+        for name in table_names:
+            for col, _ in columns_by_table[name]:
+                if col in seen or col == "index":
+                    continue
+                seen.add(col)
+                merged = [self._column_stats(other)["columns"].get(col) for other in table_names]
+                merged = [item for item in merged if item and item["min"] is not None]
+                if not merged:
+                    continue
+                if all("values" in item for item in merged):
+                    values = sorted({value for item in merged for value in item["values"]})
+                    lines.append(f"- {col}: " + ", ".join(self._format_value(value) for value in values))
+                else:
+                    low = min(item["min"] for item in merged)
+                    high = max(item["max"] for item in merged)
+                    lines.append(f"- {col}: {self._format_value(low)} a {self._format_value(high)}")
+
+        context = "\n".join(lines)
+        self._cache[table_names] = context
+        return context
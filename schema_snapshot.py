@@ -0,0 +1,55 @@
+import json
+import os
+
+class SchemaSnapshot:
+    """Persisted copy of QueryExecutor.get_database_info(), reused while the database is unchanged"""
+
+    def __init__(self, query_executor, cache_path="schema_cache.json"):
+        """Initialize with a QueryExecutor and the snapshot file"""
+        self.query_executor = query_executor
+        self.cache_path = cache_path
+        self.from_cache = None
+
+    def _key(self):
+        """Return what the snapshot depends on: schema version plus database file identity"""
+        db = self.query_executor.db_connector
+        # Read the schema version first: opening the database may switch it to WAL and touch the file
+        schema_version = db.get_schema_version()
+        stat = os.stat(db.db_path)
+        return {
+            "db_path": os.path.abspath(db.db_path),
+            "schema_version": schema_version,
+            "mtime_ns": stat.st_mtime_ns,
+            "size": stat.st_size
+        }
+
+    def _read(self):
+        """Return the stored snapshot or None"""
+        try:
+            with open(self.cache_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write(self, key, db_info):
+        """Store the snapshot atomically"""
+        tmp_path = f"{self.cache_path}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"key": key, "db_info": db_info}, f, ensure_ascii=False, default=str)
+            os.replace(tmp_path, self.cache_path)
+        except OSError as e:
+            print(f"Não foi possível salvar o cache do esquema: {e}")
+
+    def load(self, refresh=False):
+        """Return the database info, introspecting the database only when the snapshot is stale"""
+        key = self._key()
+        stored = None if refresh else self._read()
+        if stored and stored.get("key") == key:
+            self.from_cache = True
+            return stored["db_info"]
+
+        db_info = self.query_executor.get_database_info()
+        self._write(key, db_info)
+        self.from_cache = False
+        return db_info
@@ -0,0 +1,50 @@
+import re
+
+def load_sql_dataset(path="SQL_dataset.txt"):
+    """
+    Parse the curated question/SQL pairs in SQL_dataset.txt
+
+    Each entry is a question (optionally followed by a quoted hint line),
+    a "<:>" separator line and the SQL; further "<:>" lines right after the
+    SQL add alternative queries. Entries are separated by blank lines.
+    Returns a list of {"question", "hint", "sql": [queries]} dicts.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        lines = f.read().splitlines()
+
+    entries = []
+    text_lines = []
+    sql_lines = None
+    current = None
+
+    def close_sql():
+        if current is not None and sql_lines:
+            current["sql"].append(" ".join(sql_lines))
+
+    for line in lines:
+        stripped = line.strip()
+        if stripped == "<:>":
+            if sql_lines:
+                # Alternative query for the same question
+                close_sql()
+            elif text_lines:
+                question = [item for item in text_lines if not item.startswith('"')]
+                hint = [item.strip('"') for item in text_lines if item.startswith('"')]
+                current = {
+                    "question": re.sub(r"^\d+\)\s*", "", " ".join(question)),
+                    "hint": " ".join(hint),
+                    "sql": []
+                }
+                entries.append(current)
+                text_lines = []
+            sql_lines = []
+        elif not stripped:
+            close_sql()
+            sql_lines = None
+        elif sql_lines is not None:
+            sql_lines.append(stripped)
+        else:
+            text_lines.append(stripped)
+
+    close_sql()
+    return [entry for entry in entries if entry["sql"]]
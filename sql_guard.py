@@ -0,0 +1,340 @@
+import difflib
+import re
+import sqlite3
+
+class SQLGuard:
+    """Check and rewrite model-generated SQL before it runs against the shared database"""
+
+    # Authorizer actions allowed while preparing a statement (read-only SELECT)
+    ALLOWED_ACTIONS = {
+        sqlite3.SQLITE_SELECT,
+        sqlite3.SQLITE_READ,
+        sqlite3.SQLITE_FUNCTION,
+        getattr(sqlite3, "SQLITE_RECURSIVE", 33)
+    }
+
+    # Correlated MAX/MIN subquery: ... WHERE [cond AND] a1.col = (SELECT MAX(a2.col) FROM t a2 WHERE ...)
+    CORRELATED_EXTREME = re.compile(
+        r"^\s*SELECT\s+(?P<cols>.+?)\s+FROM\s+(?P<table>\w+)\s+(?:AS\s+)?(?P<a1>\w+)\s+"
+        r"WHERE\s+(?:(?P<cond1>.+?)\s+AND\s+)?(?P=a1)\.(?P<col>\w+)\s*=\s*\(\s*"
+        r"SELECT\s+(?P<func>MAX|MIN)\s*\(\s*(?P<a2>\w+)\.(?P=col)\s*\)\s+FROM\s+(?P=table)\s+(?:AS\s+)?(?P=a2)\s+"
+        r"WHERE\s+(?P<cond2>.+?)\s*\)\s*(?P<tail>(?:ORDER\s+BY\s.*|LIMIT\s.*)?)$",
+        re.IGNORECASE | re.DOTALL
+    )
+
+    # Misspellings models often use for the columns of this database
+    NAME_FIXES = {
+        "ticket_medio": "tiket_medio",
+        "ticketmedio": "tiket_medio",
+        "ticket_médio": "tiket_medio",
+        "tiket_médio": "tiket_medio",
+        "horas": "hora",
+        "horario": "hora",
+        "horário": "hora",
+        "hour": "hora",
+        "loja": "loja_nome",
+        "nome_loja": "loja_nome"
+    }
+
+    # Dates are stored without time ('YYYY-MM-DDT00:00:00'); the hour lives in the REAL column hora
+    HOUR_OF_DATE = re.compile(r"strftime\(\s*'%H'\s*,\s*(\w+\.)?data\s*\)", re.IGNORECASE)
+    HOUR_LITERAL = re.compile(r"(CAST\(\s*(?:\w+\.)?hora\s+AS\s+INTEGER\s*\)|\b(?:\w+\.)?hora)\s*(=|<>|!=|>=|<=|>|<)\s*'(\d{1,2})(?::00){0,2}'", re.IGNORECASE)
+
+    def __init__(self, db_connector, max_cost=5_000_000, auto_limit=10000, timeout=10.0, schema=None):
+        """
+        Initialize with the connector, the row-visit budget, the LIMIT added to
+        unbounded queries, the statement timeout (seconds) and optionally the
+        cached schema (db_info) used to correct unknown table and column names
+        """
+        self.db_connector = db_connector
+        self.max_cost = max_cost
+        self.auto_limit = auto_limit
+        self.timeout = timeout
+        self.schema = schema
+        self._names = None
+        self._names_version = None
+        self._row_counts = {}
+        self._row_counts_version = None
+
+    @staticmethod
+    def _strip(sql):
+        """Remove comments (outside string literals and quoted names), surrounding whitespace and trailing semicolons"""
+        # Literals are matched as a whole, so a -- or /* inside one is never taken for a comment
+        sql = re.sub(r"""('(?:[^']|'')*'|"(?:[^"]|"")*")|--[^\n]*|/\*.*?\*/""",
+                     lambda m: m.group(1) or " ", sql, flags=re.DOTALL)
+        return sql.strip().rstrip(";").strip()
+
+    @staticmethod
+    def _has_limit(sql):
+        """Check for a LIMIT clause of the outer statement (any form: LIMIT 5, LIMIT (5), LIMIT ?)"""
+        depth = 0
+        for part in re.split(r"""('(?:[^']|'')*'|"(?:[^"]|"")*")""", sql):
+            if part.startswith(("'", '"')):
+                continue
+            for token in re.findall(r"\(|\)|\bLIMIT\b", part, re.IGNORECASE):
+                if token == "(":
+                    depth += 1
+                elif token == ")":
+                    depth -= 1
+                elif depth == 0:
+                    return True
+        return False
+
+    def _authorizer(self, action, arg1, arg2, db_name, trigger):
+        """Deny anything but reads while preparing"""
+        return sqlite3.SQLITE_OK if action in self.ALLOWED_ACTIONS else sqlite3.SQLITE_DENY
+
+    def _row_count(self, conn, table):
+        """Return the (cached) row count of a table"""
+        version = self.db_connector.get_data_version()
+        if version != self._row_counts_version:
+            self._row_counts = {}
+            self._row_counts_version = version
+        if table not in self._row_counts:
+            try:
+                self._row_counts[table] = conn.execute(f'SELECT COUNT(*) FROM "{table}"').fetchone()[0]
+            except sqlite3.Error:
+                self._row_counts[table] = None
+        return self._row_counts[table]
+
+    @staticmethod
+    def _aliases(sql):
+        """Map table aliases (and names) used in FROM/JOIN clauses to table names"""
+        aliases = {}
+        pattern = r'(?:FROM|JOIN)\s+"?(\w+)"?(?:\s+(?:AS\s+)?(?!WHERE\b|JOIN\b|ON\b|GROUP\b|ORDER\b|LIMIT\b|LEFT\b|INNER\b|CROSS\b|UNION\b)(\w+))?'
+        for table, alias in re.findall(pattern, sql, flags=re.IGNORECASE):
+            aliases[table] = table
+            if alias:
+                aliases[alias] = table
+        # Comma joins: FROM t1 a, t2 b
+        stop = r"(?=\b(?:WHERE|GROUP|ORDER|LIMIT|JOIN|LEFT|INNER|CROSS|UNION)\b|\)|$)"
+        for clause in re.findall(rf"\bFROM\s+([^()]+?){stop}", sql, flags=re.IGNORECASE | re.DOTALL):
+            for item in clause.split(",")[1:]:
+                match = re.fullmatch(r'\s*"?(\w+)"?(?:\s+(?:AS\s+)?(\w+))?\s*', item, flags=re.IGNORECASE)
+                if match:
+                    aliases[match.group(1)] = match.group(1)
+                    if match.group(2):
+                        aliases[match.group(2)] = match.group(1)
+        return aliases
+
+    def _estimate(self, conn, sql, plan):
+        """
+        Roughly estimate row visits from EXPLAIN QUERY PLAN and collect warnings
+
+        Returns (cost, linear, warnings), where linear is what visiting each
+        table of the plan once would cost; a cost above it comes from nested
+        loops (joins, correlated subqueries) rather than from plain scans.
+        """
+        aliases = self._aliases(sql)
+        nodes = {node_id: (parent, detail) for node_id, parent, _, detail in plan}
+        warnings = []
+
+        def rows_for(detail):
+            match = re.match(r"(?:SCAN|SEARCH)\s+(\w+)", detail)
+            table = aliases.get(match.group(1), match.group(1)) if match else None
+            count = self._row_count(conn, table) if table else None
+            return table, count if count is not None else 1
+
+        def correlated(node_id):
+            while node_id in nodes:
+                parent, detail = nodes[node_id]
+                if detail.startswith("CORRELATED"):
+                    return True
+                node_id = parent
+            return False
+
+        outer = 1
+        top_level = False
+        inner = 0
+        linear = 0
+        for node_id, parent, _, detail in plan:
+            if not re.match(r"(SCAN|SEARCH)\s", detail):
+                if detail.startswith("CORRELATED"):
+                    warnings.append(f"subconsulta correlacionada: {detail}")
+                continue
+
+            table, count = rows_for(detail)
+            # A SEARCH is an index seek; a SCAN (even of a covering index) visits every row
+            full = detail.startswith("SCAN")
+            if full:
+                warnings.append(f"varredura completa: {detail}")
+            visits = count if full else max(1, count // 100)
+            linear += visits
+
+            if correlated(parent):
+                inner += outer * visits
+            elif parent == 0:
+                outer *= visits
+                top_level = True
+            else:
+                inner += visits
+
+        # Compound queries (UNION) only have nested scans
+        return max((outer if top_level else 0) + inner, 1), max(linear, 1), warnings
+
+    def _known_names(self, conn):
+        """Return (tables, columns) of the cached schema, or of the database when there is none"""
+        if self.schema is not None:
+            if self._names is None:
+                tables = {table["name"] for table in self.schema.get("tables", [])}
+                columns = {column["name"] for table in self.schema.get("tables", []) for column in table.get("schema", [])}
+                self._names = (tables, columns)
+            return self._names
+
+        version = conn.execute("PRAGMA schema_version").fetchone()[0]
+        if self._names is None or version != self._names_version:
+            tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type IN ('table', 'view')")}
+            columns = set()
+            for table in tables:
+                columns.update(row[1] for row in conn.execute(f'PRAGMA table_info("{table}")'))
+            self._names = (tables, columns)
+            self._names_version = version
+        return self._names
+
+    @staticmethod
+    def _replace_name(sql, old, new):
+        """Replace an identifier outside string literals"""
+        parts = re.split(r"('(?:[^']|'')*')", sql)
+        pattern = re.compile(rf'(?<![\w"]){re.escape(old)}(?![\w"])|"{re.escape(old)}"', re.IGNORECASE)
+        return "".join(part if part.startswith("'") else pattern.sub(new, part) for part in parts)
+
+    def fix_names(self, sql, error, conn):
+        """
+        Correct the unknown table or column named in a SQLite error
+
+        Known misspellings (NAME_FIXES) are tried first, then the closest
+        schema name. Returns (sql, description) or None when there is no
+        confident correction.
+        """
+        match = re.search(r"no such (column|table): (?:\w+\.)?(\w+)", error)
+        if not match:
+            return None
+        kind, name = match.groups()
+        tables, columns = self._known_names(conn)
+        known = columns if kind == "column" else tables
+
+        fixed = self.NAME_FIXES.get(name.lower())
+        if fixed not in known:
+            lowered = {candidate.lower(): candidate for candidate in known}
+            close = difflib.get_close_matches(name.lower(), list(lowered), n=2, cutoff=0.8)
+            # Two equally plausible names: leave the choice to the model
+            if len(close) != 1:
+                return None
+            fixed = lowered[close[0]]
+        rewritten = self._replace_name(sql, name, fixed)
+        if rewritten == sql:
+            return None
+        label = "coluna" if kind == "column" else "tabela"
+        return rewritten, f"{label} {name} corrigida para {fixed}"
+
+    def fix_hours(self, sql):
+        """Rewrite hour filters written against the date text or as strings; returns (sql, list of rewrites applied)"""
+        rewrites = []
+        # Keep the table qualifier so the column stays unambiguous in joins
+        fixed = self.HOUR_OF_DATE.sub(r"CAST(\1hora AS INTEGER)", sql)
+        if fixed != sql:
+            rewrites.append("hora lida da coluna hora (data não tem horário)")
+        sql, fixed = fixed, self.HOUR_LITERAL.sub(lambda m: f"{m.group(1)} {m.group(2)} {int(m.group(3))}", fixed)
+        if fixed != sql:
+            rewrites.append("hora comparada como número")
+        return fixed, rewrites
+
+    def rewrite(self, sql):
+        """Rewrite known slow shapes; returns (sql, list of rewrites applied)"""
+        match = self.CORRELATED_EXTREME.match(sql)
+        if not match or re.search(r"\bBETWEEN\b", sql, re.IGNORECASE):
+            return sql, []
+
+        a1, a2 = match.group("a1"), match.group("a2")
+        split = lambda cond: [part.strip() for part in re.split(r"\s+AND\s+", cond or "", flags=re.IGNORECASE) if part.strip()]
+        normalize = lambda part: " ".join(part.lower().split())
+
+        keys = []
+        rest = []
+        for part in split(match.group("cond2")):
+            key = re.fullmatch(rf"(\w+)\.(\w+)\s*=\s*(\w+)\.(\w+)", part)
+            if key and {key.group(1), key.group(3)} == {a1, a2} and key.group(2) == key.group(4):
+                keys.append(f"{a1}.{key.group(2)}")
+            else:
+                rest.append(normalize(re.sub(rf"\b{a2}\.", f"{a1}.", part)))
+
+        # Only equivalent when the subquery filters exactly like the outer query
+        cond1 = split(match.group("cond1"))
+        if not keys or sorted(rest) != sorted(normalize(part) for part in cond1):
+            return sql, []
+
+        where = f" WHERE {' AND '.join(cond1)}" if cond1 else ""
+        rewritten = (
+            f"SELECT {match.group('cols')} FROM ("
+            f"SELECT {a1}.*, {match.group('func').upper()}({a1}.{match.group('col')}) OVER (PARTITION BY {', '.join(keys)}) AS _valor_extremo "
+            f"FROM {match.group('table')} {a1}{where}"
+            f") {a1} WHERE {a1}.{match.group('col')} = {a1}._valor_extremo"
+        )
+        if match.group("tail"):
+            rewritten += " " + match.group("tail").strip()
+        return rewritten, ["subconsulta correlacionada com MAX/MIN reescrita como função de janela"]
+
+    def check(self, sql):
+        """
+        Validate, rewrite and cost-check a statement
+
+        Returns a dict with the SQL to run ("sql"), the rewrites applied, the
+        warnings found and the query plan. Unknown table/column names with a
+        confident correction are fixed locally. Raises ValueError for anything
+        that is not a single read-only SELECT, does not compile or whose
+        nested loops push the estimated cost past max_cost (plain scans of
+        big tables only add a warning).
+        """
+        sql = self._strip(sql)
+        if not re.match(r"(SELECT|WITH)\b", sql, re.IGNORECASE):
+            raise ValueError("Apenas consultas SELECT são permitidas.")
+
+        sql, rewrites = self.rewrite(sql)
+
+        conn = self.db_connector.get_connection(read_only=True)
+        # Each pass can correct one unknown name; hour fixes run before every plan (a name
+        # fix can expose one) so the statement that runs is the one that was validated
+        for _ in range(4):
+            sql, rewritten = self.fix_hours(sql)
+            rewrites += rewritten
+            conn.set_authorizer(self._authorizer)
+            try:
+                plan = conn.execute(f"EXPLAIN QUERY PLAN {sql}").fetchall()
+                break
+            except (sqlite3.DatabaseError, sqlite3.ProgrammingError, sqlite3.Warning) as e:
+                if "not authorized" in str(e):
+                    raise ValueError("Apenas consultas SELECT são permitidas.")
+                error = e
+            finally:
+                conn.set_authorizer(None)
+            fix = self.fix_names(sql, str(error), conn)
+            if fix is None:
+                raise ValueError(f"Consulta SQL inválida: {error}")
+            sql, description = fix
+            rewrites.append(description)
+        else:
+            raise ValueError(f"Consulta SQL inválida: {error}")
+
+        cost, linear, warnings = self._estimate(conn, sql, plan)
+
+        if self.auto_limit and not self._has_limit(sql):
+            sql = f"{sql} LIMIT {self.auto_limit}"
+            rewrites.append(f"LIMIT {self.auto_limit} adicionado")
+
+        # Scanning a big table once is just slow (the statement timeout bounds it); only
+        # nested loops that multiply row visits past the budget are rejected
+        if self.max_cost and cost > self.max_cost and cost <= linear:
+            warnings.append(f"consulta visita cerca de {cost} linhas (acima de {self.max_cost})")
+        elif self.max_cost and cost > self.max_cost:
+            raise ValueError(
+                f"Consulta muito custosa (estimativa de {cost} linhas visitadas, limite {self.max_cost}): "
+                + "; ".join(warnings)
+            )
+
+        return {
+            "sql": sql,
+            "rewrites": rewrites,
+            "warnings": warnings,
+            "plan": [detail for _, _, _, detail in plan],
+            "estimated_cost": cost
+        }
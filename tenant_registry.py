@@ -0,0 +1,176 @@
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from claude_client import ClaudeClient
+from pipeline_metrics import PipelineMetrics
+from rag_app import RAGSystem
+
+class TenantRegistry:
+    """Serve many tenant databases from one process: RAG systems opened on demand and closed least-recently-used"""
+
+    TENANT_ID = re.compile(r"[A-Za-z0-9_][A-Za-z0-9_.-]{0,127}")
+
+    def __init__(self, databases=None, db_dir=None, data_dir="tenants", max_open=32, idle_timeout=15 * 60,
+                 api_key=None, metrics_log_path=None, result_cache_budget=256 * 1024 * 1024, **rag_options):
+        """
+        Initialize the registry
+
+        Tenant databases come from the databases dict (tenant id -> path)
+        and/or db_dir, where tenant "x" is "x.db". Each tenant keeps its own
+        answer cache, schema snapshot and learned SQL examples under data_dir/<tenant>. At most
+        max_open tenants stay open; the least recently used idle one is
+        closed beyond that, and any tenant idle for idle_timeout seconds is
+        closed on the next access. The Claude client and the metrics are
+        shared; rag_options go to every RAGSystem (fast_path, analytics, ...).
+        result_cache_budget (bytes) bounds the in-memory result caches of all
+        open tenants together: each gets result_cache_budget / max_open
+        unless rag_options sets result_cache_bytes.
+        """
+        self.databases = dict(databases or {})
+        self.db_dir = db_dir
+        self.data_dir = data_dir
+        self.max_open = max_open
+        self.idle_timeout = idle_timeout
+        self.rag_options = rag_options
+        self.rag_options.setdefault("result_cache_bytes", result_cache_budget // max_open if result_cache_budget else 0)
+        self.metrics = PipelineMetrics(metrics_log_path)
+        self.claude_client = ClaudeClient(api_key, usage_callback=self.metrics.record_usage)
+
+        # tenant -> {"rag", "leases", "last_used"}, least recently used first
+        self.open = OrderedDict()
+        self.lock = threading.Lock()
+        self._opening = {}
+        self.stats = {"opened": 0, "closed": 0, "hits": 0}
+
+    def resolve(self, tenant_id):
+        """Return the database path of a tenant, or raise ValueError for an unknown tenant"""
+        tenant_id = str(tenant_id)
+        if not self.TENANT_ID.fullmatch(tenant_id):
+            raise ValueError(f"Identificador de cliente inválido: {tenant_id!r}")
+        path = self.databases.get(tenant_id)
+        if path is None and self.db_dir:
+            path = os.path.join(self.db_dir, f"{tenant_id}.db")
+        # DatabaseConnector would create an empty database for a missing file
+        if path is None or not os.path.isfile(path):
+            raise ValueError(f"Cliente desconhecido: {tenant_id}")
+        return path
+
+    def tenants(self):
+        """Return the ids of every known tenant"""
+        tenants = set(self.databases)
+        if self.db_dir and os.path.isdir(self.db_dir):
+            tenants.update(name[:-3] for name in os.listdir(self.db_dir)
+                           if name.endswith(".db") and self.TENANT_ID.fullmatch(name[:-3]))
+        return sorted(tenants)
+
+    def _create(self, tenant_id):
+        """Open the RAG system of a tenant with its own cache directory"""
+        db_path = self.resolve(tenant_id)
+        tenant_dir = os.path.join(self.data_dir, tenant_id)
+        os.makedirs(tenant_dir, exist_ok=True)
+        return RAGSystem(
+            db_path=db_path,
+            cache_path=os.path.join(tenant_dir, "cache_respostas.db"),
+            schema_cache_path=os.path.join(tenant_dir, "schema_cache.json"),
+            examples_path=os.path.join(tenant_dir, "exemplos_sql.jsonl"),
+            claude_client=self.claude_client,
+            metrics=self.metrics,
+            tenant_id=tenant_id,
+            **self.rag_options
+        )
+
+    def _acquire(self, tenant_id):
+        """Return a tenant's RAG system with one more lease, opening it if needed"""
+        tenant_id = str(tenant_id)
+        while True:
+            with self.lock:
+                entry = self.open.get(tenant_id)
+                if entry is not None:
+                    entry["leases"] += 1
+                    self.open.move_to_end(tenant_id)
+                    self.stats["hits"] += 1
+                    return entry["rag"]
+                opening = self._opening.get(tenant_id)
+                if opening is None:
+                    opening = self._opening[tenant_id] = threading.Event()
+                    break
+            # Another thread is opening this tenant; use its instance once ready
+            opening.wait()
+
+        try:
+            rag = self._create(tenant_id)
+            with self.lock:
+                self.open[tenant_id] = {"rag": rag, "leases": 1, "last_used": time.monotonic()}
+                self.stats["opened"] += 1
+            return rag
+        finally:
+            with self.lock:
+                self._opening.pop(tenant_id).set()
+
+    def _release(self, tenant_id):
+        """Drop a lease and close whatever is over the limits"""
+        with self.lock:
+            entry = self.open[tenant_id]
+            entry["leases"] -= 1
+            entry["last_used"] = time.monotonic()
+        self.close_idle()
+
+    @contextmanager
+    def lease(self, tenant_id):
+        """Use a tenant's RAG system; it is not closed while leased"""
+        rag = self._acquire(tenant_id)
+        try:
+            yield rag
+        finally:
+            self._release(str(tenant_id))
+
+    def close_idle(self):
+        """Close tenants idle for idle_timeout and the least recently used ones over max_open; returns their ids"""
+        now = time.monotonic()
+        closing = []
+        with self.lock:
+            for tenant_id, entry in list(self.open.items()):
+                if entry["leases"]:
+                    continue
+                if len(self.open) > self.max_open or (self.idle_timeout is not None and now - entry["last_used"] > self.idle_timeout):
+                    closing.append((tenant_id, self.open.pop(tenant_id)["rag"]))
+            self.stats["closed"] += len(closing)
+
+        for tenant_id, rag in closing:
+            try:
+                rag.close()
+            except Exception as e:
+                print(f"Erro ao fechar o cliente {tenant_id}: {e}")
+        return [tenant_id for tenant_id, _ in closing]
+
+    def process_query(self, tenant_id, user_query, output_format="direct"):
+        """Answer a question against one tenant's database"""
+        with self.lease(tenant_id) as rag:
+            return dict(rag.process_query(user_query, output_format), tenant=str(tenant_id))
+
+    def process_query_stream(self, tenant_id, user_query, output_format="direct"):
+        """Stream the answer to a question against one tenant's database"""
+        with self.lease(tenant_id) as rag:
+            yield from rag.process_query_stream(user_query, output_format)
+
+    def process_batch(self, tenant_id, questions, output_format="direct", **kwargs):
+        """Answer a batch of questions against one tenant's database"""
+        with self.lease(tenant_id) as rag:
+            return rag.process_batch(questions, output_format, **kwargs)
+
+    def get_stats(self):
+        """Return the open tenants and open/close counters"""
+        with self.lock:
+            return dict(self.stats, open=list(self.open), open_count=len(self.open))
+
+    def close(self):
+        """Close every open tenant"""
+        with self.lock:
+            entries = list(self.open.items())
+            self.open.clear()
+            self.stats["closed"] += len(entries)
+        for _, entry in entries:
+            entry["rag"].close()
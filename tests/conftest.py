@@ -0,0 +1,31 @@
+import os
+import shutil
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from db_connector import DatabaseConnector
+from query_executor import QueryExecutor
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    """Copy of the sample database, so tests never touch the real file"""
+    path = tmp_path / "dados.db"
+    shutil.copy(os.path.join(ROOT, "dados (2).db"), path)
+    return str(path)
+
+
+@pytest.fixture
+def connector(db_path):
+    connector = DatabaseConnector(db_path)
+    yield connector
+    connector.disconnect()
+
+
+@pytest.fixture
+def executor(connector):
+    return QueryExecutor(connector)
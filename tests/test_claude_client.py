@@ -0,0 +1,20 @@
+from claude_client import ClaudeClient
+
+
+def test_short_prefix_is_sent_without_cache_control():
+    client = ClaudeClient(api_key="teste")
+    assert isinstance(client._explain_system_prompt(), str)
+
+
+def test_long_prefix_marks_the_last_block():
+    client = ClaudeClient(api_key="teste")
+    schema = "coluna REAL\n" * client.MIN_CACHE_TOKENS
+    blocks = client._system("Instruções", schema)
+    assert [block["text"] for block in blocks] == ["Instruções", schema]
+    assert "cache_control" not in blocks[0]
+    assert blocks[-1]["cache_control"] == {"type": "ephemeral"}
+
+
+def test_prompt_caching_disabled():
+    client = ClaudeClient(api_key="teste", prompt_caching=False)
+    assert client._system("Instruções", "coluna REAL\n" * client.MIN_CACHE_TOKENS).startswith("Instruções\n\ncoluna REAL")
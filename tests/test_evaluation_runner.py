@@ -0,0 +1,36 @@
+import time
+
+from evaluation_runner import EvaluationRunner
+
+
+def test_process_fn_gets_the_question_deadline():
+    seen = {}
+
+    def process(question, deadline):
+        seen[question] = deadline - time.monotonic()
+        return {"query": question}
+
+    results = EvaluationRunner(process, max_workers=2, timeout=5, progress_callback=lambda *args: None).run(["a", "b"])
+
+    assert [result["query"] for result in results] == ["a", "b"]
+    assert all(4 < remaining <= 5 for remaining in seen.values())
+
+
+def test_work_stops_at_the_deadline():
+    def process(question, deadline):
+        # Stands in for the bounded Claude requests and SQL statements of RAGSystem.process_query
+        while time.monotonic() < deadline:
+            time.sleep(0.01)
+        raise TimeoutError("prazo esgotado")
+
+    start = time.monotonic()
+    results = EvaluationRunner(process, timeout=0.2, progress_callback=lambda *args: None).run(["a"])
+
+    assert "error" in results[0]
+    assert time.monotonic() - start < 1
+
+
+def test_no_timeout_means_no_deadline():
+    results = EvaluationRunner(lambda question, deadline: {"query": question, "deadline": deadline},
+                               timeout=None, progress_callback=lambda *args: None).run(["a"])
+    assert results[0]["deadline"] is None
@@ -0,0 +1,94 @@
+import sqlite3
+
+import pytest
+
+
+def fetch_rows(connector, where, params=()):
+    cursor = connector.get_connection(read_only=True).execute(f"SELECT * FROM dados_diarios WHERE {where}", params)
+    columns = [description[0] for description in cursor.description]
+    return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+
+def count_rows(db_path):
+    with sqlite3.connect(db_path) as conn:
+        return conn.execute("SELECT COUNT(*) FROM dados_diarios").fetchone()[0]
+
+
+@pytest.fixture
+def day_rows(connector):
+    return fetch_rows(connector, "data = ? AND loja_nome = ?", ("2025-01-01T00:00:00", "_Alpha_"))
+
+
+def test_reingesting_same_rows_is_a_noop(connector, db_path, day_rows):
+    calls = []
+    connector.add_ingest_hook(lambda *args: calls.append(args))
+    before = count_rows(db_path)
+
+    result = connector.ingest("dados_diarios", day_rows)
+
+    assert result["inserted"] == 0 and result["updated"] == 0
+    assert result["unchanged"] == len(day_rows)
+    assert count_rows(db_path) == before
+    assert calls == []
+
+
+def test_changed_value_is_one_update(connector, db_path, day_rows):
+    before = count_rows(db_path)
+    row = dict(day_rows[0], total_liquido=day_rows[0]["total_liquido"] + 10)
+
+    result = connector.ingest("dados_diarios", day_rows[1:] + [row])
+
+    assert (result["inserted"], result["updated"]) == (0, 1)
+    assert count_rows(db_path) == before
+    stored = fetch_rows(connector, '"index" = ?', (row["index"],))[0]
+    assert stored["total_liquido"] == row["total_liquido"]
+
+
+def test_new_key_is_one_insert(connector, db_path, day_rows):
+    before = count_rows(db_path)
+    row = {key: value for key, value in day_rows[0].items() if key != "index"}
+    row["data"] = "2025-02-01T00:00:00"
+
+    result = connector.ingest("dados_diarios", day_rows + [row])
+
+    assert (result["inserted"], result["updated"], result["unchanged"]) == (1, 0, len(day_rows))
+    assert result["max_data"] == "2025-02-01T00:00:00"
+    assert count_rows(db_path) == before + 1
+    assert connector.get_ingest_watermark("dados_diarios")["max_data"] == "2025-02-01T00:00:00"
+
+
+def test_hooks_run_after_commit(connector, db_path, day_rows):
+    row = {key: value for key, value in day_rows[0].items() if key != "index"}
+    row["data"] = "2025-02-01T00:00:00"
+    seen = []
+
+    def hook(table, inserted, updated):
+        # A separate connection only sees committed data
+        with sqlite3.connect(db_path) as conn:
+            visible = conn.execute("SELECT COUNT(*) FROM dados_diarios WHERE data = ?", (row["data"],)).fetchone()[0]
+        seen.append((table, inserted, updated, visible))
+
+    connector.add_ingest_hook(hook)
+    connector.ingest("dados_diarios", [row])
+
+    assert seen == [("dados_diarios", 1, 0, 1)]
+
+
+def test_row_without_key_writes_nothing(connector, db_path, day_rows):
+    calls = []
+    connector.add_ingest_hook(lambda *args: calls.append(args))
+    before = count_rows(db_path)
+
+    with pytest.raises(ValueError):
+        connector.ingest("dados_diarios", day_rows + [{"loja_nome": "_Alpha_", "hora": 10.0}])
+
+    assert count_rows(db_path) == before
+    assert calls == []
+
+
+def test_custom_key_columns_are_validated(connector):
+    rows = [{"loja_nome": "_Alpha_", "data": "2025-02-01T00:00:00", "hora": None}]
+    with pytest.raises(ValueError, match="data"):
+        connector.ingest("dados_mensais", [{"loja_nome": "_Alpha_"}], key=("loja_nome", "data"))
+    with pytest.raises(ValueError, match="colunas da chave"):
+        connector.ingest("dados_mensais", rows, key=("loja_nome", "sem_coluna"))
@@ -0,0 +1,52 @@
+import pytest
+
+from intent_matcher import IntentMatcher
+
+
+@pytest.fixture
+def matcher(executor):
+    return IntentMatcher(executor)
+
+
+@pytest.mark.parametrize("question", [
+    "Quais foram as vendas por loja no primeiro trimestre de 2024?",
+    "Quais foram as vendas por loja no segundo semestre de 2024?",
+    "Quais foram as vendas por loja entre outubro e dezembro de 2024?",
+    "Quais foram as vendas por loja de outubro de 2024 até janeiro de 2025?",
+    "Quais foram as vendas por loja na última semana de outubro de 2024?",
+    "Quais foram as vendas por loja em outubro de 2024 excluindo a Alpha?",
+    "Quais foram as vendas em outubro de 2024 da loja Gamma?",
+    "Quais foram as vendas em outubro de 2024 da Loja 1?",
+    "Quais foram as vendas por loja a partir de outubro de 2024?",
+    "Quais foram as vendas por loja em outubro de 2024 sem a Beta?",
+])
+def test_unrepresentable_questions_go_to_llm(matcher, question):
+    assert matcher.match(question) is None
+
+
+def test_month_and_year(matcher):
+    result = matcher.match("Quais foram as vendas por loja em outubro de 2024?")
+    assert result["pattern"] == "vendas_por_mes"
+    assert result["params"] == {"year": 2024, "month": 10}
+
+
+def test_known_store(matcher):
+    result = matcher.match("Quais foram as vendas da loja Alpha em outubro de 2024?")
+    assert result["pattern"] == "vendas_por_mes"
+    assert result["params"] == {"year": 2024, "month": 10, "loja": "_Alpha_"}
+
+
+def test_single_day(matcher):
+    result = matcher.match("Qual foi o total de vendas por loja no dia 2025-01-01?")
+    assert result["pattern"] == "vendas_por_dia"
+    assert result["params"] == {"year": 2025, "month": 1, "day": 1}
+
+
+@pytest.mark.parametrize("question, pattern", [
+    ("Como variam as vendas por dia da semana?", "vendas_por_dia_semana"),
+    ("Qual a média de vendas nos finais de semana comparada aos dias úteis?", "vendas_fim_de_semana"),
+    ("Existe correlação entre desconto e vendas?", "correlacao_desconto_vendas"),
+])
+def test_weekday_and_between_phrases_still_match(matcher, question, pattern):
+    result = matcher.match(question)
+    assert result is not None and result["pattern"] == pattern
@@ -0,0 +1,55 @@
+import os
+import shutil
+
+import pandas as pd
+import pytest
+
+from analytics_engine import AnalyticsEngine
+from conftest import ROOT
+from db_connector import DatabaseConnector
+from query_executor import QueryExecutor
+from rollups import RollupManager
+
+# Small date ranges: the SQL of max_vendas_por_hora is a correlated subquery
+PARAMS = [
+    {"year": 2025, "month": 1},
+    {"year": 2025, "month": 1, "day": 1},
+    {"year": 2025},
+    {"year": 2024, "month": 10, "loja": "_Alpha_"},
+]
+
+PATTERNS = sorted(set(RollupManager.ROUTES) | set(AnalyticsEngine.ROUTES))
+
+
+@pytest.fixture(scope="module")
+def executors(tmp_path_factory):
+    # Read-only workload: one database copy (and one analytics load) for the whole module
+    path = tmp_path_factory.mktemp("parity") / "dados.db"
+    shutil.copy(os.path.join(ROOT, "dados (2).db"), path)
+    connector = DatabaseConnector(str(path))
+    rollup_manager = RollupManager(connector)
+    rollup_manager.refresh()
+    assert rollup_manager.is_current()
+    yield {
+        "sql": QueryExecutor(connector),
+        "rollups": QueryExecutor(connector, rollup_manager=rollup_manager),
+        "analytics": QueryExecutor(connector, analytics_engine=AnalyticsEngine(connector)),
+    }
+    connector.disconnect()
+
+
+def normalized(df):
+    return df.sort_values(list(df.columns)).reset_index(drop=True)
+
+
+@pytest.mark.parametrize("pattern", PATTERNS)
+@pytest.mark.parametrize("params", PARAMS, ids=lambda params: "-".join(str(value) for value in params.values()))
+def test_pattern_parity(executors, pattern, params):
+    expected = normalized(executors["sql"].execute_pattern(pattern, **params))
+    for name in ("rollups", "analytics"):
+        executor = executors[name]
+        routed = executor.uses_analytics(pattern) or (executor.rollup_manager and executor.rollup_manager.has_route(pattern))
+        if not routed:
+            continue
+        result = normalized(executor.execute_pattern(pattern, **params))
+        pd.testing.assert_frame_equal(result, expected, check_dtype=False, check_exact=False, rtol=1e-6, obj=name)
@@ -0,0 +1,32 @@
+import pandas as pd
+
+from query_executor import QueryExecutor
+from result_cache import ResultCache
+from result_summarizer import ResultSummarizer
+
+
+def test_copy_from_is_independent():
+    cached = ResultSummarizer(head_rows=2)
+    cached.update(pd.DataFrame({"loja_nome": ["a", "b", "c"], "total": [1.0, 2.0, 3.0]}))
+
+    summary = ResultSummarizer(max_chars=100).copy_from(cached)
+    summary.update(pd.DataFrame({"loja_nome": ["d"], "total": [10.0]}))
+
+    assert (summary.head_rows, summary.max_chars, summary.row_count) == (2, 100, 4)
+    assert summary.numeric["total"]["max"] == 10.0
+    assert cached.row_count == 3 and cached.numeric["total"]["max"] == 3.0
+    assert len(cached.get_head()) == 2
+
+
+def test_cached_result_hands_over_its_summary(connector):
+    executor = QueryExecutor(connector, result_cache=ResultCache())
+    query = "SELECT loja_nome, total_liquido FROM dados_mensais"
+
+    first = ResultSummarizer()
+    executor.execute_sql(query, read_only=True, max_rows=10, summarizer=first)
+    second = ResultSummarizer()
+    results = executor.execute_sql(query, read_only=True, max_rows=10, summarizer=second)
+
+    assert results.attrs["summary"] is second
+    assert second.row_count == first.row_count == 455
+    assert second.to_text() == first.to_text()
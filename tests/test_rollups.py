@@ -0,0 +1,48 @@
+import os
+
+from query_executor import QueryExecutor
+from rollups import RollupManager
+
+
+def test_pattern_query_does_not_write(connector, db_path):
+    executor = QueryExecutor(connector, RollupManager(connector))
+    schema_version = connector.get_schema_version()
+    mtime = os.path.getmtime(db_path)
+
+    query = executor.build_pattern_query("vendas_por_mes", year=2024, month=10)
+
+    # Rollups never built: the source table answers, and nothing was created
+    assert "dados_mensais" in query
+    assert "rollup_diario" not in connector.get_tables()
+    assert connector.get_schema_version() == schema_version
+    assert os.path.getmtime(db_path) == mtime
+
+
+def test_ingest_hook_keeps_rollups_current(connector):
+    rollup_manager = RollupManager(connector)
+    rollup_manager.refresh()
+    connector.add_ingest_hook(rollup_manager.on_ingest)
+    executor = QueryExecutor(connector, rollup_manager)
+    assert "rollup_mensal" in executor.build_pattern_query("vendas_por_mes", year=2024, month=10)
+
+    cursor = connector.get_connection(read_only=True).execute(
+        "SELECT * FROM dados_mensais WHERE loja_nome = '_Alpha_' ORDER BY data DESC LIMIT 1")
+    row = dict(zip([description[0] for description in cursor.description], cursor.fetchone()))
+    row["total_liquido"] += 100
+    connector.ingest("dados_mensais", [row])
+
+    params = {"year": int(row["data"][:4]), "month": int(row["data"][5:7]), "loja": "_Alpha_"}
+    query = executor.build_pattern_query("vendas_por_mes", **params)
+    assert "rollup_mensal" in query
+    expected = QueryExecutor(connector).execute_pattern("vendas_por_mes", **params)["total"].iloc[0]
+    assert abs(executor.execute_sql(query)["total"].iloc[0] - expected) < 0.01
+
+
+def test_rows_added_elsewhere_fall_back_to_source_tables(connector):
+    rollup_manager = RollupManager(connector)
+    rollup_manager.refresh()
+    executor = QueryExecutor(connector, rollup_manager)
+
+    # No hook registered: the rollups fall behind, so the source table answers
+    connector.ingest("dados_mensais", [{"loja_nome": "_Alpha_", "data": "2025-02-01T00:00:00", "hora": None, "total_liquido": 1.0}])
+    assert "dados_mensais" in executor.build_pattern_query("vendas_por_mes", year=2025, month=2)
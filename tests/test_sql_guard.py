@@ -0,0 +1,104 @@
+import pytest
+
+from sql_guard import SQLGuard
+
+CORRELATED_MAX = (
+    "SELECT d1.loja_nome, d1.data, d1.total_liquido FROM dados_mensais d1 "
+    "WHERE d1.total_liquido = (SELECT MAX(d2.total_liquido) FROM dados_mensais d2 WHERE d2.loja_nome = d1.loja_nome) "
+    "ORDER BY d1.loja_nome, d1.data"
+)
+
+
+@pytest.fixture
+def guard(connector):
+    return SQLGuard(connector)
+
+
+@pytest.mark.parametrize("sql", [
+    "DELETE FROM dados_diarios",
+    "SELECT 1; DELETE FROM dados_diarios",
+    "SELECT * FROM dados_diarios; DROP TABLE dados_diarios",
+    "PRAGMA table_info(dados_diarios)",
+    "WITH x AS (SELECT 1) DELETE FROM dados_diarios",
+    "SELECT * FROM pragma_table_info('dados_diarios')",
+])
+def test_rejects_anything_but_a_single_select(guard, connector, sql):
+    with pytest.raises(ValueError):
+        guard.check(sql)
+    assert connector.get_connection(read_only=True).execute("SELECT COUNT(*) FROM dados_diarios").fetchone()[0] > 0
+
+
+@pytest.mark.parametrize("sql, expected", [
+    ("SELECT '--' AS a -- comentário", "SELECT '--' AS a"),
+    ("SELECT '/* x */' AS a /* comentário */;", "SELECT '/* x */' AS a"),
+    ("SELECT 'it''s -- not' AS a", "SELECT 'it''s -- not' AS a"),
+    ('SELECT 1 AS "a--b"', 'SELECT 1 AS "a--b"'),
+])
+def test_comments_inside_literals_are_kept(sql, expected):
+    assert SQLGuard._strip(sql) == expected
+
+
+@pytest.mark.parametrize("sql, expected", [
+    ("SELECT * FROM dados_diarios LIMIT 5", True),
+    ("SELECT * FROM dados_diarios limit (5)", True),
+    ("SELECT * FROM dados_diarios LIMIT ?", True),
+    ("SELECT * FROM dados_diarios LIMIT 5 OFFSET 10", True),
+    ("SELECT * FROM (SELECT * FROM dados_diarios LIMIT 5)", False),
+    ("SELECT * FROM dados_diarios WHERE loja_nome = 'LIMIT 5'", False),
+    ("SELECT * FROM dados_diarios", False),
+])
+def test_outer_limit_detection(sql, expected):
+    assert SQLGuard._has_limit(sql) is expected
+
+
+def test_auto_limit_added_once(guard):
+    assert guard.check("SELECT * FROM dados_diarios")["sql"].endswith("LIMIT 10000")
+    assert guard.check("SELECT * FROM dados_diarios LIMIT 5")["sql"] == "SELECT * FROM dados_diarios LIMIT 5"
+
+
+def test_correlated_max_rewritten_to_window(guard, connector):
+    result = guard.check(CORRELATED_MAX)
+    assert "OVER (PARTITION BY d1.loja_nome)" in result["sql"]
+    assert any("função de janela" in rewrite for rewrite in result["rewrites"])
+
+    conn = connector.get_connection(read_only=True)
+    rows = conn.execute(CORRELATED_MAX).fetchall()
+    assert rows and conn.execute(result["sql"]).fetchall() == rows
+
+
+def test_correlated_min_with_filter_rewritten(guard, connector):
+    sql = (
+        "SELECT d1.loja_nome, d1.data, d1.hora FROM dados_diarios d1 "
+        "WHERE d1.data >= '2025-01-25' AND d1.total_liquido = (SELECT MIN(d2.total_liquido) FROM dados_diarios d2 "
+        "WHERE d2.loja_nome = d1.loja_nome AND d2.data >= '2025-01-25') ORDER BY d1.loja_nome, d1.data, d1.hora"
+    )
+    result = guard.check(sql)
+    assert result["rewrites"][0].startswith("subconsulta correlacionada")
+
+    conn = connector.get_connection(read_only=True)
+    rows = conn.execute(sql).fetchall()
+    assert rows and conn.execute(result["sql"]).fetchall() == rows
+
+
+def test_correlated_max_with_different_filter_not_rewritten(guard):
+    sql = (
+        "SELECT d1.loja_nome FROM dados_diarios d1 WHERE d1.total_liquido = (SELECT MAX(d2.total_liquido) "
+        "FROM dados_diarios d2 WHERE d2.loja_nome = d1.loja_nome AND d2.data >= '2025-01-25')"
+    )
+    assert guard.rewrite(sql) == (sql, [])
+
+
+def test_nested_loop_rejected(guard):
+    sql = (
+        "SELECT d1.data FROM dados_diarios d1 WHERE d1.total_liquido > "
+        "(SELECT AVG(d2.total_liquido) FROM dados_diarios d2 WHERE d2.loja_nome = d1.loja_nome)"
+    )
+    with pytest.raises(ValueError, match="muito custosa"):
+        guard.check(sql)
+
+
+def test_plain_scan_only_warns(connector):
+    guard = SQLGuard(connector, max_cost=1000)
+    result = guard.check("SELECT loja_nome, SUM(total_liquido) FROM dados_diarios GROUP BY loja_nome")
+    assert result["estimated_cost"] > 1000
+    assert any("acima de 1000" in warning for warning in result["warnings"])